@@ -5,6 +5,7 @@ from soma.controller import Controller, ControllerTrait
 from capsul.pipeline.pipeline import Pipeline
 from capsul.pipeline.pipeline import Graph, ProcessNode, Switch
 from capsul.attributes.attributes_factory import AttributesFactory
+from capsul.study_config.run_monitor import RunCancelled
 from capsul.attributes.attributes_schema import ProcessAttributes, \
     EditableAttributes
 import traits.api as traits
@@ -12,6 +13,7 @@ from soma.utils.weak_proxy import weak_proxy, get_ref
 from soma.functiontools import SomaPartial
 import six
 import sys
+import time
 
 if sys.version_info[0] >= 3:
     unicode = str
@@ -211,23 +213,130 @@ class ProcessCompletionEngine(traits.HasTraits):
                     break
 
 
-    def complete_parameters(self, process_inputs={}):
+    def complete_parameters(self, process_inputs={}, single_pass=False,
+                            monitor=None):
         ''' Completes file parameters from given inputs parameters, which may
         include both "regular" process parameters (file names) and attributes.
 
+        By default, pipeline nodes are completed first, then the pipeline
+        parameters are completed and overwrite the nodes parameters they are
+        linked to. In single pass mode, the values of all parameters in the
+        pipeline hierarchy are computed top-down before being assigned:
+        parameters of a pipeline lock the node parameters they are linked
+        to, which are not computed, and every parameter is assigned once,
+        with a single propagation through links. The result is the same
+        provided that paths only depend on attributes, not on the values of
+        other parameters.
+
         Parameters
         ----------
         process_inputs: dict (optional)
             parameters to be set on the process. It may include "regular"
             process parameters, and attributes used for completion. Attributes
             should be in a sub-dictionary under the key "capsul_attributes".
+        single_pass: bool (optional)
+            use the single pass mode.
+        monitor: RunMonitor (optional)
+            receives the 'completion' events of the pipeline nodes, and
+            stops the completion before the next node when cancelled (see
+            capsul.study_config.run_monitor).
         '''
-        self.completion_progress = 0.
-        self.completion_progress_total = 1.
         self.set_parameters(process_inputs)
+        self._run_completion_plan(self._completion_plan(), single_pass,
+                                  monitor)
+
+
+    def complete_parameters_batch(self, attributes_table, process_inputs={},
+                                  inputs_table=None, single_pass=False,
+                                  monitor=None, progress=None):
+        ''' Completes file parameters for several sets of attributes (one
+        per subject for instance).
+
+        The pipeline structure is walked once: the nodes completion order and
+        engines are computed for the first row and used for all of them.
+
+        Parameters
+        ----------
+        attributes_table: list of dict, or dict of lists
+            attributes values, one row (dict) per completion, or one column
+            (list) per attribute.
+        process_inputs: dict (optional)
+            parameters and attributes common to all rows, as in
+            complete_parameters().
+        inputs_table: list of dict, or dict of lists (optional)
+            regular process parameters specific to each row.
+        single_pass: bool (optional)
+            use the single pass mode of complete_parameters().
+        monitor: RunMonitor (optional)
+            the monitor of complete_parameters(), which is checked for
+            cancellation before each row.
+        progress: callable (optional)
+            called with the number of completed rows after each row.
 
-        # if process is a pipeline, trigger completions for its nodes and
-        # sub-pipelines.
+        Returns
+        -------
+        columns: dict
+            the list of completed values of each process parameter, one value
+            per row (the form of ProcessIteration iterative parameters).
+        '''
+        rows = table_rows(attributes_table)
+        if inputs_table is None:
+            inputs_rows = [{}] * len(rows)
+        else:
+            inputs_rows = table_rows(inputs_table)
+            if len(inputs_rows) != len(rows):
+                raise ValueError(
+                    'attributes and inputs tables sizes differ: %d != %d'
+                    % (len(rows), len(inputs_rows)))
+        common_attributes = process_inputs.get('capsul_attributes', {})
+        columns = dict((parameter, [])
+                       for parameter in self.process.user_traits())
+        plan = None
+        for index, (row, inputs) in enumerate(zip(rows, inputs_rows)):
+            row_inputs = dict(process_inputs)
+            row_inputs.update(inputs)
+            attributes = dict(common_attributes)
+            attributes.update(row)
+            row_inputs['capsul_attributes'] = attributes
+            if monitor is not None:
+                monitor.check()
+            if self._has_specific_completion():
+                self.complete_parameters(row_inputs)
+            else:
+                self.set_parameters(row_inputs)
+                if plan is None:
+                    plan = self._completion_plan()
+                self._run_completion_plan(plan, single_pass, monitor)
+            for parameter, values in six.iteritems(columns):
+                values.append(getattr(self.process, parameter))
+            if progress is not None:
+                progress(index + 1)
+        return columns
+
+
+    def _has_specific_completion(self):
+        ''' True if the engine class has its own complete_parameters()
+        method, which completion plans cannot reproduce.
+        '''
+        return (six.get_unbound_function(self.__class__.complete_parameters)
+                is not six.get_unbound_function(
+                    ProcessCompletionEngine.complete_parameters))
+
+
+    def _completion_plan(self):
+        ''' Get the completion order of the process nodes and their
+        completion engines.
+
+        Returns
+        -------
+        plan: list
+            (subprocess, completion engine, subplan) for each pipeline node,
+            in topological order. subplan is the plan of the node engine, or
+            None if the node engine completes its process itself. The plan of
+            a non-pipeline process is empty.
+        '''
+        # if process is a pipeline, completions are triggered for its nodes
+        # and sub-pipelines.
         #
         # Note: for now we do so first, so that parameters can be overwritten
         # afterwards by the higher-level pipeline FOM.
@@ -237,79 +346,234 @@ class ProcessCompletionEngine(traits.HasTraits):
         # as this blocking mechanism does not exist yet, we do it this way for
         # now, but it is sub-optimal since many parameters will be set many
         # times.
-        use_topological_order = True
-        if isinstance(self.process, Pipeline):
-            attrib_values = self.get_attribute_values().export_to_dict()
-            name = self.process.name
+        plan = []
+        if not isinstance(self.process, Pipeline):
+            return plan
+        name = self.process.name
+        # proceed in topological order
+        graph = self.process.workflow_graph()
+        for node_name, node_meta in graph.topological_sort():
+            pname = '.'.join([name, node_name])
+            if isinstance(node_meta, Graph):
+                nodes = [node_meta.pipeline]
+            else:
+                nodes = node_meta
+            for pipeline_node in nodes:
+                if isinstance(pipeline_node, ProcessNode):
+                    subprocess = pipeline_node.process
+                else:
+                    subprocess = pipeline_node
+                subprocess_compl = \
+                    ProcessCompletionEngine.get_completion_engine(
+                        subprocess, pname)
+                subplan = None
+                if not subprocess_compl._has_specific_completion():
+                    try:
+                        subplan = subprocess_compl._completion_plan()
+                    except:
+                        pass
+                plan.append((subprocess, subprocess_compl, subplan))
+        return plan
 
-            if use_topological_order:
-                # proceed in topological order
-                graph = self.process.workflow_graph()
-                self.completion_progress_total = len(graph._nodes) + 0.05
-                index = 0
-                for node_name, node_meta in graph.topological_sort():
-                    pname = '.'.join([name, node_name])
-                    if isinstance(node_meta, Graph):
-                        nodes = [node_meta.pipeline]
-                    else:
-                        nodes = node_meta
-                    for pipeline_node in nodes:
-                        if isinstance(pipeline_node, ProcessNode):
-                            subprocess = pipeline_node.process
-                        else:
-                            subprocess = pipeline_node
-                        subprocess_compl = \
-                            ProcessCompletionEngine.get_completion_engine(
-                                subprocess, pname)
-                        self._install_subprogress_moniotoring(subprocess_compl)
-                        try:
-                            subprocess_compl.complete_parameters(
-                                {'capsul_attributes': attrib_values})
-                        except:
-                            try:
-                                self.__class__(subprocess).complete_parameters(
-                                    {'capsul_attributes': attrib_values})
-                            except:
-                                pass
-                        self._remove_subprogress_moniotoring(subprocess_compl)
-                index += 1
-                self.completion_progress = index
+
+    def _run_completion_plan(self, plan, single_pass=False, monitor=None):
+        ''' Complete the nodes in the plan order, then the process
+        parameters. Attributes and inputs are already set.
+        '''
+        self.completion_progress = 0.
+        self.completion_progress_total = len(plan) + 0.05
+        if single_pass:
+            values = []
+            self._collect_completion_values(plan, set(), values, monitor)
+            if isinstance(self.process, Pipeline):
+                # propagate the new values through links only once
+                with self.process.bulk_set():
+                    self._set_completion_values(values)
             else:
-                self.completion_progress_total = len(self.process.nodes) + 0.05
-                index = 0
-                for node_name, node in six.iteritems(self.process.nodes):
-                    if node_name == '':
-                        continue
-                    if hasattr(node, 'process'):
-                        subprocess = node.process
-                        pname = '.'.join([name, node_name])
-                        subprocess_compl = \
-                            ProcessCompletionEngine.get_completion_engine(
-                                subprocess, pname)
-                        self._install_subprogress_moniotoring(subprocess_compl)
-                        try:
-                            subprocess_compl.complete_parameters(
-                                {'capsul_attributes': attrib_values})
-                        except:
-                            try:
-                                self.__class__(subprocess).complete_parameters(
-                                    {'capsul_attributes': attrib_values})
-                            except:
-                                pass
-                        self._remove_subprogress_moniotoring(subprocess_compl)
-                index += 1
-                self.completion_progress = index
+                self._set_completion_values(values)
+            self.completion_progress = self.completion_progress_total
+            return
+
+        if plan:
+            attrib_values = self.get_attribute_values().export_to_dict()
+            for index, (subprocess, subprocess_compl, subplan) \
+                    in enumerate(plan):
+                self._install_subprogress_moniotoring(subprocess_compl)
+                inputs = {'capsul_attributes': attrib_values}
+                start_time = self._start_monitored_node(monitor, subprocess)
+                try:
+                    if subplan is None:
+                        subprocess_compl.complete_parameters(inputs)
+                    else:
+                        subprocess_compl.set_parameters(inputs)
+                        subprocess_compl._run_completion_plan(
+                            subplan, monitor=monitor)
+                except RunCancelled:
+                    raise
+                except:
+                    try:
+                        self.__class__(subprocess).complete_parameters(
+                            inputs)
+                    except:
+                        pass
+                self._remove_subprogress_moniotoring(subprocess_compl)
+                self._finish_monitored_node(monitor, subprocess, start_time)
+                self.completion_progress = index + 1
 
         # now complete process parameters:
         attributes = self.get_attribute_values()
+        if isinstance(self.process, Pipeline):
+            # propagate the new values through links only once
+            with self.process.bulk_set():
+                self._complete_process_parameters(attributes)
+        else:
+            self._complete_process_parameters(attributes)
+        self.completion_progress = self.completion_progress_total
+
+
+    def _collect_completion_values(self, plan, locked, values,
+                                   monitor=None):
+        ''' Compute the parameters values of the single pass completion,
+        top-down, without assigning them.
+
+        Parameters
+        ----------
+        plan: list
+            the completion plan of the process.
+        locked: set
+            names of the process parameters fixed by a parent pipeline.
+        values: list
+            (process, parameter, value) are appended in the order of the
+            default completion assignments: nodes first, then their pipeline.
+        monitor: RunMonitor (optional)
+            the monitor of complete_parameters().
+        '''
+        attributes = self.get_attribute_values()
+        own_values = self._process_parameters_values(attributes, locked)
+        if plan:
+            fixed = set(locked)
+            fixed.update(name for name, value in own_values)
+            nodes_locked = self._linked_node_parameters(fixed)
+            attrib_values = attributes.export_to_dict()
+            for index, (subprocess, subprocess_compl, subplan) \
+                    in enumerate(plan):
+                inputs = {'capsul_attributes': attrib_values}
+                start_time = self._start_monitored_node(monitor, subprocess)
+                try:
+                    if subplan is None:
+                        # specific engines complete their process themselves
+                        subprocess_compl.complete_parameters(inputs)
+                    else:
+                        subprocess_compl.set_parameters(inputs)
+                        subprocess_compl._collect_completion_values(
+                            subplan, nodes_locked.get(id(subprocess), set()),
+                            values, monitor)
+                except RunCancelled:
+                    raise
+                except:
+                    try:
+                        self.__class__(subprocess).complete_parameters(
+                            inputs)
+                    except:
+                        pass
+                self._finish_monitored_node(monitor, subprocess, start_time)
+                self.completion_progress = index + 1
+        values.extend((self.process, name, value)
+                      for name, value in own_values)
+
+
+    @staticmethod
+    def _start_monitored_node(monitor, process):
+        ''' Check the cancellation of the completion and send the 'started'
+        event of a node.
+
+        Returns
+        -------
+        start_time: float
+            the node completion start time.
+        '''
+        if monitor is not None:
+            monitor.check()
+            monitor.emit('started', 'completion', process.id)
+        return time.time()
+
+
+    @staticmethod
+    def _finish_monitored_node(monitor, process, start_time):
+        ''' Send the 'finished' event of a node. Completion failures are
+        ignored, thus not reported.
+        '''
+        if monitor is not None:
+            monitor.emit('finished', 'completion', process.id,
+                         duration=time.time() - start_time)
+
+
+    def _linked_node_parameters(self, parameters):
+        ''' Get the node parameters directly linked to pipeline parameters.
+
+        Returns
+        -------
+        nodes_parameters: dict
+            {id(node process): set of parameter names}. For switches, the key
+            is the id of the switch node.
+        '''
+        nodes_parameters = {}
+        plugs = self.process.pipeline_node.plugs
+        for name in parameters:
+            plug = plugs.get(name)
+            if plug is None:
+                continue
+            if plug.output:
+                links = plug.links_from
+            else:
+                links = plug.links_to
+            for link in links:
+                node = link[2]
+                nodes_parameters.setdefault(
+                    id(getattr(node, 'process', node)), set()).add(link[1])
+        return nodes_parameters
+
+
+    def _set_completion_values(self, values):
+        ''' Assign the values computed by _collect_completion_values().
+        '''
+        for process, name, value in values:
+            try:
+                setattr(process, name, value)
+            except:
+                pass
+
+
+    def _process_parameters_values(self, attributes, locked=()):
+        ''' Get the values of the process parameters built from attributes.
+
+        Returns
+        -------
+        values: list
+            (parameter, value) for the parameters not in locked which have a
+            completion value.
+        '''
+        values = []
         for pname in self.process.user_traits():
+            if pname in locked:
+                continue
             try:
                 value = self.attributes_to_path(pname, attributes)
-                if value is not None:  # should None be valid ?
-                    setattr(self.process, pname, value)
+            except:
+                continue
+            if value is not None:  # should None be valid ?
+                values.append((pname, value))
+        return values
+
+
+    def _complete_process_parameters(self, attributes):
+        ''' Set the process parameters built from attributes.
+        '''
+        for pname, value in self._process_parameters_values(attributes):
+            try:
+                setattr(self.process, pname, value)
             except:
                 pass
-        self.completion_progress = self.completion_progress_total
 
 
     def attributes_to_path(self, parameter, attributes):
@@ -636,6 +900,21 @@ class SwitchCompletionEngine(ProcessCompletionEngine):
 
 
 
+def table_rows(table):
+    ''' Get the rows of a table given as a list of rows (dicts) or as a dict
+    of columns (lists of the same length).
+    '''
+    if not isinstance(table, dict):
+        return list(table)
+    sizes = set(len(column) for column in six.itervalues(table))
+    if len(sizes) > 1:
+        raise ValueError('table columns have different sizes: %s'
+                         % sorted(sizes))
+    size = sizes.pop() if sizes else 0
+    return [dict((key, column[index]) for key, column in six.iteritems(table))
+            for index in range(size)]
+
+
 class PathCompletionEngine(object):
     ''' Implements building of a single path from a set of attributes for a
     specific process / parameter
@@ -120,7 +120,13 @@ class ProcessCompletionEngineIteration(ProcessCompletionEngine):
         return self.capsul_attributes
 
 
-    def complete_parameters(self, process_inputs={}):
+    def complete_parameters(self, process_inputs={}, single_pass=False,
+                            monitor=None):
+        ''' Completes the parameters of all iteration steps, see
+        ProcessCompletionEngine.complete_parameters(). single_pass applies
+        to the completion of each step, and the monitor is checked for
+        cancellation before each step.
+        '''
         self.completion_progress = 0.
         try:
             self.set_parameters(process_inputs)
@@ -147,29 +153,40 @@ class ProcessCompletionEngineIteration(ProcessCompletionEngine):
         # complete each step to get iterated parameters.
         # This is generally "too much" but it's difficult to perform a partial
         # completion only on iterated parameters
-
-        iterative_parameters = dict(
-            [(key, []) for key in self.process.iterative_parameters])
-
-        self.completion_progress_total = size
+        attributes_rows = []
+        inputs_rows = []
         for it_step in xrange(size):
-            self.capsul_iteration_step = it_step
+            row = {}
             for attribute in iterated_attributes:
                 iterated_values = getattr(attributes_set, attribute)
                 step = min(len(iterated_values) - 1, it_step)
-                value = iterated_values[step]
-                setattr(step_attributes, attribute, value)
+                row[attribute] = iterated_values[step]
+            attributes_rows.append(row)
+            inputs = {}
             for parameter in self.process.iterative_parameters:
                 values = getattr(self.process, parameter)
                 if isinstance(values, list) and len(values) > it_step:
-                    parameters[parameter] = values[it_step]
-            completion_engine.complete_parameters(parameters)
-            for parameter in self.process.iterative_parameters:
-                value = getattr(self.process.process, parameter)
-                iterative_parameters[parameter].append(value)
-            self.completion_progress = it_step + 1
-        for parameter, values in six.iteritems(iterative_parameters):
-            setattr(self.process, parameter, values)
+                    inputs[parameter] = values[it_step]
+            inputs_rows.append(inputs)
+
+        self.completion_progress_total = size
+        start_time = self._start_monitored_node(monitor, self.process)
+        iterative_parameters = completion_engine.complete_parameters_batch(
+            attributes_rows, parameters, inputs_rows,
+            single_pass=single_pass, monitor=monitor,
+            progress=self._set_completion_progress)
+        self._finish_monitored_node(monitor, self.process, start_time)
+        self.capsul_iteration_step = max(size - 1, 0)
+        for parameter in self.process.iterative_parameters:
+            setattr(self.process, parameter, iterative_parameters[parameter])
+        self.completion_progress = size
+
+
+    def _set_completion_progress(self, steps):
+        ''' Update the completion progress with the number of completed
+        iteration steps.
+        '''
+        self.completion_progress = steps
 
 
     def complete_iteration_step(self, step):
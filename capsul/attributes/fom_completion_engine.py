@@ -4,6 +4,7 @@ from __future__ import print_function
 
 import os
 import six
+import weakref
 try:
     from traits.api import Str, HasTraits
 except ImportError:
@@ -125,9 +126,10 @@ class FomProcessCompletionEngine(ProcessCompletionEngine):
                     ea.add_trait(attribute, Str(default_value))
                 return ea
 
+            fom_cache = get_fom_path_cache(process.study_config)
             for parameter in fom_patterns:
-                param_attributes = atp.find_discriminant_attributes(
-                        fom_parameter=parameter, fom_process=name)
+                param_attributes = fom_cache.discriminant_attributes(
+                    atp, name, parameter)
                 if param_attributes:
                     #process_attributes[parameter] = param_attributes
                     ea = editable_attributes(param_attributes, fom)
@@ -285,21 +287,103 @@ class FomPathCompletionEngine(PathCompletionEngine):
         # Select only the attributes that are discriminant for this
         # parameter otherwise other attibutes can prevent the appropriate
         # rule to match
-        parameter_attributes = atp.find_discriminant_attributes(
-            fom_parameter=parameter, fom_process=name)
+        fom_cache = get_fom_path_cache(process.study_config)
+        parameter_attributes = fom_cache.discriminant_attributes(
+            atp, name, parameter)
         d = dict((i, getattr(attributes, i)) \
             for i in parameter_attributes if i in allowed_attributes)
         d['fom_process'] = name
         d['fom_parameter'] = parameter
         d['fom_format'] = 'fom_prefered'
-        path_value = None
-        for h in atp.find_paths(d):
-            path_value = h[0]
+        return fom_cache.find_path(atp, d)
+
+
+class FomPathCache(object):
+    """ Memoized FOM queries of a StudyConfig.
+
+    Completing a pipeline hierarchy for many subjects queries the FOMs for
+    the same processes, parameters and attributes values many times. The
+    discriminant attributes of (process, parameter) pairs, and the paths of
+    attributes sets, are kept for each AttributesToPaths instance
+    (StudyConfig.modules_data.fom_atp). These instances are rebuilt when
+    FOMs, directories or formats change in the StudyConfig, which drops
+    their entries. Other attributes values are other entries.
+
+    Methods
+    -------
+    discriminant_attributes
+    find_path
+    clear
+    """
+
+    # Maximum number of paths kept for an AttributesToPaths instance
+    max_paths = 100000
+
+    def __init__(self):
+        self._discriminant = weakref.WeakKeyDictionary()
+        self._paths = weakref.WeakKeyDictionary()
+
+    def discriminant_attributes(self, atp, fom_process, fom_parameter):
+        """ Get the attributes which are discriminant for a process
+        parameter (see AttributesToPaths.find_discriminant_attributes()).
+
+        The returned list is shared and must not be modified.
+        """
+        cache = self._discriminant.setdefault(atp, {})
+        key = (fom_process, fom_parameter)
+        attributes = cache.get(key)
+        if attributes is None:
+            attributes = atp.find_discriminant_attributes(
+                fom_parameter=fom_parameter, fom_process=fom_process)
+            cache[key] = attributes
+        return attributes
+
+    def find_path(self, atp, attributes):
+        """ Get the first path matching attributes (see
+        AttributesToPaths.find_paths()), None if there is no such path.
+        """
+        key = tuple(sorted(
+            (name, tuple(value) if isinstance(value, list) else value)
+            for name, value in six.iteritems(attributes)))
+        try:
+            hash(key)
+        except TypeError:
+            return self._find_path(atp, attributes)
+        cache = self._paths.setdefault(atp, {})
+        if key in cache:
+            return cache[key]
+        if len(cache) >= self.max_paths:
+            cache.clear()
+        path = self._find_path(atp, attributes)
+        cache[key] = path
+        return path
+
+    @staticmethod
+    def _find_path(atp, attributes):
+        """ Query the first path matching attributes.
+        """
+        for h in atp.find_paths(attributes):
             # find_paths() is a generator which can sometimes generate
             # several values (formats). We are only interested in the
             # first one.
-            break
-        return path_value
+            return h[0]
+        return None
+
+    def clear(self):
+        """ Drop all the memoized queries.
+        """
+        self._discriminant.clear()
+        self._paths.clear()
+
+
+def get_fom_path_cache(study_config):
+    """ Get the FOM queries cache of a StudyConfig, created on first use.
+    """
+    cache = getattr(study_config.modules_data, 'fom_path_cache', None)
+    if cache is None:
+        cache = FomPathCache()
+        study_config.modules_data.fom_path_cache = cache
+    return cache
 
 
 class FomProcessCompletionEngineIteration(ProcessCompletionEngineIteration):
@@ -328,14 +412,15 @@ class FomProcessCompletionEngineIteration(ProcessCompletionEngineIteration):
                 % repr(names_search_list))
 
         iter_attrib = set()
+        fom_cache = get_fom_path_cache(subprocess.study_config)
         for parameter in self.process.iterative_parameters:
             if subprocess.trait(parameter).output:
                 atp = output_atp
             else:
                 atp = input_atp
             parameter_attributes = set([
-                x for x in atp.find_discriminant_attributes(
-                    fom_parameter=parameter, fom_process=name)
+                x for x in fom_cache.discriminant_attributes(
+                    atp, name, parameter)
                 if not x.startswith('fom_')])
             iter_attrib.update(parameter_attributes)
         return iter_attrib
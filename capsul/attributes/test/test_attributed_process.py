@@ -6,6 +6,7 @@ from capsul.attributes.completion_engine import ProcessCompletionEngine, \
     PathCompletionEngine, PathCompletionEngineFactory
 from capsul.attributes.attributes_schema import ProcessAttributes, \
     AttributesSchema, EditableAttributes
+from capsul.study_config.run_monitor import RunMonitor, RunCancelled
 from traits.api import Str, Float, File, String, Undefined
 from soma_workflow import configuration as swconfig
 import unittest
@@ -161,7 +162,14 @@ class TestCompletion(unittest.TestCase):
         atts = cm.get_attribute_values()
         atts.center = ['muppets']
         atts.subject = ['kermit', 'piggy', 'stalter', 'waldorf']
+        progress = []
+        iteration_cm = ProcessCompletionEngine.get_completion_engine(
+            pipeline.nodes['dummy'].process)
+        iteration_cm.on_trait_change(
+            lambda value: progress.append(value), 'completion_progress')
         cm.complete_parameters()
+        # the progress is updated after each iteration step
+        self.assertEqual([value for value in progress if value], [1, 2, 3, 4])
         self.assertEqual([os.path.normpath(p) for p in pipeline.truc],
                          [os.path.normpath(p) for p in 
                             ['/tmp/in/DummyProcess_truc_muppets_kermit',
@@ -176,6 +184,169 @@ class TestCompletion(unittest.TestCase):
                              '/tmp/out/DummyProcess_bidule_muppets_waldorf']])
 
 
+    def test_iteration_single_pass(self):
+        study_config = self.study_config
+        pipeline = Pipeline()
+        pipeline.set_study_config(study_config)
+        pipeline.add_iterative_process(
+            'dummy',
+            'capsul.attributes.test.test_attributed_process.DummyProcess',
+            ['truc', 'bidule'])
+        pipeline.autoexport_nodes_parameters()
+        iteration = pipeline.nodes['dummy'].process
+        cm = ProcessCompletionEngine.get_completion_engine(iteration)
+        atts = cm.get_attribute_values()
+        atts.center = ['muppets']
+        atts.subject = ['kermit', 'piggy']
+        cm.complete_parameters({}, single_pass=True)
+        self.assertEqual([os.path.normpath(p) for p in iteration.bidule],
+                         [os.path.normpath(p) for p in
+                            ['/tmp/out/DummyProcess_bidule_muppets_kermit',
+                             '/tmp/out/DummyProcess_bidule_muppets_piggy']])
+
+
+    def test_batch_completion(self):
+        study_config = self.study_config
+        pipeline = Pipeline()
+        pipeline.set_study_config(study_config)
+        pipeline.add_process(
+            'dummy',
+            'capsul.attributes.test.test_attributed_process.DummyProcess')
+        pipeline.autoexport_nodes_parameters()
+        cm = ProcessCompletionEngine.get_completion_engine(pipeline)
+        subjects = ['kermit', 'piggy', 'waldorf']
+        columns = cm.complete_parameters_batch(
+            {'subject': subjects}, {'capsul_attributes': {'center': 'muppets'}})
+        expected = {'truc': [], 'bidule': []}
+        for subject in subjects:
+            cm.complete_parameters(
+                {'capsul_attributes': {'center': 'muppets',
+                                       'subject': subject}})
+            expected['truc'].append(pipeline.truc)
+            expected['bidule'].append(pipeline.bidule)
+        self.assertEqual(columns['truc'], expected['truc'])
+        self.assertEqual(columns['bidule'], expected['bidule'])
+        self.assertEqual(
+            os.path.normpath(columns['bidule'][1]),
+            os.path.normpath('/tmp/out/Pipeline_bidule_muppets_piggy_array'))
+        self.assertRaises(ValueError, cm.complete_parameters_batch,
+                          {'subject': subjects, 'center': ['muppets']})
+
+
+    def test_single_pass_completion(self):
+        study_config = self.study_config
+        pipelines = []
+        for i in range(2):
+            sub_pipeline = Pipeline()
+            sub_pipeline.set_study_config(study_config)
+            sub_pipeline.add_process(
+                'dummy',
+                'capsul.attributes.test.test_attributed_process.DummyProcess')
+            sub_pipeline.autoexport_nodes_parameters()
+            pipeline = Pipeline()
+            pipeline.set_study_config(study_config)
+            pipeline.add_process('sub', sub_pipeline)
+            pipeline.autoexport_nodes_parameters()
+            pipelines.append(pipeline)
+        def record_changes(changes):
+            return lambda value: changes.append(value)
+        assignments = []
+        for pipeline in pipelines:
+            dummy = pipeline.nodes['sub'].process.nodes['dummy'].process
+            changes = []
+            dummy.on_trait_change(record_changes(changes), 'bidule')
+            assignments.append(changes)
+        inputs = {'capsul_attributes': {'center': 'muppets',
+                                        'subject': 'piggy'}}
+        ProcessCompletionEngine.get_completion_engine(
+            pipelines[0]).complete_parameters(inputs)
+        ProcessCompletionEngine.get_completion_engine(
+            pipelines[1]).complete_parameters(inputs, single_pass=True)
+        for pipeline in pipelines:
+            self.assertEqual(
+                os.path.normpath(pipeline.bidule),
+                os.path.normpath('/tmp/out/Pipeline_bidule_muppets_piggy_array'))
+        sub_pipelines = [pipeline.nodes['sub'].process
+                         for pipeline in pipelines]
+        dummies = [sub_pipeline.nodes['dummy'].process
+                   for sub_pipeline in sub_pipelines]
+        for name in ('truc', 'bidule'):
+            self.assertEqual(getattr(pipelines[0], name),
+                             getattr(pipelines[1], name))
+            self.assertEqual(getattr(sub_pipelines[0], name),
+                             getattr(sub_pipelines[1], name))
+            self.assertEqual(getattr(dummies[0], name),
+                             getattr(dummies[1], name))
+        # the node output is only set once, from the top pipeline value
+        self.assertTrue(len(assignments[0]) > 1)
+        self.assertEqual(len(assignments[1]), 1)
+
+
+    def test_completion_monitor(self):
+        study_config = self.study_config
+        pipeline = Pipeline()
+        pipeline.set_study_config(study_config)
+        pipeline.add_process(
+            'dummy',
+            'capsul.attributes.test.test_attributed_process.DummyProcess')
+        pipeline.autoexport_nodes_parameters()
+        cm = ProcessCompletionEngine.get_completion_engine(pipeline)
+        inputs = {'capsul_attributes': {'center': 'muppets',
+                                        'subject': 'piggy'}}
+        monitor = RunMonitor()
+        events = []
+        monitor.add_callback(events.append)
+        cm.complete_parameters(inputs, monitor=monitor)
+        dummy_id = pipeline.nodes['dummy'].process.id
+        self.assertEqual([(event.kind, event.stage, event.name)
+                          for event in events],
+                         [('started', 'completion', dummy_id),
+                          ('finished', 'completion', dummy_id)])
+        monitor.cancel()
+        self.assertRaises(RunCancelled, cm.complete_parameters, inputs,
+                          monitor=monitor)
+
+
+    def test_iteration_completion_monitor(self):
+        study_config = self.study_config
+        pipeline = Pipeline()
+        pipeline.set_study_config(study_config)
+        pipeline.add_iterative_process(
+            'dummy',
+            'capsul.attributes.test.test_attributed_process.DummyProcess',
+            ['truc', 'bidule'])
+        pipeline.autoexport_nodes_parameters()
+        iteration = pipeline.nodes['dummy'].process
+        cm = ProcessCompletionEngine.get_completion_engine(iteration)
+        atts = cm.get_attribute_values()
+        atts.center = ['muppets']
+        atts.subject = ['kermit', 'piggy', 'waldorf']
+        monitor = RunMonitor()
+        events = []
+        monitor.add_callback(events.append)
+        cm.complete_parameters({}, monitor=monitor)
+        self.assertEqual([(event.kind, event.stage, event.name)
+                          for event in events],
+                         [('started', 'completion', iteration.id),
+                          ('finished', 'completion', iteration.id)])
+        self.assertEqual(len(iteration.bidule), 3)
+
+        # cancelled between two iteration steps
+        checks = []
+        check = monitor.check
+
+        def cancel_second_step():
+            checks.append(None)
+            if len(checks) == 3:
+                monitor.cancel()
+            check()
+
+        monitor.check = cancel_second_step
+        self.assertRaises(RunCancelled, cm.complete_parameters, {},
+                          monitor=monitor)
+        self.assertEqual(len(checks), 3)
+
+
     def test_run_iteraton_sequential(self):
         study_config = self.study_config
         tmp_dir = tempfile.mkdtemp(prefix='capsul_')
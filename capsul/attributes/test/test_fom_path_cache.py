@@ -0,0 +1,105 @@
+from __future__ import print_function
+
+from capsul.api import StudyConfig, Process
+from capsul.attributes.fom_completion_engine import FomPathCompletionEngine, \
+    get_fom_path_cache
+from soma.controller import Controller
+from traits.api import File, Str
+import unittest
+
+
+class FakeFom(object):
+    """ FOM with one process.
+    """
+    patterns = {'SegmentationProcess': {'image': '', 'mask': ''}}
+
+
+class CountingAttributesToPaths(object):
+    """ AttributesToPaths stand-in counting the FOM queries.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.discriminant_queries = 0
+        self.path_queries = 0
+
+    def find_discriminant_attributes(self, **selection):
+        self.discriminant_queries += 1
+        return ['subject', 'fom_process', 'fom_parameter']
+
+    def find_paths(self, attributes):
+        self.path_queries += 1
+        yield ('%s/%s_%s' % (self.directory, attributes['subject'],
+                             attributes['fom_parameter']), attributes)
+
+
+class SegmentationProcess(Process):
+    image = File(output=False)
+    mask = File(output=True)
+
+
+class TestFomPathCache(unittest.TestCase):
+    """ FOM queries are memoized per StudyConfig.
+    """
+    def setUp(self):
+        self.study_config = StudyConfig(modules=[])
+        self.set_foms('/input', '/output')
+        self.process = self.study_config.get_process_instance(
+            SegmentationProcess)
+        self.attributes = Controller()
+        self.attributes.add_trait('subject', Str('s1'))
+        self.attributes.add_trait('center', Str('c1'))
+
+    def set_foms(self, input_dir, output_dir):
+        modules_data = self.study_config.modules_data
+        modules_data.foms = {'input': FakeFom(), 'output': FakeFom()}
+        modules_data.fom_atp = {
+            'input': CountingAttributesToPaths(input_dir),
+            'output': CountingAttributesToPaths(output_dir)}
+
+    def test_memoized_paths(self):
+        """ Same attributes are resolved once, other values are other
+        queries.
+        """
+        engine = FomPathCompletionEngine()
+        atp = self.study_config.modules_data.fom_atp['input']
+        for i in range(3):
+            self.assertEqual(engine.attributes_to_path(
+                self.process, 'image', self.attributes), '/input/s1_image')
+        self.assertEqual(engine.attributes_to_path(
+            self.process, 'mask', self.attributes), '/output/s1_mask')
+        self.assertEqual(atp.discriminant_queries, 1)
+        self.assertEqual(atp.path_queries, 1)
+        self.attributes.subject = 's2'
+        self.assertEqual(engine.attributes_to_path(
+            self.process, 'image', self.attributes), '/input/s2_image')
+        self.assertEqual(atp.discriminant_queries, 1)
+        self.assertEqual(atp.path_queries, 2)
+        # non discriminant attributes are not part of the query
+        self.attributes.center = 'c2'
+        engine.attributes_to_path(self.process, 'image', self.attributes)
+        self.assertEqual(atp.path_queries, 2)
+
+    def test_new_foms(self):
+        """ Reloaded FOMs are queried again.
+        """
+        engine = FomPathCompletionEngine()
+        engine.attributes_to_path(self.process, 'image', self.attributes)
+        self.set_foms('/new_input', '/new_output')
+        self.assertEqual(engine.attributes_to_path(
+            self.process, 'image', self.attributes), '/new_input/s1_image')
+        get_fom_path_cache(self.study_config).clear()
+        engine.attributes_to_path(self.process, 'image', self.attributes)
+        atp = self.study_config.modules_data.fom_atp['input']
+        self.assertEqual(atp.path_queries, 2)
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestFomPathCache)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
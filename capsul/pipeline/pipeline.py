@@ -11,10 +11,13 @@ from __future__ import absolute_import
 
 # System import
 import logging
+from contextlib import contextmanager
 from copy import deepcopy
 import tempfile
 import os
 import shutil
+import itertools
+from collections import deque
 import six
 from soma.utils.weak_proxy import weak_proxy, get_ref
 
@@ -26,10 +29,12 @@ try:
     import traits.api as traits
     from traits.api import (File, Enum, Bool,
                             Event, Directory, Trait, List, Set)
+    from traits.trait_notifiers import handle_exception
 except ImportError:
     import enthought.traits.api as traits
     from enthought.traits.api import (File, Enum, Bool,
                                       Event, Directory, Trait, List, Set)
+    from enthought.traits.trait_notifiers import handle_exception
 
 # Capsul import
 from capsul.process.process import Process, NipypeProcess
@@ -46,6 +51,46 @@ from soma.controller import ControllerTrait
 from soma.sorted_dictionary import SortedDictionary
 from soma.utils.functiontools import SomaPartial
 
+# Stamps of the links and activations states of pipelines, unique across
+# pipelines so that a sub-pipeline cache is never valid in its parent
+_provenance_stamps = itertools.count()
+
+
+def _plug_value_origin(plug, recursive=True):
+    """ Walk the links of a plug up to the process output its value comes
+    from. See capsul.pipeline.pipeline_tools.where_is_plug_value_from().
+    """
+    links = deque(link + (None, ) for link in plug.links_from)
+    while links:
+        node_name, param_name, node, in_plug, weak, parent = links.popleft()
+        if not node.activated or not node.enabled:
+            # disabled nodes are not influencing
+            continue
+        if isinstance(node, Switch):
+            # recover through switch input
+            switch_value = node.switch
+            switch_input = '%s_switch_%s' % (switch_value, param_name)
+            in_plug = node.plugs[switch_input]
+            links.extend(link + (parent, ) for link in in_plug.links_from)
+        elif recursive and isinstance(node, PipelineNode):
+            # either output from a sibling sub_pipeline
+            # or input from parent pipeline
+            # but it is handled the same way.
+            # check their inputs
+            # just if sibling, keep them as parent
+            if in_plug.output and parent is None:
+                new_parent = node
+            else:
+                new_parent = parent
+            links.extend(link + (new_parent, )
+                         for link in in_plug.links_from)
+        else:
+            # output of a process: found it
+            # in non-recursive mode, a pipeline is regarded as a process.
+            return node, param_name, parent
+    # not found
+    return None, None, None
+
 
 class Pipeline(Process):
     """ Pipeline containing Process nodes, and links between node parameters.
@@ -150,11 +195,13 @@ class Pipeline(Process):
     add_link
     remove_link
     export_parameter
+    bulk_set
     workflow_ordered_nodes
     workflow_graph
     update_nodes_and_plugs_activation
     parse_link
     parse_parameter
+    plug_value_origin
     find_empty_parameters
     count_items
     define_pipeline_steps
@@ -203,17 +250,50 @@ class Pipeline(Process):
             self.node_position = node_position.copy()
         else:
             self.node_position = {}
+        # Links between the nodes of this pipeline (not of its sub-pipelines):
+        # {node_name: {plug_name: {(node_name, plug_name): weak_link}}}
+        # indexed from their source (_links_out) and destination (_links_in)
+        self._links_out = {}
+        self._links_in = {}
         self.pipeline_node = PipelineNode(self, '', self)
         self.nodes[''] = self.pipeline_node
         self.do_not_export = set()
         self.parent_pipeline = None
         self._disable_update_nodes_and_plugs_activation = 1
         self._must_update_nodes_and_plugs_activation = False
-        self.pipeline_definition()
+        # Changes not yet taken into account by activations, None meaning that
+        # the whole pipeline has to be updated
+        self._activation_changes = None
+        # Results of links walks (plug_value_origin(),
+        # find_empty_parameters()), valid as long as the stamp of the top
+        # level pipeline is unchanged
+        self._provenance_stamp = next(_provenance_stamps)
+        self._provenance = (None, {})
+        # Links values propagation delayed by bulk_set(): None outside of a
+        # bulk_set() block, else {plug: (stamp, node, plug_name, value)}
+        self._bulk_set_changes = None
+        self._bulk_set_depth = 0
+        self._bulk_set_stamp = 0
+        # A pipeline instantiated from a PipelineTemplate copies the recorded
+        # structure instead of running pipeline_definition()
+        template = getattr(self, '_pipeline_template', None)
+        if template is not None:
+            del self._pipeline_template
+            template, study_config = template
+            template._build(self, study_config)
+        else:
+            self.pipeline_definition()
 
         self.workflow_repr = ""
         self.workflow_list = []
 
+        if template is not None:
+            # Exports and activations are part of the template
+            self._disable_update_nodes_and_plugs_activation -= 1
+            self._must_update_nodes_and_plugs_activation = False
+            self._activation_changes = set()
+            return
+
         if autoexport_nodes_parameters is None:
             autoexport_nodes_parameters = self.do_autoexport_nodes_parameters
         if autoexport_nodes_parameters:
@@ -282,8 +362,8 @@ class Pipeline(Process):
             optional = bool(trait.optional)
             plug = Plug(output=output, optional=optional)
             self.pipeline_node.plugs[name] = plug
-            plug.on_trait_change(self.update_nodes_and_plugs_activation,
-                                 'enabled')
+            plug.on_trait_change(
+                self.pipeline_node._update_pipeline_activation, 'enabled')
 
     def remove_trait(self, name):
         """ Remove a trait to the pipeline
@@ -435,10 +515,13 @@ class Pipeline(Process):
         # Add new node in pipeline process list
         self.list_process_in_pipeline.append(process)
 
+        # The new node activation will be computed by the next update
+        self._record_activation_changes([(node, None)])
+
     def add_iterative_process(self, name, process, iterative_plugs=None,
                               do_not_export=None, make_optional=None,
                               inputs_to_copy=None, inputs_to_clean=None,
-                              **kwargs):
+                              iteration_workers=1, **kwargs):
         """ Add a new iterative node in the pipeline.
 
         Parameters
@@ -457,6 +540,9 @@ class Pipeline(Process):
             a list of item to copy.
         inputs_to_clean: list of str (optional)
             a list of temporary items.
+        iteration_workers: int (optional, default 1)
+            the number of iterations run concurrently (see
+            ProcessIteration.workers).
         """
         # If no iterative plug are given as parameter, add a process
         if iterative_plugs is None:
@@ -471,7 +557,8 @@ class Pipeline(Process):
                 name,
                 ProcessIteration(process, iterative_plugs,
                                  study_config=self.study_config,
-                                 context_name=context_name),
+                                 context_name=context_name,
+                                 workers=iteration_workers),
                 do_not_export, make_optional, **kwargs)
             return
 
@@ -666,10 +753,8 @@ class Pipeline(Process):
             dest_node.set_plug_value(dest_plug_name, value)
 
         # Update plugs memory of the pipeline
-        source_plug.links_to.add((dest_node_name, dest_plug_name, dest_node,
-                                  dest_plug, weak_link))
-        dest_plug.links_from.add((source_node_name, source_plug_name,
-                                  source_node, source_plug, weak_link))
+        self._add_plug_link(source_node_name, source_plug_name,
+                            dest_node_name, dest_plug_name, weak_link)
 
         # Set a connected_output property
         if (isinstance(dest_node, ProcessNode) and
@@ -692,7 +777,56 @@ class Pipeline(Process):
         dest_node.connect(dest_plug_name, source_node, source_plug_name)
 
         # Refresh pipeline activation
-        self.update_nodes_and_plugs_activation()
+        self.update_nodes_and_plugs_activation(
+            [(source_node, source_plug_name), (dest_node, dest_plug_name)])
+
+    def _add_plug_link(self, source_node_name, source_plug_name,
+                       dest_node_name, dest_plug_name, weak_link):
+        """ Record a link in the plugs and in the pipeline links index.
+        """
+        source_node = self.nodes[source_node_name]
+        dest_node = self.nodes[dest_node_name]
+        source_plug = source_node.plugs[source_plug_name]
+        dest_plug = dest_node.plugs[dest_plug_name]
+        self._invalidate_provenance()
+        source_plug.links_to.add((dest_node_name, dest_plug_name, dest_node,
+                                  dest_plug, weak_link))
+        dest_plug.links_from.add((source_node_name, source_plug_name,
+                                  source_node, source_plug, weak_link))
+        self._links_out.setdefault(source_node_name, {}).setdefault(
+            source_plug_name, {})[(dest_node_name, dest_plug_name)] = \
+            weak_link
+        self._links_in.setdefault(dest_node_name, {}).setdefault(
+            dest_plug_name, {})[(source_node_name, source_plug_name)] = \
+            weak_link
+
+    def _remove_plug_link(self, source_node_name, source_plug_name,
+                          dest_node_name, dest_plug_name):
+        """ Remove a link from the plugs and from the pipeline links index.
+        """
+        source_node = self.nodes[source_node_name]
+        dest_node = self.nodes[dest_node_name]
+        source_plug = source_node.plugs[source_plug_name]
+        dest_plug = dest_node.plugs[dest_plug_name]
+        self._invalidate_provenance()
+        for weak_link in (True, False):
+            source_plug.links_to.discard((dest_node_name, dest_plug_name,
+                                          dest_node, dest_plug, weak_link))
+            dest_plug.links_from.discard((source_node_name, source_plug_name,
+                                          source_node, source_plug,
+                                          weak_link))
+        for index, node_name, plug_name, key in (
+                (self._links_out, source_node_name, source_plug_name,
+                 (dest_node_name, dest_plug_name)),
+                (self._links_in, dest_node_name, dest_plug_name,
+                 (source_node_name, source_plug_name))):
+            plugs = index.get(node_name, {})
+            links = plugs.get(plug_name, {})
+            links.pop(key, None)
+            if not links:
+                plugs.pop(plug_name, None)
+                if not plugs:
+                    index.pop(node_name, None)
 
     def remove_link(self, link):
         """ Remove a link between pipeline nodes
@@ -710,14 +844,8 @@ class Pipeline(Process):
          dest_plug) = self.parse_link(link)
 
         # Update plugs memory of the pipeline
-        source_plug.links_to.discard((dest_node_name, dest_plug_name,
-                                      dest_node, dest_plug, True))
-        source_plug.links_to.discard((dest_node_name, dest_plug_name,
-                                      dest_node, dest_plug, False))
-        dest_plug.links_from.discard((source_node_name, source_plug_name,
-                                      source_node, source_plug, True))
-        dest_plug.links_from.discard((source_node_name, source_plug_name,
-                                      source_node, source_plug, False))
+        self._remove_plug_link(source_node_name, source_plug_name,
+                               dest_node_name, dest_plug_name)
 
         # Set a connected_output property
         if (isinstance(dest_node, ProcessNode) and
@@ -730,6 +858,10 @@ class Pipeline(Process):
         source_node.disconnect(source_plug_name, dest_node, dest_plug_name)
         dest_node.disconnect(dest_plug_name, source_node, source_plug_name)
 
+        # The activations will be updated by the next update
+        self._record_activation_changes(
+            [(source_node, source_plug_name), (dest_node, dest_plug_name)])
+
     def export_parameter(self, node_name, plug_name,
                          pipeline_parameter=None, weak_link=False,
                          is_enabled=None, is_optional=None):
@@ -817,6 +949,126 @@ class Pipeline(Process):
         if node:
             node.enabled = is_enabled
 
+    def _top_pipeline(self):
+        """ Get the top level pipeline containing this one.
+        """
+        pipeline = self
+        while pipeline.parent_pipeline is not None:
+            pipeline = pipeline.parent_pipeline
+        return pipeline
+
+    @contextmanager
+    def bulk_set(self):
+        """ Context manager delaying the propagation of values along links.
+
+        Within the block, parameters assignments do not cascade through the
+        linked plugs: changed plugs are recorded, and when the outermost
+        block exits their values are propagated once per plug. When several
+        plugs of a group of linked plugs have been assigned, the latest
+        assignment wins, as it would for sequential assignments (except for
+        values pushed back by switches from their outputs to their inputs).
+        Values of linked plugs read inside the block may be outdated.
+
+        ::
+
+            with pipeline.bulk_set():
+                for name, value in six.iteritems(parameters):
+                    setattr(pipeline, name, value)
+
+        The context applies to the top level pipeline, thus to all its
+        sub-pipelines.
+        """
+        pipeline = self._top_pipeline()
+        if pipeline._bulk_set_depth == 0:
+            pipeline._bulk_set_changes = {}
+        pipeline._bulk_set_depth += 1
+        try:
+            yield pipeline
+        finally:
+            pipeline._bulk_set_depth -= 1
+            if pipeline._bulk_set_depth == 0:
+                try:
+                    pipeline._propagate_deferred_values()
+                finally:
+                    pipeline._bulk_set_changes = None
+
+    def _defer_value_propagation(self, node, plug_name, value):
+        """ Record a plug value change instead of propagating it, if a
+        bulk_set() block is active.
+
+        Returns
+        -------
+        deferred: bool
+            False if the value has to be propagated now.
+        """
+        pipeline = self._top_pipeline()
+        changes = pipeline._bulk_set_changes
+        if changes is None:
+            return False
+        if pipeline._bulk_set_depth != 0:
+            # a new assignment, not a consequence of the final propagation:
+            # it supersedes the previous ones
+            pipeline._bulk_set_stamp += 1
+        changes[node.plugs[plug_name]] = (pipeline._bulk_set_stamp, node,
+                                          plug_name, value)
+        return True
+
+    def _propagate_deferred_values(self):
+        """ Propagate the values recorded within a bulk_set() block.
+
+        Recorded plugs are processed from the latest assignment to the
+        oldest. Each one spreads its value along links to all the plugs it
+        reaches which have not already been set by a later assignment, so
+        that every plug is set at most once.
+        """
+        changes = self._bulk_set_changes
+        pending = sorted(six.itervalues(changes), key=lambda x: x[0],
+                         reverse=True)
+        changes.clear()
+        # {plug: value} of plugs whose final value is known
+        done = {}
+        for stamp, node, plug_name, value in pending:
+            plug = node.plugs[plug_name]
+            if plug in done:
+                continue
+            done[plug] = value
+            # changes caused by this propagation get its stamp
+            self._bulk_set_stamp = stamp
+            todo = [(node, plug_name, value)]
+            while todo:
+                node, plug_name, value = todo.pop()
+                for source_plug_name, dest_node, dest_plug_name \
+                        in list(node._callbacks):
+                    if source_plug_name != plug_name:
+                        continue
+                    dest_plug = dest_node.plugs[dest_plug_name]
+                    if dest_plug in done:
+                        continue
+                    try:
+                        dest_node.set_plug_value(dest_plug_name, value)
+                    except Exception:
+                        # report the error as the link notification would
+                        handle_exception(dest_node, dest_plug_name,
+                                         traits.Undefined, value)
+                        continue
+                    done[dest_plug] = value
+                    todo.append((dest_node, dest_plug_name, value))
+                # plugs changed by the nodes themselves (switches for
+                # instance)
+                while changes:
+                    reactions = list(six.itervalues(changes))
+                    changes.clear()
+                    for reaction in reactions:
+                        node, plug_name, value = reaction[1:]
+                        plug = node.plugs[plug_name]
+                        if plug not in done:
+                            done[plug] = value
+                            todo.append((node, plug_name, value))
+                        elif value is not done[plug] \
+                                and value != done[plug]:
+                            # a later assignment wins
+                            node.set_plug_value(plug_name, done[plug])
+
     def all_nodes(self):
         """ Iterate over all pipeline nodes including sub-pipeline nodes.
 
@@ -833,7 +1085,7 @@ class Pipeline(Process):
                     if sub_node is not node:
                         yield sub_node
 
-    def _check_local_node_activation(self, node):
+    def _check_local_node_activation(self, node, plug_names=None):
         """ Try to activate a node and its plugs according to its
         state and the state of its direct neighbouring nodes.
 
@@ -841,6 +1093,8 @@ class Pipeline(Process):
         ----------
         node: Node (mandatory)
             node to check
+        plug_names: set of str (optional)
+            only check these plugs of the top-level pipeline node.
 
         Returns
         -------
@@ -849,6 +1103,11 @@ class Pipeline(Process):
             activated
         """
         plugs_activated = []
+        if plug_names is None:
+            plugs = node.plugs
+        else:
+            plugs = dict((plug_name, node.plugs[plug_name])
+                         for plug_name in plug_names)
         # If a node is disabled, it will never be activated
         if node.enabled:
             # Try to activate input plugs
@@ -856,7 +1115,7 @@ class Pipeline(Process):
             if node is self.pipeline_node:
                 # For the top-level pipeline node, all enabled plugs
                 # are activated
-                for plug_name, plug in six.iteritems(node.plugs):
+                for plug_name, plug in six.iteritems(plugs):
                     if plug.enabled:
                         if not plug.activated:
                             plug.activated = True
@@ -886,14 +1145,14 @@ class Pipeline(Process):
             if node_activated:
                 node.activated = True
                 # If node is activated, activate enabled output plugs
-                for plug_name, plug in six.iteritems(node.plugs):
+                for plug_name, plug in six.iteritems(plugs):
                     if plug.output and plug.enabled:
                         if not plug.activated:
                             plug.activated = True
                             plugs_activated.append((plug_name, plug))
         return plugs_activated
 
-    def _check_local_node_deactivation(self, node):
+    def _check_local_node_deactivation(self, node, plug_names=None):
         """ Check plugs that have to be deactivated according to node
         activation state and to the state of its direct neighbouring nodes.
 
@@ -901,6 +1160,9 @@ class Pipeline(Process):
         ----------
         node: Node (mandatory)
             node to check
+        plug_names: set of str (optional)
+            only check these plugs of the top-level pipeline node. The node
+            itself is never deactivated in this case.
 
         Returns
         -------
@@ -936,11 +1198,17 @@ class Pipeline(Process):
             return plug_activated
 
         plugs_deactivated = []
+        if plug_names is None:
+            plugs = node.plugs
+        else:
+            plugs = dict((plug_name, node.plugs[plug_name])
+                         for plug_name in plug_names)
         # If node has already been  deactivated there is nothing to do
         if node.activated:
-            deactivate_node = bool([plug for plug in node.plugs.itervalues()
-                                    if plug.output])
-            for plug_name, plug in six.iteritems(node.plugs):
+            deactivate_node = (plug_names is None and
+                               bool([plug for plug in node.plugs.itervalues()
+                                     if plug.output]))
+            for plug_name, plug in six.iteritems(plugs):
                 # Check all activated plugs
                 if plug.activated:
                     # A plug with a default value is always activated
@@ -998,66 +1266,169 @@ class Pipeline(Process):
         self._disable_update_nodes_and_plugs_activation -= 1
         if self._disable_update_nodes_and_plugs_activation == 0 and \
                 self._must_update_nodes_and_plugs_activation:
-            self.update_nodes_and_plugs_activation()
+            # changes have been recorded while updates were delayed
+            self.update_nodes_and_plugs_activation([])
 
-    def update_nodes_and_plugs_activation(self):
-        """ Reset all nodes and plugs activations according to the current
-        state of the pipeline (i.e. switch selection, nodes disabled, etc.).
-        Activations are set according to the following rules.
+    def _record_activation_changes(self, changes):
+        """ Remember nodes and plugs whose activations have to be computed
+        again by the next update of activations.
+
+        Parameters
+        ----------
+        changes: list of (Node, str) or None (mandatory)
+            (node, plug_name) pairs, plug_name being None when the whole node
+            has changed. None means that the whole pipeline has to be updated.
         """
         if not hasattr(self, 'parent_pipeline'):
             # self is being initialized (the call comes from self.__init__).
             return
         if self.parent_pipeline is not None:
             # Only the top level pipeline can manage activations
-            self.parent_pipeline.update_nodes_and_plugs_activation()
-            return
-        if self._disable_update_nodes_and_plugs_activation:
-            self._must_update_nodes_and_plugs_activation = True
+            self.parent_pipeline._record_activation_changes(changes)
             return
+        self._provenance_stamp = next(_provenance_stamps)
+        if changes is None:
+            self._activation_changes = None
+        elif self._activation_changes is not None:
+            self._activation_changes.update(changes)
+
+    def _activation_region(self, changes):
+        """ Find the part of the pipeline whose activations may depend on
+        changed nodes and plugs.
+
+        Activations only propagate through links, so the region is made of
+        everything that is reachable through links from the changes. Plugs of
+        the top-level pipeline node are considered one by one because their
+        activations do not depend on each other (as long as the pipeline node
+        stays activated), otherwise the region would almost always be the
+        whole pipeline.
 
-        self._disable_update_nodes_and_plugs_activation += 1
+        Parameters
+        ----------
+        changes: set of (Node, str) (mandatory)
+            (node, plug_name) pairs, plug_name being None when the whole node
+            has changed.
 
-        debug = getattr(self, '_debug_activations', None)
-        if debug:
-            debug = open(debug, 'w')
-            print(self.id, file=debug)
+        Returns
+        -------
+        region: tuple or None
+            (nodes, pipeline_plugs) where nodes is the set of nodes and
+            pipeline_plugs the set of top-level pipeline plug names to update.
+            None if the whole pipeline has to be updated.
+        """
+        pipeline_node = self.pipeline_node
+        if not (pipeline_node.enabled and pipeline_node.activated):
+            return None
+        nodes = set()
+        pipeline_plugs = set()
+        stack = list(changes)
+        while stack:
+            node, plug_name = stack.pop()
+            if node is pipeline_node:
+                if plug_name is None:
+                    return None
+                if (plug_name in pipeline_plugs or
+                        plug_name not in pipeline_node.plugs):
+                    continue
+                pipeline_plugs.add(plug_name)
+                plugs = [pipeline_node.plugs[plug_name]]
+            else:
+                if node in nodes:
+                    continue
+                nodes.add(node)
+                plugs = node.plugs.itervalues()
+            for plug in plugs:
+                for nn, pn, n, p, weak_link in plug.links_to:
+                    stack.append((n, pn))
+                for nn, pn, n, p, weak_link in plug.links_from:
+                    stack.append((n, pn))
+        return nodes, pipeline_plugs
 
-        # Remember all links that are inactive (i.e. at least one of the two
-        # plugs is inactive) in order to execute a callback if they become
-        # active (see at the end of this method)
+    def _inactive_links(self, nodes, pipeline_plugs=None):
+        """ List links starting from nodes that are inactive (i.e. at least
+        one of the two plugs is inactive).
+
+        Parameters
+        ----------
+        nodes: iterable of Node (mandatory)
+            the source nodes of the links.
+        pipeline_plugs: set of str (optional)
+            names of top-level pipeline node plugs whose links are also
+            listed.
+
+        Returns
+        -------
+        inactive_links: list
+            list of (node, source_plug_name, source_plug, dest_node,
+            dest_plug_name, dest_plug) items.
+        """
+        sources = [(node, list(six.iteritems(node.plugs))) for node in nodes]
+        if pipeline_plugs:
+            sources.append((self.pipeline_node,
+                            [(plug_name, self.pipeline_node.plugs[plug_name])
+                             for plug_name in pipeline_plugs]))
         inactive_links = []
-        for node in self.all_nodes():
-            for source_plug_name, source_plug in six.iteritems(node.plugs):
+        for node, plugs in sources:
+            for source_plug_name, source_plug in plugs:
                 for nn, pn, n, p, weak_link in source_plug.links_to:
                     if not source_plug.activated or not p.activated:
                         inactive_links.append((node, source_plug_name,
                                                source_plug, n, pn, p))
+        return inactive_links
+
+    def _propagate_activations(self, nodes, pipeline_plugs=None, debug=None):
+        """ Compute nodes and plugs activations from scratch.
+
+        Parameters
+        ----------
+        nodes: iterable of Node (mandatory)
+            the nodes to update. They must not be linked to nodes that are not
+            updated.
+        pipeline_plugs: set of str (optional)
+            if given, the top-level pipeline node is not part of nodes and
+            only these plugs of the pipeline node are updated.
+        debug: file (optional)
+            if given, activation steps are recorded in this file.
+        """
+        pipeline_node = self.pipeline_node
+
+        def check_later(nodes_to_check, node, plug_name):
+            if pipeline_plugs is not None and node is pipeline_node:
+                nodes_to_check.setdefault(node, set()).add(plug_name)
+            else:
+                nodes_to_check[node] = None
 
         # Initialization : deactivate all nodes and their plugs
-        for node in self.all_nodes():
+        all_nodes_to_check = {}
+        for node in nodes:
             node.activated = False
             for plug_name, plug in six.iteritems(node.plugs):
                 plug.activated = False
+            all_nodes_to_check[node] = None
+        if pipeline_plugs:
+            for plug_name in pipeline_plugs:
+                pipeline_node.plugs[plug_name].activated = False
+            all_nodes_to_check[pipeline_node] = pipeline_plugs
 
         # Forward activation : try to activate nodes (and their input plugs)
         # and propagate activations neighbours of activated plugs
 
         # Starts iterations with all nodes
-        nodes_to_check = set(self.all_nodes())
+        nodes_to_check = all_nodes_to_check
         iteration = 1
         while nodes_to_check:
-            new_nodes_to_check = set()
-            for node in nodes_to_check:
+            new_nodes_to_check = {}
+            for node, plug_names in six.iteritems(nodes_to_check):
                 node_activated = node.activated
-                for plug_name, plug in self._check_local_node_activation(node):
+                for plug_name, plug in self._check_local_node_activation(
+                        node, plug_names):
                     if debug:
                         print('%d+%s:%s' % (
                             iteration, node.full_name, plug_name), file=debug)
                     for nn, pn, n, p, weak_link in \
                             plug.links_to.union(plug.links_from):
                         if not weak_link and p.enabled:
-                            new_nodes_to_check.add(n)
+                            check_later(new_nodes_to_check, n, pn)
                 if (not node_activated) and node.activated:
                     if debug:
                         print('%d+%s' % (iteration, node.full_name),
@@ -1067,15 +1438,15 @@ class Pipeline(Process):
 
         # Backward deactivation : deactivate plugs that should not been
         # activated and propagate deactivation to neighbouring plugs
-        nodes_to_check = set(self.all_nodes())
+        nodes_to_check = all_nodes_to_check
         iteration = 1
         while nodes_to_check:
-            new_nodes_to_check = set()
-            for node in nodes_to_check:
+            new_nodes_to_check = {}
+            for node, plug_names in six.iteritems(nodes_to_check):
                 node_activated = node.activated
                 # Test plugs deactivation according to their input/output
                 # state
-                test = self._check_local_node_deactivation(node)
+                test = self._check_local_node_deactivation(node, plug_names)
                 if test:
                     for plug_name, plug in test:
                         if debug:
@@ -1085,7 +1456,7 @@ class Pipeline(Process):
                         for nn, pn, n, p, weak_link in \
                                 plug.links_from.union(plug.links_to):
                             if p.activated:
-                                new_nodes_to_check.add(n)
+                                check_later(new_nodes_to_check, n, pn)
                     if not node.activated:
                         # If the node has been deactivated, force deactivation
                         # of all plugs that are still active and propagate
@@ -1103,13 +1474,80 @@ class Pipeline(Process):
                                 for nn, pn, n, p, weak_link in \
                                         plug.links_from.union(plug.links_to):
                                     if p.activated:
-                                        new_nodes_to_check.add(n)
+                                        check_later(new_nodes_to_check, n,
+                                                    pn)
             nodes_to_check = new_nodes_to_check
             iteration += 1
 
+    def update_nodes_and_plugs_activation(self, changes=None):
+        """ Reset all nodes and plugs activations according to the current
+        state of the pipeline (i.e. switch selection, nodes disabled, etc.).
+        Activations are set according to the following rules.
+
+        When the changed nodes and plugs are given, only the part of the
+        pipeline connected to them through links is updated. The whole
+        pipeline is updated otherwise, and each time activations are
+        recorded in the file given by the _debug_activations attribute.
+
+        Parameters
+        ----------
+        changes: list of (Node, str) (optional)
+            (node, plug_name) pairs whose state or links have changed,
+            plug_name being None when the whole node has changed. None means
+            that anything may have changed.
+        """
+        if not hasattr(self, 'parent_pipeline'):
+            # self is being initialized (the call comes from self.__init__).
+            return
+        self._record_activation_changes(changes)
+        if self.parent_pipeline is not None:
+            # Only the top level pipeline can manage activations
+            self.parent_pipeline.update_nodes_and_plugs_activation([])
+            return
+        if self._disable_update_nodes_and_plugs_activation:
+            self._must_update_nodes_and_plugs_activation = True
+            return
+
+        self._disable_update_nodes_and_plugs_activation += 1
+        changes = self._activation_changes
+        self._activation_changes = set()
+
+        debug = getattr(self, '_debug_activations', None)
+        if debug:
+            debug = open(debug, 'w')
+            print(self.id, file=debug)
+
+        region = None
+        if changes is not None and not debug:
+            region = self._activation_region(changes)
+
+        # Remember all links that are inactive (i.e. at least one of the two
+        # plugs is inactive) in order to execute a callback if they become
+        # active (see at the end of this method)
+        inactive_links = []
+        if region is not None:
+            nodes, pipeline_plugs = region
+            inactive_links = self._inactive_links(nodes, pipeline_plugs)
+            self._propagate_activations(nodes, pipeline_plugs)
+            nodes = list(nodes)
+            nodes.append(self.pipeline_node)
+            # When no pipeline output remains active, the whole pipeline is
+            # deactivated: this is only done by a complete update
+            outputs = [plug for plug in self.pipeline_node.plugs.itervalues()
+                       if plug.output]
+            if outputs and not [plug for plug in outputs if plug.activated]:
+                region = None
+        if region is None:
+            nodes = list(self.all_nodes())
+            known_links = set(inactive_links)
+            for link in self._inactive_links(nodes):
+                if link not in known_links:
+                    inactive_links.append(link)
+            self._propagate_activations(nodes, debug=debug)
+
         # Update processes to hide or show their traits according to the
         # corresponding plug activation
-        for node in self.all_nodes():
+        for node in nodes:
             if isinstance(node, ProcessNode):
                 traits_changed = False
                 for plug_name, plug in six.iteritems(node.plugs):
@@ -1132,10 +1570,13 @@ class Pipeline(Process):
                 node._callbacks[(source_plug_name, n, pn)](value)
 
         # Refresh views relying on plugs and nodes selection
-        for node in self.all_nodes():
+        for node in nodes:
             if isinstance(node, PipelineNode):
                 node.process.selection_changed = True
 
+        if debug:
+            debug.close()
+        self._provenance_stamp = next(_provenance_stamps)
         self._disable_update_nodes_and_plugs_activation -= 1
 
     def workflow_graph(self, remove_disabled_steps=True):
@@ -1152,19 +1593,15 @@ class Pipeline(Process):
             Default: True
         """
 
-        def insert(pipeline, node_name, plug, dependencies):
+        def insert(pipeline, node_name, links, dependencies):
             """ Browse the plug links and add the correspondings edges
             to the node.
             """
 
-            # Main loop
-            for (dest_node_name, dest_plug_name, dest_node, dest_plug,
-                 weak_link) in plug.links_to:
-
-                # Ignore the link if it is pointing to a node in a
-                # sub-pipeline or in the parent pipeline
-                if pipeline.nodes.get(dest_node_name) is not dest_node:
-                    continue
+            # Main loop: the pipeline links index only holds the links
+            # between nodes of this pipeline
+            for dest_node_name, dest_plug_name in links:
+                dest_node = pipeline.nodes[dest_node_name]
 
                 # Plug need to be activated
                 if dest_node.activated:
@@ -1174,8 +1611,9 @@ class Pipeline(Process):
                     if not isinstance(dest_node, Switch):
                         dependencies.add((node_name, dest_node_name))
                     else:
-                        for switch_plug in dest_node.plugs.itervalues():
-                            insert(pipeline, node_name, switch_plug,
+                        for switch_links in six.itervalues(
+                                pipeline._links_out.get(dest_node_name, {})):
+                            insert(pipeline, node_name, switch_links,
                                    dependencies)
 
         # Create a graph and a list of graph node edges
@@ -1217,11 +1655,12 @@ class Pipeline(Process):
                     graph.add_node(GraphNode(node_name, [node]))
 
                 # Add node edges
-                for plug_name, plug in six.iteritems(node.plugs):
+                for plug_name, links in six.iteritems(
+                        self._links_out.get(node_name, {})):
 
                     # Consider only active pipeline node plugs
-                    if plug.activated:
-                        insert(self, node_name, plug, dependencies)
+                    if node.plugs[plug_name].activated:
+                        insert(self, node_name, links, dependencies)
 
         # Add edges to the graph
         for d in dependencies:
@@ -1394,6 +1833,92 @@ class Pipeline(Process):
         raise NotImplementedError('Pipeline execution is managed by '
             'StudyConfig class. This method must not be called.')
 
+    def _invalidate_provenance(self):
+        """ Discard the results of links walks of the pipeline hierarchy.
+        """
+        self._top_pipeline()._provenance_stamp = next(_provenance_stamps)
+
+    def _provenance_cache(self):
+        """ Get the results of links walks of this pipeline, emptied when
+        links or activations of the pipeline hierarchy change.
+        """
+        stamp = self._top_pipeline()._provenance_stamp
+        if self._provenance[0] != stamp:
+            self._provenance = (stamp, {})
+        return self._provenance[1]
+
+    def plug_value_origin(self, plug, recursive=True):
+        """ Find where a plug of a node of the pipeline takes its value from.
+
+        Indexed version of
+        capsul.pipeline.pipeline_tools.where_is_plug_value_from(): the
+        origins of all plugs of the pipeline and of its sub-pipelines are
+        computed by the first query, and kept until links or activations
+        change, so that next queries are dictionary lookups.
+
+        Parameters
+        ----------
+        plug: Plug instance (mandatory)
+            the plug to find source connection with
+        recursive: bool (optional, default True)
+            see where_is_plug_value_from().
+
+        Returns
+        -------
+        node, param_name, parent:
+            see where_is_plug_value_from().
+        """
+        cache = self._provenance_cache()
+        index = cache.get(('origins', recursive))
+        if index is None:
+            index = {}
+            for node in self.all_nodes():
+                for node_plug in six.itervalues(node.plugs):
+                    index[node_plug] = _plug_value_origin(node_plug,
+                                                          recursive)
+            cache[('origins', recursive)] = index
+        origin = index.get(plug)
+        if origin is None:
+            # not a plug of this pipeline
+            origin = _plug_value_origin(plug, recursive)
+        return origin
+
+    def _plug_export_links(self, plug):
+        """ Check where an output plug is exported, for
+        find_empty_parameters().
+
+        Returns
+        -------
+        valid: bool
+            False if the plug is exported to the main pipeline node.
+        optional: bool
+            True if all the plugs it is linked to are optional.
+        """
+        cache = self._provenance_cache().setdefault('export_links', {})
+        result = cache.get(plug)
+        if result is not None:
+            return result
+        valid = True
+        optional = True
+        links = deque(plug.links_from.union(plug.links_to))
+        # check where this plug is linked
+        while links:
+            link = links.popleft()
+            oplug = link[3]
+            if link[0] == '':
+                if link[2] == self.nodes['']:
+                    # linked to the main node: keep it as is
+                    valid = False
+                    break
+                # linked to an output plug of an intermediate pipeline:
+                # needed only if this pipeline plug is used later,
+                # or mandatory
+                if oplug.optional:
+                    links.extend(oplug.links_to)
+            optional &= bool(oplug.optional)
+        result = cache[plug] = (valid, optional)
+        return result
+
     def find_empty_parameters(self):
         """ Find internal File/Directory parameters not exported to the main
         input/output parameters of the pipeline with empty values. This is
@@ -1408,18 +1933,18 @@ class Pipeline(Process):
         """
         empty_params = []
         # walk all activated nodes, recursively
-        nodes = [(node_name, node)
-                 for node_name, node in six.iteritems(self.nodes)
-                 if node_name != '' and node.enabled and node.activated]
+        nodes = deque((node_name, node)
+                      for node_name, node in six.iteritems(self.nodes)
+                      if node_name != '' and node.enabled and node.activated)
         while nodes:
-            node_name, node = nodes.pop(0)
+            node_name, node = nodes.popleft()
             if hasattr(node, 'process'):
                 process = node.process
                 if isinstance(process, Pipeline):
-                    nodes += [(cnode_name, cnode)
+                    nodes.extend((cnode_name, cnode)
                         for cnode_name, cnode in six.iteritems(process.nodes)
                         if cnode_name != '' and cnode.enabled
-                        and cnode.activated]
+                        and cnode.activated)
             else:
                 process = node
             # check output plugs; input ones don't work with generated
@@ -1448,29 +1973,14 @@ class Pipeline(Process):
                     if value != '' and value is not traits.Undefined:
                         continue # non-null value: not an empty parameter.
                 optional = bool(parameter.optional)
-                valid = True
-                links = list(plug.links_from.union(plug.links_to))
-                if len(links) == 0:
+                if not plug.links_from and not plug.links_to:
                     if optional:
                         # an optional, non-connected output can stay empty
                         continue
-                # check where this plug is linked
-                while links:
-                    link = links.pop(0)
-                    oplug = link[3]
-                    if link[0] == '':
-                        if link[2] == self.nodes['']:
-                            # linked to the main node: keep it as is
-                            valid = False
-                            break
-                        # linked to an output plug of an intermediate pipeline:
-                        # needed only if this pipeline plug is used later,
-                        # or mandatory
-                        if oplug.optional:
-                            links += oplug.links_to
-                    optional &= bool(oplug.optional)
+                valid, links_optional = self._plug_export_links(plug)
                 if valid:
-                    empty_params.append((node, plug_name, optional))
+                    empty_params.append((node, plug_name,
+                                         optional and links_optional))
         return empty_params
 
     def count_items(self):
@@ -1547,6 +2057,8 @@ class Pipeline(Process):
         the whole structure and state of the pipeline. This object can be
         given to compare_to_state method in order to get the differences with
         a previously stored state. This is typically used in tests scripts.
+        See capsul.pipeline.pipeline_snapshot for compact snapshots of large
+        pipelines.
 
         Returns
         -------
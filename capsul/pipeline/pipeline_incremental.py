@@ -0,0 +1,317 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Make-style up-to-date checks of pipeline nodes, for incremental runs.
+
+A node is up to date, and does not need to be run again, when:
+
+* all its output files exist;
+* they are newer than its input files ('timestamps' checks), or its input
+  files have the content they had when the node was last run ('digests'
+  checks);
+* its input parameters are the ones it was last run with, if a state file
+  records them;
+* all the nodes it depends on in the pipeline workflow graph are up to date.
+
+Only the other nodes, the invalidated part of the workflow graph, are
+executed: changing a parameter of a late node of a pipeline only runs this
+node and the nodes depending on it. Nodes with a temporary output file (an
+unset output linked to another node) are never up to date, since this file
+only exists during the run.
+
+The state file is a json-lines file where the input parameters signature
+(and, for 'digests' checks, the input files digests) of each node are
+recorded after it is run, the last record of a node replacing the previous
+ones.
+"""
+
+# System import
+import os
+import json
+import hashlib
+import logging
+import threading
+import six
+
+# Trait import
+from traits.api import Undefined, File, Directory, List
+
+# CAPSUL import
+from capsul.pipeline.pipeline import Pipeline
+from capsul.pipeline.pipeline_nodes import Node
+from capsul.pipeline.pipeline_scheduling import workflow_dependencies
+
+# Define the logger
+logger = logging.getLogger(__name__)
+
+# Parameters which are not part of the signature of a node
+_ignored_params = ("nodes_activation", "selection_changed")
+
+
+def _is_path_trait(trait_type):
+    """ Check if a trait type holds files or directories names.
+    """
+    if isinstance(trait_type, (File, Directory)):
+        return True
+    if isinstance(trait_type, List):
+        inner_traits = trait_type.inner_traits()
+        return bool(inner_traits) \
+            and _is_path_trait(inner_traits[0].trait_type)
+    return False
+
+
+def _paths(value):
+    """ Iterate over the non empty strings contained in a value.
+    """
+    if isinstance(value, six.string_types):
+        if value:
+            yield value
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            for path in _paths(item):
+                yield path
+
+
+def file_digest(path):
+    """ Get the sha1 digest of the content of a file, or of the names and
+    contents of the files of a directory.
+    """
+    digest = hashlib.sha1()
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                digest.update(os.path.relpath(file_path, path).encode(
+                    "utf-8"))
+                digest.update(file_digest(file_path).encode("utf-8"))
+    else:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+class IncrementalState(object):
+    """ Decide which pipeline nodes have to be run again.
+
+    Attributes
+    ----------
+    `state_file`: str
+        the json-lines file where the parameters of the run nodes are
+        recorded, None to only compare files timestamps.
+    `checks`: str
+        'timestamps' or 'digests': how input and output files are compared.
+
+    Methods
+    -------
+    signature
+    outdated_nodes
+    record
+    """
+
+    def __init__(self, state_file=None, checks="timestamps"):
+        """ Load the nodes recorded in the state file, if it exists.
+
+        Parameters
+        ----------
+        state_file: str (optional)
+            the state file. Without it, parameters changes are not detected,
+            only files timestamps are compared.
+        checks: str (optional, default 'timestamps')
+            'timestamps': a node is up to date when its outputs are newer
+            than its inputs, as in make. 'digests': a node is up to date
+            when its input files contents did not change since it was last
+            run, which requires a state file.
+        """
+        if checks not in ("timestamps", "digests"):
+            raise ValueError(
+                "Unknown incremental checks '{0}': expect 'timestamps' or "
+                "'digests'".format(checks))
+        if checks == "digests" and not state_file:
+            raise ValueError("Digests checks require a state file")
+        self.state_file = state_file
+        self.checks = checks
+        self._entries = {}
+        self._lock = threading.Lock()
+        if state_file and os.path.exists(state_file):
+            lines = 0
+            with open(state_file) as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # line truncated by an interruption
+                        continue
+                    self._entries[entry["node"]] = entry
+            if lines > 2 * len(self._entries):
+                self._compact()
+
+    @staticmethod
+    def node_key(node):
+        """ Get the state key of a node, or of a process.
+        """
+        if isinstance(node, Node):
+            return node.full_name
+        return node.id
+
+    @staticmethod
+    def signature(process):
+        """ Get the signature of the input parameters values of a process.
+
+        Output parameters are left out: a node whose output files change is
+        run again because they do not exist.
+        """
+        values = {}
+        for name, trait in six.iteritems(process.user_traits()):
+            if trait.output or name in _ignored_params:
+                continue
+            value = getattr(process, name)
+            if value is Undefined:
+                value = "<undefined>"
+            values[name] = value
+        return hashlib.sha1(json.dumps(
+            [process.id, values], sort_keys=True,
+            default=repr).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _files(process, output):
+        """ List the input or output files of a process.
+        """
+        files = []
+        for name, trait in six.iteritems(process.user_traits()):
+            if bool(trait.output) == output \
+                    and _is_path_trait(trait.trait_type):
+                files.extend(_paths(getattr(process, name)))
+        return files
+
+    def _input_digests(self, process):
+        """ Get the digests of the existing input files of a process.
+        """
+        return dict((path, file_digest(path))
+                    for path in self._files(process, False)
+                    if os.path.exists(path))
+
+    def _up_to_date(self, node, process):
+        """ Check if the outputs of a node are up to date, regardless of the
+        nodes it depends on.
+        """
+        entry = self._entries.get(self.node_key(node))
+        if self.state_file and (
+                entry is None or entry["signature"] != self.signature(process)):
+            return False
+        outputs = self._files(process, True)
+        if not outputs or not all(os.path.exists(path) for path in outputs):
+            return False
+        inputs = self._files(process, False)
+        if set(inputs).intersection(outputs):
+            # modified in place: cannot tell
+            return False
+        if self.checks == "digests":
+            return entry.get("digests") == self._input_digests(process)
+        try:
+            newest_input = max([os.path.getmtime(path) for path in inputs]
+                               or [0])
+        except OSError:
+            # missing input: let the node run and report it
+            return False
+        return min(os.path.getmtime(path) for path in outputs) >= newest_input
+
+    @staticmethod
+    def _has_temporary_outputs(node):
+        """ Check if a node has unset output files linked to other nodes,
+        which are allocated as temporary files when the pipeline is run.
+        """
+        if not isinstance(node, Node):
+            return False
+        for plug_name, plug in six.iteritems(node.plugs):
+            if not plug.output or not plug.activated or not plug.enabled \
+                    or not plug.links_to:
+                continue
+            if not _is_path_trait(node.get_trait(plug_name).trait_type):
+                continue
+            value = node.get_plug_value(plug_name)
+            values = value if isinstance(value, list) else [value]
+            if any(item in (Undefined, "", None) for item in values):
+                return True
+        return False
+
+    def outdated_nodes(self, process_or_pipeline, execution_list):
+        """ Filter out the up to date nodes of an execution list.
+
+        Parameters
+        ----------
+        process_or_pipeline: Process (mandatory)
+            the executed process or pipeline.
+        execution_list: list (mandatory)
+            the nodes (or the process) to execute, in a valid sequential
+            order.
+
+        Returns
+        -------
+        outdated: list
+            the nodes of execution_list which have to be run again, in the
+            same order.
+        """
+        if isinstance(process_or_pipeline, Pipeline):
+            dependencies = workflow_dependencies(
+                process_or_pipeline.workflow_graph())
+        else:
+            dependencies = {}
+        outdated = []
+        outdated_set = set()
+        for node in execution_list:
+            process = getattr(node, "process", node)
+            if (any(pred in outdated_set
+                    for pred in dependencies.get(node, ()))
+                    or self._has_temporary_outputs(node)
+                    or not self._up_to_date(node, process)):
+                outdated.append(node)
+                outdated_set.add(node)
+        logger.info("Incremental run: {0} nodes out of {1} are up to "
+                    "date".format(len(execution_list) - len(outdated),
+                                  len(execution_list)))
+        return outdated
+
+    def record(self, node):
+        """ Record the parameters of a node which has been run.
+
+        Nothing is recorded without a state file.
+
+        Parameters
+        ----------
+        node: Node or Process (mandatory)
+            the node (or process) which has been run successfully.
+        """
+        if not self.state_file:
+            return
+        process = getattr(node, "process", node)
+        entry = {"node": self.node_key(node),
+                 "signature": self.signature(process)}
+        if self.checks == "digests":
+            entry["digests"] = self._input_digests(process)
+        with self._lock:
+            self._entries[entry["node"]] = entry
+            directory = os.path.dirname(self.state_file)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(self.state_file, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def _compact(self):
+        """ Rewrite the state file with the last record of each node.
+        """
+        tmp_file = self.state_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            for entry in six.itervalues(self._entries):
+                f.write(json.dumps(entry) + "\n")
+        if os.path.exists(self.state_file):
+            # os.rename() does not replace files on windows
+            os.unlink(self.state_file)
+        os.rename(tmp_file, self.state_file)
@@ -37,9 +37,13 @@ from soma.utils.functiontools import SomaPartial
 from soma.utils.weak_proxy import weak_proxy, get_ref
 
 
-class Plug(Controller):
+class Plug(object):
     """ Overload of the traits in oder to keep the pipeline memory.
 
+    Plugs are numerous in large pipelines: they are light objects with fixed
+    attributes (__slots__) rather than controllers. Only changes of the
+    enabled attribute can be observed, using on_trait_change().
+
     Attributes
     ----------
     enabled : bool
@@ -57,16 +61,19 @@ class Plug(Controller):
     links_from : set (node_name, plug_name, node, plug, is_weak)
         the predecessor plugs of this plug
     """
-    enabled = Bool(default_value=True)
-    activated = Bool(default_value=False)
-    output = Bool(default_value=False)
-    optional = Bool(default_value=False)
+    __slots__ = ("_enabled", "activated", "output", "optional",
+                 "has_default_value", "links_to", "links_from", "_observers",
+                 "__weakref__")
 
-    def __init__(self, **kwargs):
+    def __init__(self, enabled=True, activated=False, output=False,
+                 optional=False):
         """ Generate a Plug, i.e. a trait with the memory of the
         pipeline adjacent nodes.
         """
-        super(Plug, self).__init__(**kwargs)
+        self._enabled = bool(enabled)
+        self.activated = bool(activated)
+        self.output = bool(output)
+        self.optional = bool(optional)
         # The links correspond to edges in the graph theory
         # links_to = successor
         # links_from = predecessor
@@ -76,6 +83,55 @@ class Plug(Controller):
         # The has_default value flag can be set by setting a value for a
         # parameter in Pipeline.add_process
         self.has_default_value = False
+        self._observers = None
+
+    @property
+    def enabled(self):
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, value):
+        value = bool(value)
+        if value == self._enabled:
+            return
+        self._enabled = value
+        if self._observers:
+            for callback in list(self._observers):
+                callback(self, "enabled", value)
+
+    def on_trait_change(self, handler, name="enabled", remove=False):
+        """ Add or remove an observer of the enabled attribute.
+
+        Parameters
+        ----------
+        handler: callable (mandatory)
+            called with (plug, "enabled", new_value) arguments.
+        name: str (optional)
+            only "enabled" is supported.
+        remove: bool (optional)
+            if True, the handler is removed.
+        """
+        if name != "enabled":
+            raise ValueError("Only plug enabled changes can be "
+                             "observed, not '{0}'".format(name))
+        if remove:
+            if self._observers and handler in self._observers:
+                self._observers.remove(handler)
+        else:
+            if self._observers is None:
+                self._observers = []
+            self._observers.append(handler)
+
+    def __getstate__(self):
+        """ Observers are not pickled.
+        """
+        return dict((name, getattr(self, name)) for name in self.__slots__
+                    if name not in ("_observers", "__weakref__"))
+
+    def __setstate__(self, state):
+        self._observers = None
+        for name, value in six.iteritems(state):
+            setattr(self, name, value)
 
 
 class Node(Controller):
@@ -157,12 +213,24 @@ class Node(Controller):
             # update plugs list
             self.plugs[plug_name] = plug
             # add an event on plug to validate the pipeline
-            plug.on_trait_change(pipeline.update_nodes_and_plugs_activation,
-                                 "enabled")
+            plug.on_trait_change(self._update_pipeline_activation, "enabled")
 
         # add an event on the Node instance traits to validate the pipeline
-        self.on_trait_change(pipeline.update_nodes_and_plugs_activation,
-                             "enabled")
+        self.on_trait_change(self._update_pipeline_activation, "enabled")
+
+    def _update_pipeline_activation(self, obj, name, value):
+        """ Update the pipeline activations when the node or one of its plugs
+        is enabled or disabled. Only the part of the pipeline connected to
+        the changed plug is updated.
+        """
+        plug_name = None
+        if obj is not self:
+            for plug_name, plug in six.iteritems(self.plugs):
+                if plug is obj:
+                    break
+            else:
+                plug_name = None
+        self.pipeline.update_nodes_and_plugs_activation([(self, plug_name)])
 
     @property
     def full_name(self):
@@ -176,6 +244,9 @@ class Node(Controller):
                         value):
         """ Spread the source plug value to the destination plug.
         """
+        if self.pipeline._defer_value_propagation(self, source_plug_name,
+                                                  value):
+            return
         dest_node.set_plug_value(dest_plug_name, value)
 
     def _value_callback_with_logging(
@@ -189,6 +260,9 @@ class Node(Controller):
         plug = self.plugs.get(source_plug_name, None)
         if plug is None:
             return
+        if self.pipeline._defer_value_propagation(self, source_plug_name,
+                                                  value):
+            return
         def _link_name(dest_node, plug, prefix, dest_plug_name,
                        source_node_or_process):
             external = True
@@ -671,7 +745,7 @@ class Switch(Node):
             self.plugs[plug_name].enabled = True
 
         # refresh the pipeline
-        self.pipeline.update_nodes_and_plugs_activation()
+        self.pipeline.update_nodes_and_plugs_activation([(self, None)])
 
         # Refresh the links to the output plugs
         for output_plug_name in self._outputs:
@@ -0,0 +1,246 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Scheduling helpers for pipeline workflows.
+
+Pipeline nodes are ordered using the critical path of the workflow graph:
+nodes at the head of the longest (costliest) chain of dependent nodes are
+started first, which shortens the overall execution time when nodes are run
+concurrently. Node costs are given by a :class:`CostModel`.
+"""
+
+# System import
+import os
+import json
+import logging
+import threading
+import six
+
+# CAPSUL import
+from capsul.pipeline.topological_sort import Graph, GraphNode
+
+# Define the logger
+logger = logging.getLogger(__name__)
+
+
+def workflow_dependencies(graph):
+    """ Flatten a workflow graph into leaf nodes dependencies.
+
+    Sub-pipelines (graph nodes whose meta is a sub-Graph) are expanded: the
+    nodes a sub-pipeline starts with depend on the predecessors of the
+    sub-pipeline, and the successors of the sub-pipeline depend on the nodes
+    it ends with.
+
+    Parameters
+    ----------
+    graph: Graph (mandatory)
+        a workflow graph as returned by Pipeline.workflow_graph(). The graph
+        links are read, not modified.
+
+    Returns
+    -------
+    dependencies: dict
+        {node: set of nodes} mapping each leaf pipeline node to the leaf
+        nodes that must be run before it.
+    """
+    dependencies = {}
+
+    def flatten(graph):
+        entries = {}
+        exits = {}
+        for name, gnode in six.iteritems(graph._nodes):
+            if isinstance(gnode.meta, Graph):
+                entries[name], exits[name] = flatten(gnode.meta)
+            else:
+                for node in gnode.meta:
+                    dependencies.setdefault(node, set())
+                entries[name] = exits[name] = list(gnode.meta)
+
+        def exits_of(gnode, done):
+            # an empty sub-pipeline forwards the exits of its predecessors
+            if exits[gnode.name] or gnode.name in done:
+                return exits[gnode.name]
+            done.add(gnode.name)
+            result = []
+            for pred in gnode.links_from:
+                result.extend(exits_of(pred, done))
+            return result
+
+        for name, gnode in six.iteritems(graph._nodes):
+            for pred in gnode.links_from:
+                for source in exits_of(pred, set()):
+                    for dest in entries[name]:
+                        dependencies[dest].add(source)
+
+        graph_entries = []
+        graph_exits = []
+        for name, gnode in six.iteritems(graph._nodes):
+            if not gnode.links_from:
+                graph_entries.extend(entries[name])
+            if not gnode.links_to:
+                graph_exits.extend(exits[name])
+        return graph_entries, graph_exits
+
+    flatten(graph)
+    return dependencies
+
+
+class CostModel(object):
+    """ Estimate the execution cost of processes.
+
+    The cost of a process is, in this order of preference:
+
+    * its declared `estimated_cost` attribute, when it is not None;
+    * the mean of its recorded runtimes (see record());
+    * the model default cost.
+
+    Runtimes are indexed by process id, and may be persisted in a json file
+    so that they are learned across executions.
+
+    Attributes
+    ----------
+    `history_file`: str
+        the json file runtimes are loaded from and saved to, or None.
+    `default_cost`: float
+        the cost of processes without declared or recorded cost.
+    `runtimes`: dict
+        {process id: [number of runs, total runtime in seconds]}
+
+    Methods
+    -------
+    cost
+    record
+    save
+    """
+
+    def __init__(self, history_file=None, default_cost=1.):
+        """ Initialize the CostModel class.
+
+        Parameters
+        ----------
+        history_file: str (optional)
+            a json file storing recorded runtimes. It is read if it exists.
+        default_cost: float (optional, default 1)
+            the cost of unknown processes.
+        """
+        self.history_file = history_file
+        self.default_cost = default_cost
+        self.runtimes = {}
+        self._lock = threading.Lock()
+        if history_file and os.path.isfile(history_file):
+            try:
+                with open(history_file) as f:
+                    self.runtimes = json.load(f)
+            except ValueError:
+                logger.warning(
+                    "Ignoring invalid runtime history file '{0}'".format(
+                        history_file))
+
+    def cost(self, process):
+        """ Get the estimated cost of a process.
+
+        Parameters
+        ----------
+        process: Process (mandatory)
+            the process to estimate.
+
+        Returns
+        -------
+        cost: float
+            the process cost, in seconds when it is declared or learned.
+        """
+        cost = getattr(process, "estimated_cost", None)
+        if cost is not None:
+            return float(cost)
+        runtime = self.runtimes.get(process.id)
+        if runtime and runtime[0]:
+            return float(runtime[1]) / runtime[0]
+        return self.default_cost
+
+    def record(self, process, duration):
+        """ Record the runtime of a process execution.
+
+        Parameters
+        ----------
+        process: Process (mandatory)
+            the executed process.
+        duration: float (mandatory)
+            the execution time, in seconds.
+        """
+        with self._lock:
+            runtime = self.runtimes.setdefault(process.id, [0, 0.])
+            runtime[0] += 1
+            runtime[1] += duration
+
+    def save(self):
+        """ Write the recorded runtimes in the history file, if any.
+        """
+        if not self.history_file:
+            return
+        with self._lock:
+            tmp_file = "{0}.tmp{1}".format(self.history_file, os.getpid())
+            with open(tmp_file, "w") as f:
+                json.dump(self.runtimes, f)
+            os.rename(tmp_file, self.history_file)
+
+
+def critical_path_lengths(dependencies, cost_model=None):
+    """ Compute the critical path length of leaf pipeline nodes.
+
+    Parameters
+    ----------
+    dependencies: dict (mandatory)
+        {node: set of nodes} dependencies between leaf nodes, as returned by
+        workflow_dependencies().
+    cost_model: CostModel (optional)
+        used to estimate the cost of the nodes processes. By default each
+        node costs 1.
+
+    Returns
+    -------
+    lengths: dict
+        {node: cost of the costliest chain of nodes starting at this node}
+    """
+    if cost_model is None:
+        cost_model = CostModel()
+    graph = Graph()
+    names = {}
+    for index, node in enumerate(dependencies):
+        names[node] = str(index)
+        graph.add_node(GraphNode(names[node], node))
+    for node, preds in six.iteritems(dependencies):
+        for pred in preds:
+            graph.add_link(names[pred], names[node])
+    lengths = graph.critical_path_lengths(
+        lambda gnode: cost_model.cost(gnode.meta.process))
+    return dict((node, lengths[name]) for node, name in six.iteritems(names))
+
+
+def critical_path_priorities(lengths, base_priority=0):
+    """ Convert critical path lengths into integer job priorities.
+
+    Nodes sharing the same critical path length get the same priority, and
+    longer paths get higher priorities, starting from base_priority for the
+    shortest ones.
+
+    Parameters
+    ----------
+    lengths: dict (mandatory)
+        {node: critical path length}, as returned by critical_path_lengths().
+    base_priority: int (optional, default 0)
+        the priority of the shortest paths.
+
+    Returns
+    -------
+    priorities: dict
+        {node: priority}
+    """
+    ranks = dict((length, rank) for rank, length
+                 in enumerate(sorted(set(lengths.values()))))
+    return dict((node, base_priority + ranks[length])
+                for node, length in six.iteritems(lengths))
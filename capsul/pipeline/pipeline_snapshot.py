@@ -0,0 +1,364 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Compact, versioned snapshots of pipelines states.
+
+A snapshot records the structure of a pipeline (nodes, plugs and links with
+their activations) and its parameters values, as
+:py:meth:`Pipeline.pipeline_state() <capsul.pipeline.pipeline.Pipeline.pipeline_state>`
+and
+:py:func:`~capsul.pipeline.pipeline_tools.dump_pipeline_state_as_dict` do,
+but in flat tables where node and parameter names are replaced by indices in
+a table of interned names. It is stored as compressed json bytes::
+
+    data = dump_pipeline_snapshot(pipeline)
+    ...
+    restore_pipeline_snapshot(pipeline, data)
+    differences = diff_pipeline_snapshots(data,
+                                          dump_pipeline_snapshot(pipeline))
+
+Snapshots start with a format version: older versions are read by newer
+releases, newer versions are rejected.
+"""
+
+# System import
+import json
+import zlib
+import struct
+import logging
+from collections import OrderedDict
+import six
+
+# Trait import
+from traits.api import Undefined
+
+# CAPSUL import
+from capsul.pipeline.pipeline_tools import _pipeline_state_values
+
+# Define the logger
+logger = logging.getLogger(__name__)
+
+# Header of snapshots data, followed by the format version
+_MAGIC = b"CAPSNAP"
+SNAPSHOT_VERSION = 1
+
+# Flags of nodes and plugs, in bits order
+_node_flags = ("enabled", "activated")
+_plug_flags = ("enabled", "activated", "output", "optional",
+               "has_default_value")
+
+# Key of the json objects encoding values which json cannot represent
+_TAG = "__capsul__"
+
+
+def _flags(obj, names):
+    """ Pack boolean attributes into an int.
+    """
+    flags = 0
+    for bit, name in enumerate(names):
+        if getattr(obj, name):
+            flags |= 1 << bit
+    return flags
+
+
+def _encode_value(value):
+    """ Convert a parameter value to json types, tagging the values json
+    would not restore.
+    """
+    if value is Undefined:
+        return {_TAG: "undefined"}
+    if isinstance(value, tuple):
+        return {_TAG: "tuple", "items": [_encode_value(item)
+                                         for item in value]}
+    if isinstance(value, list):
+        return [_encode_value(item) for item in value]
+    if isinstance(value, dict):
+        return dict((key, _encode_value(item))
+                    for key, item in six.iteritems(value))
+    if value is None or isinstance(value, (bool, float) + six.integer_types
+                                   + six.string_types):
+        return value
+    return {_TAG: "repr", "repr": repr(value)}
+
+
+def _decode_value(value):
+    """ Restore a value encoded by _encode_value().
+    """
+    if isinstance(value, list):
+        return [_decode_value(item) for item in value]
+    if isinstance(value, dict):
+        tag = value.get(_TAG)
+        if tag == "undefined":
+            return Undefined
+        if tag == "tuple":
+            return tuple(_decode_value(item) for item in value["items"])
+        if tag is None:
+            return dict((key, _decode_value(item))
+                        for key, item in six.iteritems(value))
+    return value
+
+
+def _not_restored(value):
+    """ Check if an encoded value contains values which cannot be restored.
+    """
+    if isinstance(value, list):
+        return any(_not_restored(item) for item in value)
+    if isinstance(value, dict):
+        if value.get(_TAG) == "repr":
+            return True
+        return any(_not_restored(item) for item in six.itervalues(value))
+    return False
+
+
+def take_pipeline_snapshot(pipeline):
+    """ Record the structure and parameters values of a pipeline.
+
+    Parameters
+    ----------
+    pipeline: Pipeline (mandatory)
+        the pipeline.
+
+    Returns
+    -------
+    snapshot: dict
+        the snapshot tables, see load_pipeline_snapshot().
+    """
+    names = []
+    name_ids = {}
+
+    def intern(name):
+        name_id = name_ids.get(name)
+        if name_id is None:
+            name_id = name_ids[name] = len(names)
+            names.append(name)
+        return name_id
+
+    nodes = []
+    plugs = []
+    plug_ids = {}
+    values = []
+    for node_names, node, proc, node_values in \
+            _pipeline_state_values(pipeline):
+        node_id = len(nodes)
+        nodes.append([intern(".".join(node_names)),
+                      _flags(node, _node_flags)])
+        for plug_name, plug in six.iteritems(node.plugs):
+            plug_ids[plug] = len(plugs)
+            plugs.append([node_id, intern(plug_name),
+                          _flags(plug, _plug_flags)])
+        for name, value in six.iteritems(node_values):
+            values.append([node_id, intern(name), _encode_value(value)])
+    links = []
+    for plug, plug_id in six.iteritems(plug_ids):
+        for link in plug.links_to:
+            dest_id = plug_ids.get(link[3])
+            if dest_id is not None:
+                links.append([plug_id, dest_id, int(bool(link[4]))])
+    links.sort()
+    return {"version": SNAPSHOT_VERSION,
+            "id": pipeline.id,
+            "names": names,
+            "nodes": nodes,
+            "plugs": plugs,
+            "links": links,
+            "values": values}
+
+
+def dump_pipeline_snapshot(pipeline):
+    """ Get the snapshot of a pipeline as bytes.
+
+    Parameters
+    ----------
+    pipeline: Pipeline (mandatory)
+        the pipeline.
+
+    Returns
+    -------
+    data: bytes
+        the compressed snapshot.
+    """
+    snapshot = take_pipeline_snapshot(pipeline)
+    payload = json.dumps(snapshot, separators=(",", ":")).encode("utf-8")
+    return (_MAGIC + struct.pack(">H", SNAPSHOT_VERSION)
+            + zlib.compress(payload))
+
+
+def load_pipeline_snapshot(data):
+    """ Read a snapshot dumped by dump_pipeline_snapshot().
+
+    Parameters
+    ----------
+    data: bytes (mandatory)
+        the snapshot data.
+
+    Returns
+    -------
+    snapshot: dict
+        'names': list of the interned node and parameter names.
+        'nodes': [name, flags] lists: name index of the node full name, and
+        enabled / activated bits.
+        'plugs': [node, name, flags] lists: node index, name index, and
+        enabled / activated / output / optional / has_default_value bits.
+        'links': [source plug, destination plug, weak] lists of plug
+        indices.
+        'values': [node, name, value] lists of the parameters values, in
+        the order they have to be set.
+    """
+    header_size = len(_MAGIC) + 2
+    if data[:len(_MAGIC)] != _MAGIC or len(data) < header_size:
+        raise ValueError("Not a pipeline snapshot")
+    version = struct.unpack(">H", data[len(_MAGIC):header_size])[0]
+    if version > SNAPSHOT_VERSION:
+        raise ValueError(
+            "Pipeline snapshot version {0} is not supported (newer than "
+            "{1})".format(version, SNAPSHOT_VERSION))
+    snapshot = json.loads(zlib.decompress(data[header_size:]).decode(
+        "utf-8"))
+    return snapshot
+
+
+def _snapshot(snapshot):
+    """ Get the tables of snapshot data, or of a loaded snapshot.
+    """
+    if isinstance(snapshot, dict):
+        return snapshot
+    return load_pipeline_snapshot(snapshot)
+
+
+def restore_pipeline_snapshot(pipeline, snapshot):
+    """ Set the parameters values recorded in a snapshot.
+
+    Values are set within a
+    :py:meth:`~capsul.pipeline.pipeline.Pipeline.bulk_set` block, and
+    activations are updated once at the end. Values which could not be
+    encoded in the snapshot (recorded as their repr) are left unchanged.
+
+    Parameters
+    ----------
+    pipeline: Pipeline (mandatory)
+        the pipeline, with the same nodes as the snapshot one.
+    snapshot: bytes or dict (mandatory)
+        snapshot data, or loaded snapshot.
+    """
+    snapshot = _snapshot(snapshot)
+    names = snapshot["names"]
+    nodes = dict((node.full_name, node) for node in pipeline.all_nodes())
+    missing = [names[node[0]] for node in snapshot["nodes"]
+               if names[node[0]] not in nodes]
+    if missing:
+        raise ValueError("Nodes of the snapshot are missing in the "
+                         "pipeline: {0}".format(", ".join(missing)))
+    node_values = OrderedDict()
+    for node_id, name_id, value in snapshot["values"]:
+        if _not_restored(value):
+            logger.debug("snapshot value of {0} not restored".format(
+                names[name_id]))
+            continue
+        node_values.setdefault(node_id, {})[names[name_id]] = \
+            _decode_value(value)
+    top = pipeline._top_pipeline()
+    top.delay_update_nodes_and_plugs_activation()
+    try:
+        with top.bulk_set():
+            for node_id, values in six.iteritems(node_values):
+                node = nodes[names[snapshot["nodes"][node_id][0]]]
+                proc = getattr(node, "process", node)
+                proc.import_from_dict(values)
+    finally:
+        top.restore_update_nodes_and_plugs_activation()
+
+
+def _snapshot_tables(snapshot):
+    """ Index the tables of a snapshot by names.
+    """
+    names = snapshot["names"]
+    node_names = [names[node[0]] for node in snapshot["nodes"]]
+    nodes = dict((node_names[i], node[1])
+                 for i, node in enumerate(snapshot["nodes"]))
+    plug_names = [(node_names[plug[0]], names[plug[1]])
+                  for plug in snapshot["plugs"]]
+    plugs = dict((plug_names[i], plug[2])
+                 for i, plug in enumerate(snapshot["plugs"]))
+    links = dict(((plug_names[source], plug_names[dest]), weak)
+                 for source, dest, weak in snapshot["links"])
+    values = dict(((node_names[node_id], names[name_id]), value)
+                  for node_id, name_id, value in snapshot["values"])
+    return nodes, plugs, links, values
+
+
+def _flags_differences(names, flags, other_flags):
+    """ Describe the differences of flags.
+    """
+    changed = flags ^ other_flags
+    return ["%s = %s differs from %s" % (name, bool(flags & (1 << bit)),
+                                         bool(other_flags & (1 << bit)))
+            for bit, name in enumerate(names) if changed & (1 << bit)]
+
+
+def diff_pipeline_snapshots(snapshot, other_snapshot):
+    """ Get the differences between two snapshots.
+
+    Parameters
+    ----------
+    snapshot: bytes or dict (mandatory)
+        the reference snapshot data, or loaded snapshot.
+    other_snapshot: bytes or dict (mandatory)
+        the compared snapshot data, or loaded snapshot.
+
+    Returns
+    -------
+    differences: list
+        each element is a human readable string explaining one difference
+        (e.g. 'node "my_process" is missing'), empty if the snapshots are
+        the same.
+    """
+    nodes, plugs, links, values = _snapshot_tables(_snapshot(snapshot))
+    other_nodes, other_plugs, other_links, other_values = _snapshot_tables(
+        _snapshot(other_snapshot))
+    result = []
+    for node_name in sorted(nodes):
+        if node_name not in other_nodes:
+            result.append('node "%s" is missing' % node_name)
+            continue
+        result.extend('in node "%s": %s' % (node_name, difference)
+                      for difference in _flags_differences(
+                          _node_flags, nodes[node_name],
+                          other_nodes[node_name]))
+    result.extend('node "%s" is new' % node_name
+                  for node_name in sorted(set(other_nodes) - set(nodes)))
+    for plug_name in sorted(plugs):
+        if plug_name not in other_plugs:
+            if plug_name[0] in other_nodes:
+                result.append('plug "%s:%s" is missing' % plug_name)
+            continue
+        result.extend('in plug "%s:%s": %s' % (plug_name + (difference, ))
+                      for difference in _flags_differences(
+                          _plug_flags, plugs[plug_name],
+                          other_plugs[plug_name]))
+    result.extend('plug "%s:%s" is new' % plug_name
+                  for plug_name in sorted(set(other_plugs) - set(plugs))
+                  if plug_name[0] in nodes)
+    for link in sorted(links):
+        description = "%s:%s->%s:%s" % (link[0] + link[1])
+        if link not in other_links:
+            result.append('link %s is missing' % description)
+        elif links[link] != other_links[link]:
+            result.append('link %s is%s weak' % (
+                description, ("" if other_links[link] else " not")))
+    result.extend('link %s:%s->%s:%s is new' % (link[0] + link[1])
+                  for link in sorted(set(other_links) - set(links)))
+    for key in sorted(values):
+        if key not in other_values:
+            result.append('value of "%s:%s" is missing' % key)
+        elif values[key] != other_values[key]:
+            result.append('value of "%s:%s" = %r differs from %r'
+                          % (key + (_decode_value(values[key]),
+                                    _decode_value(other_values[key]))))
+    result.extend('value of "%s:%s" is new' % key
+                  for key in sorted(set(other_values) - set(values)))
+    return result
@@ -0,0 +1,343 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Compiled pipeline templates.
+
+Building a pipeline instance runs its :meth:`Pipeline.pipeline_definition`:
+every node process is instantiated through ``get_process_instance``, every
+link is parsed and connected, parameters are exported, and nodes activations
+are computed. A :class:`PipelineTemplate` records the result of this
+construction once (nodes, plugs states, links, exported parameters and
+values), then stamps out new independent pipeline instances by copying these
+tables, without replaying the construction::
+
+    from capsul.pipeline.pipeline_template import PipelineTemplate
+
+    template = PipelineTemplate(study_config.get_process_instance(
+        'my_toolbox.MyPipeline'))
+    for subject in subjects:
+        pipeline = template.instantiate()
+        pipeline.subject = subject
+
+Leaf processes are copied with :func:`clone_process`, which does not call
+their constructor either.
+"""
+
+# System import
+import copy
+import six
+
+# Trait import
+from traits.api import Bool, Trait
+
+# Capsul import
+from capsul.process.process import Process
+from capsul.pipeline.pipeline import Pipeline
+from capsul.pipeline.pipeline_nodes import ProcessNode, Switch
+
+# Soma import
+from soma.sorted_dictionary import SortedDictionary
+from soma.utils.weak_proxy import weak_proxy
+
+
+def clone_process(process, study_config=None, memo=None):
+    """ Get an independent copy of a process, with the same parameters
+    values, without calling its constructor.
+
+    Unlike copy.deepcopy(), traits added to the process instance
+    (Process.add_trait) are preserved. Pipelines are copied through a
+    :class:`PipelineTemplate`. Nipype processes are rebuilt from a copy of
+    their interface, since their traits are synchronized with it.
+
+    Note that trait notification handlers registered on the instance by the
+    process constructor are not reproduced for other processes.
+
+    Parameters
+    ----------
+    process: Process (mandatory)
+        the process to copy.
+    study_config: StudyConfig (optional)
+        the study config of the copy. Default: the one of the copied process,
+        which is shared, not copied.
+    memo: dict (optional)
+        the copy.deepcopy() memo dictionary.
+
+    Returns
+    -------
+    clone: Process
+        the new process instance.
+    """
+    if study_config is None:
+        study_config = process.study_config
+    if memo is None:
+        memo = {}
+    if process.study_config is not None:
+        memo[id(process.study_config)] = study_config
+    if id(process) in memo:
+        return memo[id(process)]
+
+    if isinstance(process, Pipeline):
+        new = PipelineTemplate(process).instantiate(study_config)
+        memo[id(process)] = new
+        return new
+
+    if hasattr(process, "_nipype_interface"):
+        # It is necessary not to import study_config.process_instance at
+        # the module level because of circular dependencies (see
+        # Pipeline.add_process)
+        from capsul.study_config.process_instance import get_process_instance
+        new = get_process_instance(
+            copy.deepcopy(process._nipype_interface, memo),
+            study_config=study_config)
+        memo[id(process)] = new
+        for name in process.user_traits():
+            value = getattr(process, name)
+            if getattr(new, name) != value:
+                setattr(new, name, copy.deepcopy(value, memo))
+        return new
+
+    # Processes stored in attributes (the iterated process of a
+    # ProcessIteration for instance) would lose their instance traits in a
+    # plain deep copy
+    for value in six.itervalues(process.__dict__):
+        if isinstance(value, Process):
+            clone_process(value, study_config, memo)
+
+    cls = process.__class__
+    new = cls.__new__(cls)
+    memo[id(process)] = new
+    new._init_trait_listeners()
+    # Controller user traits are instance traits, in the user order
+    new._user_traits = SortedDictionary()
+    for name in process.user_traits():
+        new.add_trait(name, new._clone_trait(process.trait(name)))
+    new.copy_traits(process, traits=[
+                        name for name in process.copyable_trait_names()
+                        if name != "_user_traits"],
+                    memo=memo, copy="deep")
+    new._post_init_trait_listeners()
+    new.traits_init()
+    new.traits_inited(True)
+    return new
+
+
+class PipelineTemplate(object):
+    """ Compiled form of a pipeline instance, used to create new instances
+    without running the pipeline construction.
+
+    The template is a snapshot: later modifications of the source pipeline
+    are not reflected in the instances. Pipelines adding nodes or links
+    outside of :meth:`Pipeline.pipeline_definition` (in their constructor
+    for instance) are not supported.
+
+    Attributes
+    ----------
+    `pipeline_class`: class
+        the class of the compiled pipeline.
+    `study_config`: StudyConfig
+        the default study config of instances.
+
+    Methods
+    -------
+    instantiate
+    """
+
+    def __init__(self, pipeline):
+        """ Compile a pipeline instance.
+
+        Parameters
+        ----------
+        pipeline: Pipeline (mandatory)
+            the constructed pipeline to record.
+        """
+        self.pipeline_class = pipeline.__class__
+        self.study_config = pipeline.study_config
+        # (name, kind, prototype, node state) for each node, in the pipeline
+        # order
+        self._nodes = []
+        # (name, trait, value) of the pipeline parameters
+        self._parameters = []
+        # (source node, source plug, dest node, dest plug, weak link)
+        self._links = []
+
+        for node_name, node in six.iteritems(pipeline.nodes):
+            if node_name == "":
+                continue
+            if isinstance(node, Switch):
+                prototype = (
+                    list(node._switch_values), list(node._outputs),
+                    [Trait(node.trait(name)) for name in node._outputs],
+                    [(name, copy.deepcopy(getattr(node, name)))
+                     for name in node.plugs])
+                self._nodes.append(
+                    (node_name, "switch", prototype, self._node_state(node)))
+            elif isinstance(node.process, Pipeline):
+                self._nodes.append(
+                    (node_name, "pipeline", PipelineTemplate(node.process),
+                     self._node_state(node)))
+            else:
+                self._nodes.append(
+                    (node_name, "process",
+                     (clone_process(node.process), dict(node.kwargs)),
+                     self._node_state(node)))
+
+        for name in pipeline.pipeline_node.plugs:
+            self._parameters.append(
+                (name, Trait(pipeline.trait(name)),
+                 copy.deepcopy(getattr(pipeline, name))))
+        self._pipeline_state = self._node_state(pipeline.pipeline_node)
+
+        # the pipeline links index only holds this pipeline level links
+        for node_name, plugs in six.iteritems(pipeline._links_out):
+            for plug_name, links in six.iteritems(plugs):
+                for (dest_node_name, dest_plug_name), weak_link \
+                        in six.iteritems(links):
+                    self._links.append((node_name, plug_name, dest_node_name,
+                                        dest_plug_name, weak_link))
+
+        self._do_not_export = set(pipeline.do_not_export)
+        self._node_position = dict(pipeline.node_position)
+        self._attributes = copy.deepcopy(pipeline.attributes)
+        self._steps = []
+        steps = getattr(pipeline, "pipeline_steps", None)
+        if steps is not None:
+            for step_name in steps.user_traits():
+                self._steps.append(
+                    (step_name, list(steps.trait(step_name).nodes),
+                     getattr(steps, step_name)))
+        self._selections = copy.deepcopy(
+            getattr(pipeline, "processes_selection", None))
+
+    @staticmethod
+    def _node_state(node):
+        """ Get the activation state of a node and its plugs.
+        """
+        return ((node.enabled, node.activated, node.node_type),
+                [(plug_name, (plug.enabled, plug.activated, plug.optional,
+                              plug.has_default_value))
+                 for plug_name, plug in six.iteritems(node.plugs)])
+
+    def instantiate(self, study_config=None, **kwargs):
+        """ Create a new pipeline instance from the template.
+
+        Parameters
+        ----------
+        study_config: StudyConfig (optional)
+            the study config of the new pipeline. Default: the study config
+            of the compiled pipeline.
+        kwargs: dict
+            parameters passed to the pipeline constructor.
+
+        Returns
+        -------
+        pipeline: Pipeline
+            the new pipeline instance.
+        """
+        if study_config is None:
+            study_config = self.study_config
+        cls = self.pipeline_class
+        pipeline = cls.__new__(cls)
+        # Pipeline.__init__ calls _build() instead of pipeline_definition()
+        pipeline._pipeline_template = (self, study_config)
+        pipeline.__init__(**kwargs)
+        return pipeline
+
+    def _build(self, pipeline, study_config):
+        """ Fill a pipeline being constructed with the recorded nodes, links
+        and states. Called by the Pipeline constructor.
+        """
+        pipeline.study_config = study_config
+
+        # Nodes
+        for node_name, kind, prototype, state in self._nodes:
+            if kind == "switch":
+                inputs, outputs, output_types, values = prototype
+                node = Switch(pipeline, node_name, list(inputs),
+                              list(outputs),
+                              output_types=[Trait(t) for t in output_types])
+                pipeline.nodes[node_name] = node
+                for name, value in values:
+                    setattr(node, name, copy.deepcopy(value))
+                pipeline._set_subprocess_context_name(node, node_name)
+                self._set_node_state(node, state)
+                continue
+            if kind == "pipeline":
+                process = prototype.instantiate(study_config)
+                node = process.pipeline_node
+                node.name = node_name
+                node.pipeline = pipeline
+                process.parent_pipeline = weak_proxy(pipeline)
+            else:
+                process = clone_process(prototype[0], study_config)
+                node = ProcessNode(pipeline, node_name, process,
+                                   **prototype[1])
+            pipeline._set_subprocess_context_name(process, node_name)
+            pipeline.nodes[node_name] = node
+            self._set_node_state(node, state)
+            pipeline.nodes_activation.add_trait(node_name, Bool)
+            setattr(pipeline.nodes_activation, node_name, node.enabled)
+            pipeline.nodes_activation.on_trait_change(
+                pipeline._set_node_enabled, node_name)
+            pipeline.list_process_in_pipeline.append(process)
+
+        # Exported parameters
+        for name, trait, value in self._parameters:
+            if name not in pipeline.pipeline_node.plugs:
+                pipeline.add_trait(name, Trait(trait))
+            pipeline.set_parameter(name, copy.deepcopy(value))
+        self._set_node_state(pipeline.pipeline_node, self._pipeline_state)
+
+        # Links: values are already consistent, only connect the nodes
+        for (source_node_name, source_plug_name, dest_node_name,
+             dest_plug_name, weak_link) in self._links:
+            source_node = pipeline.nodes[source_node_name]
+            dest_node = pipeline.nodes[dest_node_name]
+            pipeline._add_plug_link(source_node_name, source_plug_name,
+                                    dest_node_name, dest_plug_name, weak_link)
+            if (isinstance(dest_node, ProcessNode) and
+                    isinstance(source_node, ProcessNode)):
+                source_trait = source_node.process.trait(source_plug_name)
+                dest_trait = dest_node.process.trait(dest_plug_name)
+                if source_trait.output and not dest_trait.output:
+                    dest_trait.connected_output = True
+            if isinstance(dest_node, Switch):
+                dest_node.trait(dest_plug_name).desc = \
+                    source_node.get_trait(source_plug_name).desc
+            source_node.connect(source_plug_name, dest_node, dest_plug_name)
+            dest_node.connect(dest_plug_name, source_node, source_plug_name)
+
+        # Pipeline attributes
+        pipeline.do_not_export = set(self._do_not_export)
+        pipeline.node_position = dict(self._node_position)
+        pipeline.attributes = copy.deepcopy(self._attributes)
+        for step_name, nodes, enabled in self._steps:
+            pipeline.add_pipeline_step(step_name, nodes, enabled)
+        if self._selections is not None:
+            # selection parameters and nodes states are already restored
+            pipeline.processes_selection = copy.deepcopy(self._selections)
+            for selection_name in self._selections:
+                pipeline.on_trait_change(
+                    pipeline._change_processes_selection, selection_name)
+
+    @staticmethod
+    def _set_node_state(node, state):
+        """ Restore the activation state recorded by _node_state().
+        """
+        (enabled, activated, node_type), plugs_state = state
+        node.enabled = enabled
+        node.activated = activated
+        node.node_type = node_type
+        for plug_name, (plug_enabled, plug_activated, optional,
+                        has_default_value) in plugs_state:
+            plug = node.plugs[plug_name]
+            plug.enabled = plug_enabled
+            plug.activated = plug_activated
+            plug.optional = optional
+            plug.has_default_value = has_default_value
+            if isinstance(node, ProcessNode):
+                node.process.trait(plug_name).hidden = not plug_activated
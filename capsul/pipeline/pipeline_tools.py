@@ -15,6 +15,8 @@ import tempfile
 import subprocess
 import six
 import sys
+from collections import deque
+from itertools import chain
 
 # Define the logger
 logger = logging.getLogger(__name__)
@@ -27,8 +29,9 @@ except ImportError:
 
 # Capsul import
 from capsul.pipeline.pipeline import Pipeline, PipelineNode, Switch, \
-    ProcessNode
+    ProcessNode, _plug_value_origin
 from capsul.pipeline.process_iteration import ProcessIteration
+from capsul.utils.file_probe import FileProbe
 from soma.controller import Controller
 
 if sys.version_info[0] >= 3:
@@ -490,7 +493,51 @@ def save_dot_image(pipeline, filename, nodes_sizes={}, use_nodes_pos=False,
     os.unlink(dot_filename)
 
 
-def disable_runtime_steps_with_existing_outputs(pipeline):
+def _leaf_nodes(pipeline, recursive, skip_node):
+    ''' List the process nodes of a pipeline, parsing sub-pipelines if
+    recursive is set.
+
+    Returns
+    -------
+    nodes: list
+        (node_name, node) pairs, node names of sub-pipeline nodes being
+        prefixed with their parents names. Nodes for which skip_node(node_name,
+        node) is True are not listed, nor parsed.
+    '''
+    leaf_nodes = []
+    nodes = deque(pipeline.nodes.items())
+    while nodes:
+        node_name, node = nodes.popleft()
+        if node_name == '' or not hasattr(node, 'process'):
+            # main pipeline node, switch...
+            continue
+        if skip_node(node_name, node):
+            continue
+        process = node.process
+        if recursive and isinstance(process, Pipeline):
+            nodes.extend([('%s.%s' % (node_name, new_name), new_node)
+                          for new_name, new_node
+                              in six.iteritems(process.nodes)
+                          if new_name != ''])
+            continue
+        leaf_nodes.append((node_name, node))
+    return leaf_nodes
+
+
+def _prefetch_plugs(probe, nodes, select_plug):
+    ''' List the directories of the files values of the nodes plugs for
+    which select_plug(plug, trait) is True.
+    '''
+    paths = []
+    for node_name, node in nodes:
+        process = node.process
+        for plug_name, plug in six.iteritems(node.plugs):
+            if select_plug(plug, process.trait(plug_name)):
+                paths.append(getattr(process, plug_name))
+    probe.prefetch(paths)
+
+
+def disable_runtime_steps_with_existing_outputs(pipeline, probe=None):
     '''
     Disable steps in a pipeline which outputs contain existing files. This
     disabling is the "runtime steps disabling" one (see
@@ -503,8 +550,22 @@ def disable_runtime_steps_with_existing_outputs(pipeline):
     ----------
     pipeline: Pipeline (mandatory)
         pipeline to disbale nodes in.
+    probe: FileProbe (optional)
+        the probe checking files existence. Default: a new one.
     '''
+    if probe is None:
+        probe = FileProbe()
     steps = getattr(pipeline, 'pipeline_steps', Controller())
+    step_nodes = []
+    for step, trait in six.iteritems(steps.user_traits()):
+        if getattr(steps, step):
+            step_nodes += [(node_name, pipeline.nodes[node_name])
+                           for node_name in trait.nodes
+                           if hasattr(pipeline.nodes[node_name], 'process')]
+    _prefetch_plugs(
+        probe, step_nodes,
+        lambda plug, trait: trait.output and isinstance(
+            trait.trait_type, (traits.File, traits.Directory)))
     for step, trait in six.iteritems(steps.user_traits()):
         if not getattr(steps, step):
             continue  # already inactive
@@ -519,7 +580,7 @@ def disable_runtime_steps_with_existing_outputs(pipeline):
                         or isinstance(trait.trait_type, traits.Directory)):
                     value = getattr(process, param)
                     if value is not None and value is not traits.Undefined \
-                            and os.path.exists(value):
+                            and probe.exists(value):
                         # check special case when the output is also an input
                         # (of the same node)
                         disable = True
@@ -542,7 +603,8 @@ def disable_runtime_steps_with_existing_outputs(pipeline):
 
 
 def nodes_with_existing_outputs(pipeline, exclude_inactive=True,
-                                recursive=False, exclude_inputs=True):
+                                recursive=False, exclude_inputs=True,
+                                probe=None):
     '''
     Checks nodes in a pipeline which outputs contain existing files on the
     filesystem. Such nodes, maybe, should not run again. Only nodes which
@@ -570,6 +632,9 @@ def nodes_with_existing_outputs(pipeline, exclude_inactive=True,
         inputs will not be listed in the existing outputs, so that they will
         not be erased by a cleaning operation, and will not prevent execution
         of these nodes.
+    probe: FileProbe (optional)
+        the probe checking files existence, which may be shared with other
+        checks of the same pipeline state. Default: a new one.
 
     Returns
     -------
@@ -577,29 +642,26 @@ def nodes_with_existing_outputs(pipeline, exclude_inactive=True,
         keys: node names
         values: list of pairs (param_name, file_name)
     '''
+    if probe is None:
+        probe = FileProbe()
     selected_nodes = {}
+    disabled_nodes = set()
     if exclude_inactive:
         steps = getattr(pipeline, 'pipeline_steps', Controller())
-        disabled_nodes = set()
         for step, trait in six.iteritems(steps.user_traits()):
             if not getattr(steps, step):
                 disabled_nodes.update(trait.nodes)
 
-    nodes = pipeline.nodes.items()
-    while nodes:
-        node_name, node = nodes.pop(0)
-        if node_name == '' or not hasattr(node, 'process'):
-            # main pipeline node, switch...
-            continue
-        if not node.enabled or not node.activated \
-                or (exclude_inactive and node_name in disabled_nodes):
-            continue
+    nodes = _leaf_nodes(
+        pipeline, recursive,
+        lambda node_name, node: not node.enabled or not node.activated
+            or node_name in disabled_nodes)
+    _prefetch_plugs(
+        probe, nodes,
+        lambda plug, trait: isinstance(
+            trait.trait_type, (traits.File, traits.Directory, traits.Any)))
+    for node_name, node in nodes:
         process = node.process
-        if recursive and isinstance(process, Pipeline):
-            nodes += [('%s.%s' % (node_name, new_name), new_node)
-                      for new_name, new_node in six.iteritems(process.nodes)
-                      if new_name != '']
-            continue
         plug_list = []
         input_files_list = set()
         for plug_name, plug in six.iteritems(node.plugs):
@@ -609,7 +671,7 @@ def nodes_with_existing_outputs(pipeline, exclude_inactive=True,
                     or isinstance(trait.trait_type, traits.Any):
                 value = getattr(process, plug_name)
                 if isinstance(value, basestring) \
-                        and os.path.exists(value) \
+                        and probe.exists(value) \
                         and value not in input_files_list:
                     if plug.output:
                         plug_list.append((plug_name, value))
@@ -624,7 +686,7 @@ def nodes_with_existing_outputs(pipeline, exclude_inactive=True,
     return selected_nodes
 
 
-def nodes_with_missing_inputs(pipeline, recursive=True):
+def nodes_with_missing_inputs(pipeline, recursive=True, probe=None):
     '''
     Checks nodes in a pipeline which inputs contain invalid inputs.
     Inputs which are files non-existing on the filesystem (so, which cannot
@@ -641,6 +703,9 @@ def nodes_with_missing_inputs(pipeline, recursive=True):
         that if not set, a pipeline is regarded as a process, but pipelines may
         not use all their inputs/outputs so the result might be inaccurate.
         Default: True
+    probe: FileProbe (optional)
+        the probe checking files existence, which may be shared with other
+        checks of the same pipeline state. Default: a new one.
 
     Returns
     -------
@@ -648,6 +713,8 @@ def nodes_with_missing_inputs(pipeline, recursive=True):
         keys: node names
         values: list of pairs (param_name, file_name)
     '''
+    if probe is None:
+        probe = FileProbe()
     selected_nodes = {}
     steps = getattr(pipeline, 'pipeline_steps', Controller())
     disabled_nodes = set()
@@ -656,20 +723,16 @@ def nodes_with_missing_inputs(pipeline, recursive=True):
             disabled_nodes.update(
                 [pipeline.nodes[node_name] for node_name in trait.nodes])
 
-    nodes = pipeline.nodes.items()
-    while nodes:
-        node_name, node = nodes.pop(0)
-        if node_name == '' or not hasattr(node, 'process'):
-            # main pipeline node, switch...
-            continue
-        if not node.enabled or not node.activated or node in disabled_nodes:
-            continue
+    nodes = _leaf_nodes(
+        pipeline, recursive,
+        lambda node_name, node: not node.enabled or not node.activated
+            or node in disabled_nodes)
+    _prefetch_plugs(
+        probe, nodes,
+        lambda plug, trait: not plug.output and isinstance(
+            trait.trait_type, (traits.File, traits.Directory)))
+    for node_name, node in nodes:
         process = node.process
-        if recursive and isinstance(process, Pipeline):
-            nodes += [('%s.%s' % (node_name, new_name), new_node)
-                      for new_name, new_node in six.iteritems(process.nodes)
-                      if new_name != '']
-            continue
         for plug_name, plug in six.iteritems(node.plugs):
             if not plug.output:
                 trait = process.trait(plug_name)
@@ -678,10 +741,11 @@ def nodes_with_missing_inputs(pipeline, recursive=True):
                     value = getattr(process, plug_name)
                     keep_me = False
                     if value is None or value is traits.Undefined \
-                            or value == '' or not os.path.exists(value):
+                            or value == '' or not probe.exists(value):
                         # check where this file comes from
                         origin_node, origin_param, origin_parent \
-                            = where_is_plug_value_from(plug, recursive)
+                            = where_is_plug_value_from(plug, recursive,
+                                                       pipeline)
                         if origin_node is not None \
                                 and (origin_node in disabled_nodes
                                      or origin_parent in disabled_nodes):
@@ -706,7 +770,7 @@ def nodes_with_missing_inputs(pipeline, recursive=True):
     return selected_nodes
 
 
-def where_is_plug_value_from(plug, recursive=True):
+def where_is_plug_value_from(plug, recursive=True, pipeline=None):
     '''
     Find where the given (input) plug takes its value from.
     It has to be the output of an uphill process, or be unconnected.
@@ -722,6 +786,11 @@ def where_is_plug_value_from(plug, recursive=True):
         that if not set, a pipeline is regarded as a process, but pipelines may
         not use all their inputs/outputs so the result might be inaccurate.
         Default: True
+    pipeline: Pipeline (optional)
+        the pipeline containing the plug node. If given, the origin is looked
+        up in the provenance index of the pipeline (see
+        Pipeline.plug_value_origin()), which is much faster when many plugs
+        of the same pipeline state are queried. Otherwise links are walked.
 
     Returns
     -------
@@ -735,35 +804,72 @@ def where_is_plug_value_from(plug, recursive=True):
         origin node is in a runtime pipeline step, which only records top-level
         nodes.
     '''
-    links = [link + (None, ) for link in plug.links_from]
-    while links:
-        node_name, param_name, node, in_plug, weak, parent = links.pop(0)
-        if not node.activated or not node.enabled:
-            # disabled nodes are not influencing
-            continue
-        if isinstance(node, Switch):
-            # recover through switch input
-            switch_value = node.switch
-            switch_input = '%s_switch_%s' % (switch_value, param_name)
-            in_plug = node.plugs[switch_input]
-            links += [link + (parent, ) for link in in_plug.links_from]
-        elif recursive and isinstance(node, PipelineNode):
-            # either output from a sibling sub_pipeline
-            # or input from parent pipeline
-            # but it is handled the same way.
-            # check their inputs
-            # just if sibling, keep them as parent
-            if in_plug.output and parent is None:
-                new_parent = node
-            else:
-                new_parent = parent
-            links += [link + (new_parent, ) for link in in_plug.links_from]
-        else:
-            # output of a process: found it
-            # in non-recursive mode, a pipeline is regarded as a process.
-            return node, param_name, parent
-    # not found
-    return None, None, None
+    if pipeline is not None:
+        return pipeline.plug_value_origin(plug, recursive)
+    return _plug_value_origin(plug, recursive)
+
+def _pipeline_state_values(pipeline):
+    '''
+    Iterate over the nodes of a pipeline, breadth first, with the parameters
+    values which make the pipeline state.
+
+    A value is only kept for the first plug of each group of linked plugs,
+    the other ones being set through links. Switches outputs are filtered
+    out: they should rather be set via their inputs.
+
+    Parameters
+    ----------
+    pipeline: Pipeline instance
+        pipeline to get values from
+
+    Returns
+    -------
+    nodes: generator
+        (names, node, process, values) tuples: names is the list of node
+        names from the pipeline to the node (empty for the pipeline itself),
+        process the node process (the node itself for switches), values the
+        dict of its kept parameters values.
+    '''
+    seen_plugs = set()
+
+    def new_component(node, plug):
+        # mark the plugs linked to plug as seen, and tell if plug is allowed
+        # to record the value of this group of linked plugs
+        if plug in seen_plugs:
+            return False
+        seen_plugs.add(plug)
+        allowed = True
+        todo = deque([plug])
+        while todo:
+            plug = todo.popleft()
+            # switches outputs should not be set (they will be through their
+            # inputs)
+            if plug.output and isinstance(node, Switch):
+                allowed = False
+            for link in chain(plug.links_from, plug.links_to):
+                if link[3] not in seen_plugs:
+                    seen_plugs.add(link[3])
+                    todo.append(link[3])
+        return allowed
+
+    nodes = deque([([], pipeline.pipeline_node)])
+    while nodes:
+        names, node = nodes.popleft()
+        proc = node
+        if hasattr(node, 'process'):
+            proc = node.process
+        node_dict = proc.export_to_dict()
+        # filter out forbidden and already used plugs
+        for plug_name, plug in six.iteritems(node.plugs):
+            if not new_component(node, plug):
+                del node_dict[plug_name]
+        yield names, node, proc, node_dict
+        if hasattr(proc, 'nodes'):
+            nodes.extend((names + [child_node_name], child_node)
+                         for child_node_name, child_node
+                         in six.iteritems(proc.nodes)
+                         if child_node_name != '')
+
 
 def dump_pipeline_state_as_dict(pipeline):
     '''
@@ -773,7 +879,9 @@ def dump_pipeline_state_as_dict(pipeline):
     The returned dict may contain sub-pipelines state also.
 
     The dict may be saved, and used to restore a pipeline state, using
-    :py:func:`set_pipeline_state_from_dict`.
+    :py:func:`set_pipeline_state_from_dict`. Snapshots of
+    :py:mod:`capsul.pipeline.pipeline_snapshot` are more compact, for
+    large pipelines.
 
     Note that
 :py:meth:`pipeline.export_to_dict <soma.controller.controller.export_to_dict>`
@@ -789,60 +897,6 @@ def dump_pipeline_state_as_dict(pipeline):
     state_dict: dict
         pipeline state
     '''
-    def should_keep_value(node, plug, components):
-        '''
-        Tells if a plug has already been taken into account in the plugs graph.
-
-        Also filters out switches outputs, which should rather be set via their
-        inputs.
-
-        To do so, a connected components map has to be built for the plugs
-        graph, which is done is a semi-lazy way in components.
-
-        Parameters
-        ----------
-        node: Node
-            pipeline node the pluge belongs to
-        plug: Plug
-            the plug to test
-        components: list of sets of plugs
-            connected components will be added to this components list.
-
-        Returns
-        -------
-        True if the plug value is a "new" one and should be recorded in the
-        pipeline state. Otherwise it should be discarded (set from another
-        connected plug).
-        '''
-        def _component(plug, components):
-            for comp in components:
-                if plug in comp:
-                    return comp
-            return None
-
-        comp = _component(plug, components)
-        if comp:
-            # already done
-            return False
-        comp = set()
-        todo = []
-        todo.append(plug)
-        allowed = True
-        # propagate
-        while todo:
-            plug = todo.pop(0)
-            comp.add(plug)
-            # switches outputs should not be set (they will be through their
-            # inputs)
-            if plug.output and isinstance(node, Switch):
-                allowed = False
-            todo += [link[3] for link in plug.links_from
-                     if link[3] not in comp]
-            todo += [link[3] for link in plug.links_to
-                     if link[3] not in comp]
-        components.append(comp)
-        return allowed
-
     def prune_empty_dicts(state_dict):
         '''
         Remove empty dictionaries, and nodes containing empty dicts in pipeline
@@ -874,31 +928,13 @@ def dump_pipeline_state_as_dict(pipeline):
                 todo.append((current_dict, parent, parent_key, False))
 
     state_dict = {}
-    nodes = [(None, pipeline.pipeline_node, state_dict)]
-    components = []
-    while nodes:
-        node_name, node, current_dict = nodes.pop(0)
-        proc = node
-        if hasattr(node, 'process'):
-            proc = node.process
-        node_dict = proc.export_to_dict()
-        # filter out forbidden and already used plugs
-        for plug_name, plug in six.iteritems(node.plugs):
-            if not should_keep_value(node, plug, components):
-                del node_dict[plug_name]
-        if node_name is None:
-            if len(node_dict) != 0:
-                current_dict['state'] = node_dict
-            child_dict = current_dict
-        else:
-            child_dict = {}
-            current_dict.setdefault('nodes', {})[node_name] = child_dict
-            if len(node_dict) != 0:
-                child_dict['state'] = node_dict
-        if hasattr(proc, 'nodes'):
-            nodes += [(child_node_name, child_node, child_dict)
-                      for child_node_name, child_node
-                      in six.iteritems(proc.nodes) if child_node_name != '']
+    for names, node, proc, node_dict in _pipeline_state_values(pipeline):
+        current_dict = state_dict
+        for node_name in names:
+            current_dict = current_dict.setdefault('nodes', {}).setdefault(
+                node_name, {})
+        if len(node_dict) != 0:
+            current_dict['state'] = node_dict
 
     prune_empty_dicts(state_dict)
     return state_dict
@@ -18,17 +18,19 @@ import socket
 import sys
 import six
 
-import soma_workflow.client as swclient
-
 from capsul.pipeline.pipeline import Pipeline, Switch
 from capsul.pipeline import pipeline_tools
 from capsul.process.process import Process
 from capsul.pipeline.topological_sort import Graph
+from capsul.pipeline.pipeline_scheduling import (
+    workflow_dependencies, critical_path_lengths, critical_path_priorities)
 from traits.api import Directory, Undefined, File, Str, Any, List
 from soma.sorted_dictionary import OrderedDict
 from .process_iteration import ProcessIteration
 from capsul.attributes import completion_engine_iteration
 from capsul.attributes.completion_engine import ProcessCompletionEngine
+from capsul.study_config.worker_pool import runs_in_workers
+from capsul.study_config.run_monitor import monitored_step
 
 
 if sys.version_info[0] >= 3:
@@ -41,7 +43,8 @@ else:
 
 
 def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
-                           jobs_priority=0, create_directories=True):
+                           jobs_priority=0, create_directories=True,
+                           cost_model=None, iterations=None, monitor=None):
     """ Create a soma-workflow workflow from a Capsul Pipeline
 
     Parameters
@@ -65,12 +68,44 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
     create_directories: bool (optional, default: True)
         if set, needed output directories (which will contain output files)
         will be created in a first job, which all other ones depend on.
+    cost_model: CostModel (optional)
+        if set, jobs priorities are assigned from the critical path of the
+        pipeline workflow graph, the costs of processes being estimated by
+        this model (see capsul.pipeline.pipeline_scheduling): jobs starting
+        the costliest chains get the highest priorities, the shortest chains
+        keeping jobs_priority.
+    iterations: dict (optional)
+        {ProcessIteration: sequence of iteration indices}: only generate the
+        jobs of these iterations for the given iterative processes, other
+        iterative processes being fully expanded. See
+        workflows_from_iteration() to build the workflow of a large
+        iteration in batches.
+    monitor: RunMonitor (optional)
+        receives the 'workflow' events of the generation, a 'progress' event
+        being sent for each job. The generation raises RunCancelled before
+        the next job once the monitor is cancelled.
 
     Returns
     -------
     workflow: Workflow
         a soma-workflow workflow
     """
+    with monitored_step(monitor, "workflow", pipeline.id) as generation:
+        workflow = _workflow_from_pipeline(
+            pipeline, study_config, disabled_nodes, jobs_priority,
+            create_directories, cost_model, iterations, monitor)
+        generation["jobs"] = len(workflow.jobs)
+    return workflow
+
+
+def _workflow_from_pipeline(pipeline, study_config, disabled_nodes,
+                            jobs_priority, create_directories, cost_model,
+                            iterations, monitor):
+    """ Build the workflow of workflow_from_pipeline(), without the
+    'workflow' step events.
+    """
+    # soma-workflow is only loaded when a workflow is built
+    import soma_workflow.client as swclient
 
     class TempFile(str):
         # class needed temporary to identify temporary paths in the pipeline.
@@ -239,6 +274,10 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
         job_name = name
         if not job_name:
             job_name = process.name
+        if monitor is not None:
+            monitor.check()
+            monitor.emit("progress", "workflow", job_name)
+        priority = job_priorities.get(process, priority)
 
         # check for special modified paths in parameters
         input_replaced_paths = []
@@ -269,8 +308,16 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
                         _translated_path(value, shared_map, shared_paths,
                                         parameter)
 
-        # Get the process command line
-        process_cmdline = process.get_commandline()
+        # Get the process command line, submitting the process to a served
+        # worker pool if there is one
+        worker_address = getattr(study_config, "worker_pool_address",
+                                 Undefined)
+        if worker_address not in (Undefined, None, "") \
+                and runs_in_workers(process):
+            process_cmdline = process.get_commandline(
+                worker_address=worker_address)
+        else:
+            process_cmdline = process.get_commandline()
         # and replace in commandline
         iproc_transfers = transfers[0].get(process, {})
         oproc_transfers = transfers[1].get(process, {})
@@ -610,7 +657,7 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
             temp_subst_map = dict(temp_subst_list)
             temp_subst_map.update(temp_map)
             try:
-                graph = process.workflow_graph()
+                graph = iteration_graph(process)
                 (jobs, dependencies, groups, sub_root_jobs) = \
                     workflow_from_graph(
                         graph, temp_subst_map, shared_map, transfers,
@@ -640,6 +687,22 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
 
         return (jobs, dependencies, groups, root_jobs)
 
+    def iteration_graph(process):
+        '''
+        Get the workflow graph of an iterated pipeline.
+
+        All iterations share the same graph, built once, as long as the
+        parameters of an iteration do not change the links or activations of
+        the pipeline (the graph nodes hold the processes, whose parameters
+        are read when jobs are built).
+        '''
+        stamp = process._top_pipeline()._provenance_stamp
+        graph_stamp, graph = iteration_graphs.get(process, (None, None))
+        if graph_stamp != stamp:
+            graph = process.workflow_graph()
+            iteration_graphs[process] = (stamp, graph)
+        return graph
+
     def build_iteration(it_process, step_name, temp_map,
                         shared_map, transfers, shared_paths, disabled_nodes,
                         remove_temp, steps, study_config={}):
@@ -739,21 +802,12 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
             for parameter, value in six.iteritems(outputs):
                 setattr(it_process, parameter, value)
         else:
-            for iteration in xrange(size):
-                for parameter in it_process.iterative_parameters:
-                    setattr(it_process.process, parameter,
-                            getattr(it_process, parameter)[iteration])
-
-                # operate completion
-                complete_iteration(it_process, iteration)
-
-                process_name = it_process.process.name + '_%d' % iteration
+            for iteration, sub_workflow in iteration_sub_workflows(
+                    it_process, size, step_name, temp_map, shared_map,
+                    transfers, shared_paths, disabled_nodes, remove_temp,
+                    steps, study_config):
                 (sub_jobs, sub_dependencies, sub_groups, sub_root_jobs) = \
-                    iter_to_workflow(it_process.process, process_name,
-                        step_name,
-                        temp_map, shared_map, transfers,
-                        shared_paths, disabled_nodes, remove_temp, steps,
-                        study_config, iteration)
+                    sub_workflow
                 jobs.update(dict([((p, iteration), j)
                                   for p, j in six.iteritems(sub_jobs)]))
                 dependencies.update(sub_dependencies)
@@ -762,6 +816,38 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
 
         return (jobs, dependencies, groups, root_jobs)
 
+    def iteration_sub_workflows(it_process, size, step_name, temp_map,
+                                shared_map, transfers, shared_paths,
+                                disabled_nodes, remove_temp, steps,
+                                study_config):
+        '''
+        Generate the workflow of each iteration step of an iterative process,
+        one at a time: parameters are set and completed on the iterated
+        process just before its step workflow is built.
+
+        Only iterations listed in the iterations parameter of
+        workflow_from_pipeline() are generated, if the process is there.
+
+        Yields
+        ------
+        (iteration, (jobs, dependencies, groups, root_jobs))
+        '''
+        process_iterations = iterations.get(it_process)
+        if process_iterations is None:
+            process_iterations = xrange(size)
+        for iteration in process_iterations:
+            for parameter in it_process.iterative_parameters:
+                setattr(it_process.process, parameter,
+                        getattr(it_process, parameter)[iteration])
+
+            # operate completion
+            complete_iteration(it_process, iteration)
+
+            process_name = it_process.process.name + '_%d' % iteration
+            yield iteration, iter_to_workflow(
+                it_process.process, process_name, step_name, temp_map,
+                shared_map, transfers, shared_paths, disabled_nodes,
+                remove_temp, steps, study_config, iteration)
 
     def complete_iteration(it_process, iteration):
         completion_engine = ProcessCompletionEngine.get_completion_engine(
@@ -975,6 +1061,11 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
     for format, values in six.iteritems(formats):
         merged_formats.update(values)
 
+    if iterations is None:
+        iterations = {}
+    # {iterated pipeline: (provenance stamp, workflow graph)}
+    iteration_graphs = {}
+
     if not isinstance(pipeline, Pipeline):
         # "pipeline" is actally a single process (or should, if it is not a
         # pipeline). Get it into a pipeine (with a single node) to make the
@@ -1019,10 +1110,18 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
     # Get a graph
     try:
         graph = pipeline.workflow_graph()
+        job_priorities = {}
+        if cost_model is not None:
+            lengths = critical_path_lengths(workflow_dependencies(graph),
+                                            cost_model)
+            for node, priority in six.iteritems(
+                    critical_path_priorities(lengths, jobs_priority)):
+                job_priorities[node.process] = priority
         (jobs, dependencies, groups, root_jobs) = workflow_from_graph(
             graph, temp_subst_map, shared_map, transfers, swf_paths[1],
             disabled_nodes=disabled_nodes, forbidden_temp=remove_temp,
-            steps=steps, study_config=study_config)
+            jobs_priority=jobs_priority, steps=steps,
+            study_config=study_config)
     finally:
         restore_empty_filenames(temp_map)
 
@@ -1049,6 +1148,49 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
     return workflow
 
 
+def workflows_from_iteration(it_process, batch_size=100, study_config={},
+                             **kwargs):
+    """ Create soma-workflow workflows for an iterative process, by batches
+    of iterations.
+
+    Workflows are generated on demand, so that a batch can be submitted (and
+    its jobs started) before the next one is built, and the jobs of all
+    iterations are never held in memory at the same time. Iterations are
+    independent, so there are no dependencies between batches.
+
+    Parameters
+    ----------
+    it_process: ProcessIteration (mandatory)
+        the iterative process.
+    batch_size: int (optional, default 100)
+        the maximum number of iterations in each workflow.
+    study_config: StudyConfig (optional), or dict
+        see workflow_from_pipeline().
+    kwargs: dict
+        other workflow_from_pipeline() parameters.
+
+    Yields
+    ------
+    iterations: xrange
+        the indices of the iterations of the workflow.
+    workflow: Workflow
+        a soma-workflow workflow running these iterations.
+    """
+    if not isinstance(it_process, ProcessIteration):
+        raise TypeError("Expect a ProcessIteration, got {0}".format(
+            it_process))
+    if batch_size < 1:
+        raise ValueError("batch_size must be positive, got {0}".format(
+            batch_size))
+    size = max([len(getattr(it_process, parameter))
+                for parameter in it_process.iterative_parameters])
+    for start in xrange(0, size, batch_size):
+        batch = xrange(start, min(start + batch_size, size))
+        yield batch, workflow_from_pipeline(
+            it_process, study_config=study_config,
+            iterations={it_process: batch}, **kwargs)
+
+
 def local_workflow_run(workflow_name, workflow):
     """ Create a soma-workflow controller and submit a workflow
 
@@ -1059,8 +1201,35 @@ def local_workflow_run(workflow_name, workflow):
     workflow: Workflow (mandatory)
         the soma-workflow workflow
     """
+    controller, wf_ids = local_workflows_run([(workflow_name, workflow)])
+    return controller, wf_ids[0]
+
+
+def local_workflows_run(workflows):
+    """ Create a soma-workflow controller, submit workflows as they are
+    generated, and wait for all of them
+
+    Parameters
+    ----------
+    workflows: iterable (mandatory)
+        (workflow_name, workflow) pairs. With a generator, such as the one
+        of workflows_from_iteration(), a workflow is submitted (and its jobs
+        started) before the next one is built.
+
+    Returns
+    -------
+    controller: WorkflowController
+        the soma-workflow controller
+    wf_ids: list
+        the ids of the submitted workflows, in submission order
+    """
+    import soma_workflow.client as swclient
+
     localhost = socket.gethostname()
     controller = swclient.WorkflowController(localhost)
-    wf_id = controller.submit_workflow(workflow=workflow, name=workflow_name)
-    swclient.Helper.wait_workflow(wf_id, controller)
-    return controller, wf_id
+    wf_ids = [controller.submit_workflow(workflow=workflow,
+                                         name=workflow_name)
+              for workflow_name, workflow in workflows]
+    for wf_id in wf_ids:
+        swclient.Helper.wait_workflow(wf_id, controller)
+    return controller, wf_ids
@@ -7,20 +7,74 @@
 ##########################################################################
 
 import sys
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import six
-from traits.api import List, Undefined
+from traits.api import List, Undefined, TraitError
 
 from capsul.process.process import Process
+from capsul.pipeline.pipeline import Pipeline
+from capsul.pipeline.pipeline_template import PipelineTemplate, clone_process
 from capsul.study_config.process_instance import get_process_instance
 from capsul.attributes.completion_engine import ProcessCompletionEngine
 
 if sys.version_info[0] >= 3:
     xrange = range
 
+
+class IterationError(Exception):
+    """ Failure of some iterations of a ProcessIteration.
+
+    Attributes
+    ----------
+    `errors`: dict
+        {iteration index: exception} of the failed iterations.
+    `completed`: list of int
+        indices of the iterations which have been executed successfully.
+    """
+    def __init__(self, process, errors, completed):
+        super(IterationError, self).__init__(
+            "{0} iteration(s) of {1} failed:\n{2}".format(
+                len(errors), process.id,
+                "\n".join("  iteration {0}: {1!r}".format(i, errors[i])
+                          for i in sorted(errors))))
+        self.errors = errors
+        self.completed = completed
+
+
+def _run_iteration(iteration, process):
+    """ Run a process copy in a worker, returning the failure (if any)
+    instead of raising.
+    """
+    try:
+        process()
+    except Exception as e:
+        return iteration, process, e
+    return iteration, process, None
+
+
 class ProcessIteration(Process):
+    """ Iterate a process over lists of parameters values.
+
+    Attributes
+    ----------
+    `process`: Process
+        the iterated process.
+    `iterative_parameters`: set
+        the parameters iterated over, which are lists in the iteration.
+    `workers`: int
+        the number of iterations run concurrently. With more than one worker,
+        each iteration is run on its own copy of the iterated process, in a
+        thread. Iterations which have failed are reported in an
+        IterationError raised once all iterations are done, the outputs of
+        the completed ones being set (failed ones get Undefined, or the
+        default value of the list items). 0 or None means one worker per CPU.
+    """
+
     def __init__(self, process, iterative_parameters, study_config=None,
-                 context_name=None):
+                 context_name=None, workers=1):
         super(ProcessIteration, self).__init__()
+        self.workers = workers
 
         if self.study_config is None and hasattr(Process, '_study_config'):
             study_config = Process._study_config
@@ -110,7 +164,12 @@ class ProcessIteration(Process):
 
         for parameter in self.regular_parameters:
             setattr(self.process, parameter, getattr(self, parameter))
-        if no_output_value:
+        workers = self.workers
+        if not workers or workers < 1:
+            workers = multiprocessing.cpu_count()
+        if workers > 1 and size > 1:
+            self._run_concurrent_iterations(size, no_output_value, workers)
+        elif no_output_value:
             for parameter in self.iterative_parameters:
                 trait = self.trait(parameter)
                 if trait.output:
@@ -142,6 +201,87 @@ class ProcessIteration(Process):
                 self.complete_iteration(iteration)
                 self.process()
 
+    def _run_concurrent_iterations(self, size, no_output_value, workers):
+        """ Run iterations concurrently, each on its own process copy.
+
+        Parameters are set, and completed, on the iterated process in the
+        calling thread, then the process is copied and the copies are run
+        by a pool of threads. Outputs are gathered in iterations order.
+        """
+        output_parameters = [parameter
+                             for parameter in self.iterative_parameters
+                             if self.trait(parameter).output]
+        if isinstance(self.process, Pipeline):
+            template = PipelineTemplate(self.process)
+        else:
+            template = None
+        processes = []
+        for iteration in xrange(size):
+            for parameter in self.iterative_parameters:
+                if not no_output_value or parameter not in output_parameters:
+                    setattr(self.process, parameter,
+                            getattr(self, parameter)[iteration])
+            # operate completion
+            self.complete_iteration(iteration)
+            processes.append(self._copy_process(template))
+            if no_output_value:
+                for parameter in output_parameters:
+                    # reset empty value
+                    setattr(self.process, parameter, Undefined)
+
+        errors = {}
+        pool = ThreadPool(min(workers, size))
+        try:
+            for iteration, process, error in pool.imap_unordered(
+                    lambda args: _run_iteration(*args),
+                    enumerate(processes)):
+                if error is not None:
+                    errors[iteration] = error
+        finally:
+            pool.close()
+            pool.join()
+
+        if no_output_value:
+            for parameter in output_parameters:
+                failed_value = self._failed_iteration_value(parameter)
+                setattr(self, parameter,
+                        [failed_value if iteration in errors
+                         else getattr(process, parameter)
+                         for iteration, process in enumerate(processes)])
+        if errors:
+            raise IterationError(
+                self, errors,
+                [i for i in xrange(size) if i not in errors])
+
+    def _failed_iteration_value(self, parameter):
+        """ Get the value set in an output list for a failed iteration:
+        Undefined if the list items accept it, their default value otherwise.
+        """
+        item_trait = self.trait(parameter).inner_traits[0]
+        try:
+            return item_trait.validate(self, parameter, Undefined)
+        except TraitError:
+            return item_trait.default
+
+    def _copy_process(self, template=None):
+        """ Get an independent copy of the iterated process, with the same
+        parameters values.
+
+        Parameters
+        ----------
+        template: PipelineTemplate (optional)
+            the compiled iterated pipeline, to avoid compiling it for each
+            copy.
+        """
+        if template is None:
+            return clone_process(self.process)
+        process = template.instantiate()
+        for name in self.process.pipeline_node.plugs:
+            setattr(process, name, getattr(self.process, name))
+        if hasattr(self.process, 'context_name'):
+            process.context_name = self.process.context_name
+        return process
+
     def set_study_config(self, study_config):
         super(ProcessIteration, self).set_study_config(study_config)
         self.process.set_study_config(study_config)
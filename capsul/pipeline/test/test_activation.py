@@ -8,6 +8,9 @@
 
 from __future__ import print_function
 import unittest
+import tempfile
+import os
+import six
 from traits.api import File, Float
 from capsul.api import Process
 from capsul.api import Pipeline
@@ -96,6 +99,43 @@ class TestPipeline(unittest.TestCase):
         self.pipeline.workflow_ordered_nodes()
         self.assertEqual(self.pipeline.workflow_repr, "")
 
+    def test_incremental_update(self):
+        def activations():
+            return [(node.full_name, plug_name, node.activated,
+                     plug.activated)
+                    for node in self.pipeline.all_nodes()
+                    for plug_name, plug in six.iteritems(node.plugs)]
+
+        for node_name in ("way11", "way12", "way21", "way22"):
+            for enabled in (False, True):
+                setattr(self.pipeline.nodes_activation, node_name, enabled)
+                incremental = activations()
+                self.pipeline.update_nodes_and_plugs_activation()
+                self.assertEqual(incremental, activations())
+        self.pipeline.nodes["way21"].plugs["input_image"].enabled = False
+        incremental = activations()
+        self.pipeline.update_nodes_and_plugs_activation()
+        self.assertEqual(incremental, activations())
+
+    def test_debug_activations(self):
+        record_file = tempfile.mkstemp()
+        os.close(record_file[0])
+        record_file = record_file[1]
+        try:
+            self.pipeline._debug_activations = record_file
+            setattr(self.pipeline.nodes_activation, "way11", False)
+            with open(record_file) as f:
+                record = f.read().split()
+            self.assertEqual(record[0], self.pipeline.id)
+            # the whole pipeline activations are recorded
+            activated = [line.split("+")[1] for line in record[1:]
+                         if "+" in line]
+            self.assertTrue("way21" in activated)
+            self.assertTrue("way22" in activated)
+            self.assertFalse("way11" in activated)
+        finally:
+            os.unlink(record_file)
+
     def run_unactivation_tests_1(self):
         self.assertFalse(self.pipeline.nodes["way11"].activated)
         self.assertFalse(self.pipeline.nodes["way12"].activated)
@@ -235,9 +235,17 @@ class TestPipeline(unittest.TestCase):
              os.path.join(self.directory, 'titi_out'),
              os.path.join(self.directory, 'tete_out')]]
         self.big_pipeline.other_output = [[1.1, 2.1], [3.1, 4.1, 5.1]]
+        # count the graphs built for the iterated pipeline
+        small_pipeline = self.big_pipeline.nodes["main_level"].process.process
+        workflow_graph = small_pipeline.workflow_graph
+        graphs = []
+        small_pipeline.workflow_graph = \
+            lambda: graphs.append(None) or workflow_graph()
         workflow = pipeline_workflow.workflow_from_pipeline(self.big_pipeline)
         # expect 6 + 7 jobs
         self.assertEqual(len(workflow.jobs), 13)
+        # the graph is shared by the iterations
+        self.assertEqual(len(graphs), 1)
         subjects = set()
         for job in workflow.jobs:
             if not job.name.startswith('DummyProcess'):
@@ -79,6 +79,62 @@ class TestPipeline(unittest.TestCase):
         self.pipeline.workflow_ordered_nodes()
         self.assertEqual(self.pipeline.workflow_repr, "")
 
+    def test_links_index(self):
+        pipeline = self.pipeline
+        self.assertEqual(
+            pipeline._links_out["node1"]["output_image"],
+            {("node2", "input_image"): False})
+        self.assertEqual(
+            sorted(pipeline._links_in["node2"]["input_image"]),
+            [("constant", "output_image"), ("node1", "output_image")])
+        pipeline.remove_link("node1.output_image->node2.input_image")
+        self.assertFalse("output_image" in pipeline._links_out["node1"])
+        self.assertEqual(pipeline.nodes["node1"].plugs["output_image"]
+                         .links_to, set())
+        self.assertEqual(
+            list(pipeline._links_in["node2"]["input_image"]),
+            [("constant", "output_image")])
+
+    def test_plug_observer(self):
+        plug = self.pipeline.nodes["node1"].plugs["input_image"]
+        changes = []
+        callback = lambda plug, name, value: changes.append(value)
+        plug.on_trait_change(callback, "enabled")
+        plug.enabled = True
+        plug.enabled = False
+        plug.on_trait_change(callback, "enabled", remove=True)
+        plug.enabled = True
+        self.assertEqual(changes, [False])
+        self.assertRaises(AttributeError, setattr, plug, "other", 1)
+
+    def test_bulk_set(self):
+        node1 = self.pipeline.nodes["node1"].process
+        node2 = self.pipeline.nodes["node2"].process
+        changes = []
+        node1.on_trait_change(lambda value: changes.append(value),
+                              "input_image")
+        with self.pipeline.bulk_set():
+            self.pipeline.input_image = "a.nii"
+            with self.pipeline.bulk_set():
+                self.pipeline.input_image = "b.nii"
+            self.assertEqual(changes, [])
+            self.pipeline.input_image = "c.nii"
+            self.pipeline.other_input = 1.5
+            node1.output_image = "d.nii"
+        self.assertEqual(changes, ["c.nii"])
+        self.assertEqual(node1.other_input, 1.5)
+        self.assertEqual(node2.input_image, "d.nii")
+
+        # the latest assignment of linked plugs wins
+        with self.pipeline.bulk_set():
+            self.pipeline.input_image = "e.nii"
+            node1.input_image = "f.nii"
+        self.assertEqual(self.pipeline.input_image, "f.nii")
+        with self.pipeline.bulk_set():
+            node1.input_image = "g.nii"
+            self.pipeline.input_image = "h.nii"
+        self.assertEqual(node1.input_image, "h.nii")
+
 
 def test():
     """ Function to execute unitest
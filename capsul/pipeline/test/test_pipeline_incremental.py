@@ -0,0 +1,195 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+# Capsul import
+from capsul.api import Process, Pipeline
+from capsul.study_config.study_config import StudyConfig
+from capsul.pipeline.pipeline_incremental import IncrementalState
+from capsul.study_config.test.test_local_scheduler import (
+    TwoBranchesPipeline, CopyProcess, executed, rendez_vous)
+
+# Trait import
+from traits.api import File
+
+
+class SplitProcess(Process):
+    """ Copy a file to two files.
+    """
+    input_file = File(optional=False)
+    output_file = File(optional=False, output=True)
+    tmp_file = File(optional=False, output=True)
+
+    def _run_process(self):
+        executed.append(self.input_file)
+        for path in (self.output_file, self.tmp_file):
+            with open(path, "w") as f:
+                f.write(open(self.input_file).read())
+
+
+class TemporaryOutputPipeline(Pipeline):
+    """ A node with a real and a temporary output, the temporary one being
+    used by a second node.
+    """
+    def pipeline_definition(self):
+        self.add_process("a", SplitProcess)
+        self.add_process("b", CopyProcess)
+        self.add_link("a.tmp_file->b.input_file")
+        self.export_parameter("a", "input_file")
+        self.export_parameter("a", "output_file")
+        self.export_parameter("b", "output_file", "output_b")
+
+
+class TestPipelineIncremental(unittest.TestCase):
+    """ Only run the nodes which are not up to date.
+    """
+    def setUp(self):
+        rendez_vous.clear()
+        del executed[:]
+        self.output_directory = tempfile.mkdtemp(prefix="capsul_incr_")
+        self.state_file = os.path.join(self.output_directory, "state.jsonl")
+        self.study_config = StudyConfig(
+            modules=[], output_directory=self.output_directory,
+            incremental_run=True)
+        self.pipeline = self.study_config.get_process_instance(
+            TwoBranchesPipeline)
+        for name in ("a", "b"):
+            path = os.path.join(self.output_directory, name + ".txt")
+            open(path, "w").write("branch %s\n" % name)
+            setattr(self.pipeline, "input_" + name, path)
+            setattr(self.pipeline, "output_" + name,
+                    os.path.join(self.output_directory, "out_%s.txt" % name))
+        self.pipeline.middle_a = os.path.join(self.output_directory,
+                                              "middle_a.txt")
+
+    def tearDown(self):
+        shutil.rmtree(self.output_directory)
+
+    def run_pipeline(self):
+        """ Run the pipeline, and get the inputs of the executed nodes, the
+        temporary file of the second branch left out.
+        """
+        del executed[:]
+        self.study_config.run(self.pipeline)
+        return set(path for path in executed
+                   if os.path.dirname(path) == self.output_directory)
+
+    def age_files(self):
+        """ Make the existing files one minute older.
+        """
+        mtime = time.time() - 60
+        for name in os.listdir(self.output_directory):
+            os.utime(os.path.join(self.output_directory, name),
+                     (mtime, mtime))
+
+    def check_timestamps(self):
+        """ Nodes are run again when their inputs are newer than their
+        outputs.
+        """
+        pipeline = self.pipeline
+        self.assertEqual(len(self.run_pipeline()), 3)
+        # the temporary file of the second branch does not exist
+        self.assertEqual(self.run_pipeline(), set([pipeline.input_b]))
+        self.age_files()
+        os.utime(pipeline.input_a, None)
+        self.assertEqual(self.run_pipeline(),
+                         set([pipeline.input_a, pipeline.middle_a,
+                              pipeline.input_b]))
+        os.unlink(pipeline.output_a)
+        self.assertEqual(self.run_pipeline(),
+                         set([pipeline.middle_a, pipeline.input_b]))
+
+    def test_timestamps(self):
+        """ Sequential incremental runs.
+        """
+        self.check_timestamps()
+
+    def test_scheduler_timestamps(self):
+        """ Concurrent incremental runs.
+        """
+        self.study_config.local_workers = 2
+        self.check_timestamps()
+
+    def test_parameters(self):
+        """ Nodes whose parameters changed are run again if a state file
+        records them.
+        """
+        pipeline = self.pipeline
+        self.run_pipeline()
+        process = pipeline.nodes["a2"].process
+        process.fail = True
+        self.assertEqual(self.run_pipeline(), set([pipeline.input_b]))
+        process.fail = False
+        self.study_config.incremental_state_file = self.state_file
+        self.assertEqual(len(self.run_pipeline()), 3)
+        self.assertEqual(self.run_pipeline(), set([pipeline.input_b]))
+        process.fail = True
+        self.assertRaises(RuntimeError, self.run_pipeline)
+        self.assertTrue(pipeline.middle_a in executed)
+        self.assertFalse(pipeline.input_a in executed)
+        # back to the parameters of the last successful run
+        process.fail = False
+        self.assertEqual(self.run_pipeline(), set([pipeline.input_b]))
+
+    def test_digests(self):
+        """ Nodes are run again when their inputs contents change.
+        """
+        self.assertRaises(ValueError, IncrementalState, None, "digests")
+        pipeline = self.pipeline
+        self.study_config.incremental_state_file = self.state_file
+        self.study_config.incremental_checks = "digests"
+        self.run_pipeline()
+        self.age_files()
+        os.utime(pipeline.input_a, None)
+        self.assertEqual(self.run_pipeline(), set([pipeline.input_b]))
+        open(pipeline.input_a, "w").write("branch a modified\n")
+        self.assertEqual(self.run_pipeline(),
+                         set([pipeline.input_a, pipeline.middle_a,
+                              pipeline.input_b]))
+        self.assertEqual(open(pipeline.output_a).read(),
+                         "branch a modified\n")
+
+    def test_temporary_outputs(self):
+        """ Nodes producing temporary files are run again, even if their
+        other outputs exist.
+        """
+        pipeline = self.study_config.get_process_instance(
+            TemporaryOutputPipeline)
+        pipeline.input_file = self.pipeline.input_a
+        pipeline.output_file = os.path.join(self.output_directory,
+                                            "split.txt")
+        pipeline.output_b = os.path.join(self.output_directory, "out.txt")
+        for local_workers in (1, 2):
+            self.study_config.local_workers = local_workers
+            del executed[:]
+            self.study_config.run(pipeline)
+            self.assertEqual(executed[0], pipeline.input_file)
+            os.unlink(pipeline.output_b)
+            del executed[:]
+            self.study_config.run(pipeline)
+            self.assertEqual(len(executed), 2)
+            self.assertEqual(open(pipeline.output_b).read(), "branch a\n")
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(
+        TestPipelineIncremental)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
@@ -0,0 +1,101 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import json
+import struct
+import unittest
+
+# Trait import
+from traits.api import Undefined
+
+# Capsul import
+from capsul.pipeline import pipeline_snapshot
+from capsul.pipeline.pipeline_snapshot import (
+    dump_pipeline_snapshot, load_pipeline_snapshot,
+    restore_pipeline_snapshot, diff_pipeline_snapshots)
+from capsul.pipeline.test.test_switch_subpipeline import MainTestPipeline
+
+
+class TestPipelineSnapshot(unittest.TestCase):
+    """ Snapshot, compare and restore pipeline states.
+    """
+    def setUp(self):
+        self.pipeline = MainTestPipeline()
+        self.pipeline.which_way = "one"
+        self.pipeline.input_image = "/data/subject_1.nii"
+
+    def test_snapshot(self):
+        """ Snapshots are compact and compared to themselves without
+        differences.
+        """
+        data = dump_pipeline_snapshot(self.pipeline)
+        self.assertTrue(len(data) < len(json.dumps(
+            self.pipeline.pipeline_state())))
+        snapshot = load_pipeline_snapshot(data)
+        self.assertEqual(snapshot["version"],
+                         pipeline_snapshot.SNAPSHOT_VERSION)
+        self.assertEqual(diff_pipeline_snapshots(data, snapshot), [])
+        self.assertEqual(
+            diff_pipeline_snapshots(data,
+                                    dump_pipeline_snapshot(self.pipeline)),
+            [])
+        self.assertRaises(ValueError, load_pipeline_snapshot, b"not a state")
+        newer = (pipeline_snapshot._MAGIC
+                 + struct.pack(">H", pipeline_snapshot.SNAPSHOT_VERSION + 1)
+                 + data[len(pipeline_snapshot._MAGIC) + 2:])
+        self.assertRaises(ValueError, load_pipeline_snapshot, newer)
+
+    def test_diff_and_restore(self):
+        """ Differences are listed, and restoring a snapshot cancels them.
+        """
+        pipeline = self.pipeline
+        reference_state = pipeline.pipeline_state()
+        data = dump_pipeline_snapshot(pipeline)
+        pipeline.which_way = "two"
+        pipeline.input_image = Undefined
+        differences = diff_pipeline_snapshots(
+            data, dump_pipeline_snapshot(pipeline))
+        self.assertTrue('in node "way1_1": activated = True differs from '
+                        'False' in differences)
+        changed_values = [difference.split(" = ")[0]
+                          for difference in differences
+                          if difference.startswith("value of")]
+        self.assertTrue('value of ":input_image"' in changed_values)
+        self.assertTrue('value of ":which_way"' in changed_values)
+        restore_pipeline_snapshot(pipeline, data)
+        self.assertEqual(pipeline.which_way, "one")
+        self.assertEqual(pipeline.input_image, "/data/subject_1.nii")
+        self.assertEqual(diff_pipeline_snapshots(
+            data, dump_pipeline_snapshot(pipeline)), [])
+        self.assertEqual(pipeline.compare_to_state(reference_state), [])
+
+    def test_missing_nodes(self):
+        """ Snapshots are only restored in pipelines with the same nodes.
+        """
+        snapshot = load_pipeline_snapshot(
+            dump_pipeline_snapshot(self.pipeline))
+        snapshot["names"].append("way3")
+        snapshot["nodes"].append([len(snapshot["names"]) - 1, 3])
+        self.assertRaises(ValueError, restore_pipeline_snapshot,
+                          self.pipeline, snapshot)
+        self.assertEqual(diff_pipeline_snapshots(
+            dump_pipeline_snapshot(self.pipeline), snapshot),
+            ['node "way3" is new'])
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestPipelineSnapshot)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
@@ -0,0 +1,88 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+from __future__ import print_function
+
+import unittest
+from capsul.api import get_process_instance
+from capsul.pipeline.pipeline_template import PipelineTemplate, clone_process
+from capsul.pipeline.test.test_switch_pipeline import (SwitchPipeline,
+                                                       DummyProcess)
+from capsul.pipeline.test.test_switch_subpipeline import \
+    MultipleConnectionsPipeline
+
+
+class TestPipelineTemplate(unittest.TestCase):
+    """ Create pipelines from compiled templates.
+    """
+    def test_clone_process(self):
+        """ Instance traits and values are copied, not shared.
+        """
+        process = DummyProcess()
+        process.input_image = "input.nii"
+        clone = clone_process(process)
+        self.assertEqual(list(clone.user_traits()),
+                         list(process.user_traits()))
+        self.assertEqual(clone.input_image, "input.nii")
+        clone.other_input = 1.5
+        self.assertTrue(process.trait("other_input") is not
+                        clone.trait("other_input"))
+        self.assertNotEqual(process.other_input, 1.5)
+
+    def test_same_state(self):
+        """ Instances have the structure and activations of the compiled
+        pipeline.
+        """
+        for pipeline in (SwitchPipeline(), MultipleConnectionsPipeline(),
+                         get_process_instance(
+                             "capsul.process.test.xml_pipeline")):
+            template = PipelineTemplate(pipeline)
+            instance = template.instantiate()
+            self.assertTrue(instance.__class__ is pipeline.__class__)
+            self.assertEqual(instance.pipeline_state(),
+                             pipeline.pipeline_state())
+            self.assertEqual(list(instance.user_traits()),
+                             list(pipeline.user_traits()))
+
+    def test_independent_instances(self):
+        """ Instances do not share nodes, values propagate along links and
+        activations are updated.
+        """
+        pipeline = SwitchPipeline()
+        template = PipelineTemplate(pipeline)
+        instance = template.instantiate()
+        for name, node in instance.nodes.items():
+            if name:
+                self.assertTrue(node is not pipeline.nodes[name])
+                self.assertTrue(node.pipeline.nodes is instance.nodes)
+        instance.input_image = "image.nii"
+        self.assertEqual(instance.nodes["node"].process.input_image,
+                         "image.nii")
+        self.assertNotEqual(pipeline.input_image, "image.nii")
+
+        instance.switch = "two"
+        reference = SwitchPipeline()
+        reference.switch = "two"
+        self.assertEqual(instance.pipeline_state(),
+                         reference.pipeline_state())
+        self.assertEqual(pipeline.switch, "one")
+
+        # the template is a snapshot of the pipeline
+        self.assertEqual(template.instantiate().switch, "one")
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestPipelineTemplate)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
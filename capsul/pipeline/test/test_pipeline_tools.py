@@ -0,0 +1,127 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import os
+import shutil
+import tempfile
+import unittest
+
+# Capsul import
+from capsul.pipeline import pipeline_tools
+from capsul.pipeline.pipeline import _plug_value_origin
+from capsul.pipeline.test.test_pipeline_workflow import DummyPipeline
+from capsul.pipeline.test.test_switch_subpipeline import MainTestPipeline
+from capsul.utils.file_probe import FileProbe
+
+
+class TestPipelineTools(unittest.TestCase):
+    """ Check existing outputs and missing inputs of pipeline nodes.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="capsul_tools_")
+        self.pipeline = DummyPipeline()
+        self.pipeline.input = os.path.join(self.directory, "file_in.nii")
+        for i in range(1, 4):
+            setattr(self.pipeline, "output%d" % i,
+                    os.path.join(self.directory, "out", "file_out%d.nii" % i))
+        os.mkdir(os.path.join(self.directory, "out"))
+        open(self.pipeline.input, "w").close()
+        open(self.pipeline.output1, "w").close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_existing_outputs(self):
+        """ Existing outputs are found, with or without a shared probe.
+        """
+        expected = {"node2": [("output", self.pipeline.output1)]}
+        self.assertEqual(
+            pipeline_tools.nodes_with_existing_outputs(self.pipeline),
+            expected)
+        probe = FileProbe()
+        self.assertEqual(
+            pipeline_tools.nodes_with_existing_outputs(self.pipeline,
+                                                       probe=probe),
+            expected)
+        self.assertEqual(
+            pipeline_tools.nodes_with_missing_inputs(self.pipeline,
+                                                     probe=probe),
+            {})
+
+    def test_missing_inputs(self):
+        """ Missing input files which are not produced by the pipeline are
+        reported.
+        """
+        os.unlink(self.pipeline.input)
+        os.unlink(self.pipeline.output1)
+        self.assertEqual(
+            pipeline_tools.nodes_with_missing_inputs(self.pipeline),
+            {"node1": [("input", self.pipeline.input)]})
+        self.assertEqual(
+            pipeline_tools.nodes_with_existing_outputs(self.pipeline), {})
+
+
+class TestProvenanceIndex(unittest.TestCase):
+    """ Indexed origins of plugs values match links walks.
+    """
+    def setUp(self):
+        self.pipeline = MainTestPipeline()
+
+    def check_index(self):
+        """ Compare the indexed origin of each plug with a links walk.
+        """
+        for node in self.pipeline.all_nodes():
+            for plug in node.plugs.values():
+                for recursive in (True, False):
+                    self.assertEqual(
+                        self.pipeline.plug_value_origin(plug, recursive),
+                        _plug_value_origin(plug, recursive))
+
+    def test_origins(self):
+        """ Origins follow switches and links changes.
+        """
+        pipeline = self.pipeline
+        switch_pipeline = pipeline.nodes["switch_pipeline"].process
+        plug = pipeline.nodes["way1_1"].process.nodes["process4"].plugs[
+            "input4"]
+        pipeline.which_way = "one"
+        self.check_index()
+        node, param, parent = pipeline_tools.where_is_plug_value_from(
+            plug, pipeline=pipeline)
+        self.assertTrue(node is switch_pipeline.nodes["way1"])
+        self.assertEqual(param, "output_image")
+        self.assertTrue(parent is pipeline.nodes["switch_pipeline"])
+        # the first way is deactivated
+        pipeline.which_way = "two"
+        self.check_index()
+        self.assertEqual(pipeline.plug_value_origin(plug),
+                         (None, None, None))
+        plug = pipeline.nodes["way2_1"].process.nodes["process4"].plugs[
+            "input4"]
+        self.assertTrue(pipeline.plug_value_origin(plug)[0]
+                        is switch_pipeline.nodes["way2"])
+        pipeline.remove_link("switch_pipeline.result_image->way2_1.input2")
+        self.check_index()
+        self.assertEqual(pipeline.plug_value_origin(plug),
+                         (None, None, None))
+
+
+def test():
+    """ Function to execute unitest
+    """
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite(
+        [loader.loadTestsFromTestCase(TestPipelineTools),
+         loader.loadTestsFromTestCase(TestProvenanceIndex)])
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
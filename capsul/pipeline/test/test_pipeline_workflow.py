@@ -15,7 +15,10 @@ from traits.api import File
 from capsul.api import Process
 from capsul.api import Pipeline, PipelineNode
 from capsul.pipeline import pipeline_workflow
+from capsul.pipeline.pipeline_scheduling import CostModel
+from capsul.pipeline.process_iteration import ProcessIteration
 from capsul.study_config.study_config import StudyConfig
+from capsul.study_config.run_monitor import RunMonitor, RunCancelled
 
 
 class DummyProcess(Process):
@@ -103,6 +106,55 @@ class TestPipelineWorkflow(unittest.TestCase):
         # 4 deps (1 additional, dirs->node1)
         self.assertEqual(len(wf.dependencies), 4)
 
+    def test_critical_path_priorities(self):
+        self.pipeline.enable_all_pipeline_steps()
+        self.pipeline.nodes["node3"].process.estimated_cost = 10
+        wf = pipeline_workflow.workflow_from_pipeline(
+            self.pipeline, study_config=self.study_config,
+            create_directories=False, jobs_priority=5,
+            cost_model=CostModel())
+        priorities = dict((job.name, job.priority) for job in wf.jobs)
+        self.assertEqual(priorities, {"node1": 8, "node2": 7, "node3": 6,
+                                      "node4": 5})
+
+    def test_monitored_generation(self):
+        self.pipeline.enable_all_pipeline_steps()
+        monitor = RunMonitor()
+        events = []
+        monitor.add_callback(events.append)
+        wf = pipeline_workflow.workflow_from_pipeline(
+            self.pipeline, study_config=self.study_config,
+            create_directories=False, monitor=monitor)
+        kinds = [event.kind for event in events]
+        self.assertEqual(kinds, ["started"] + ["progress"] * 4
+                         + ["finished"])
+        self.assertEqual(events[-1].info["jobs"], len(wf.jobs))
+        monitor.cancel()
+        self.assertRaises(RunCancelled,
+                          pipeline_workflow.workflow_from_pipeline,
+                          self.pipeline, study_config=self.study_config,
+                          monitor=monitor)
+
+    def test_iteration_batches(self):
+        iteration = ProcessIteration(DummyProcess, ['input', 'output'])
+        iteration.input = ['/tmp/file_in%d.nii' % i for i in range(5)]
+        iteration.output = ['/tmp/file_out%d.nii' % i for i in range(5)]
+        wf = pipeline_workflow.workflow_from_pipeline(
+            iteration, create_directories=False)
+        self.assertEqual(len(wf.jobs), 5)
+        batches = list(pipeline_workflow.workflows_from_iteration(
+            iteration, batch_size=2, create_directories=False))
+        self.assertEqual([list(b[0]) for b in batches],
+                         [[0, 1], [2, 3], [4]])
+        self.assertEqual([sorted(job.name for job in b[1].jobs)
+                          for b in batches],
+                         [['DummyProcess_0', 'DummyProcess_1'],
+                          ['DummyProcess_2', 'DummyProcess_3'],
+                          ['DummyProcess_4']])
+        commands = [job.command for job in batches[1][1].jobs]
+        self.assertTrue(any('/tmp/file_in3.nii' in command
+                            for command in commands))
+
     def test_partial_wf1(self):
         self.pipeline.enable_all_pipeline_steps()
         self.pipeline.pipeline_steps.step3 = False
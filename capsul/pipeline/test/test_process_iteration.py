@@ -21,7 +21,8 @@ from traits.api import String, Int, List, File
 # Capsul import
 from capsul.api import Process
 from capsul.api import Pipeline
-from capsul.pipeline.process_iteration import ProcessIteration
+from capsul.pipeline.process_iteration import (ProcessIteration,
+                                               IterationError)
 
 if sys.version_info[0] >= 3:
     basestring = str
@@ -61,6 +62,17 @@ class ProcessSlice(Process):
         f.write(struct.pack('H', self.slice_number))
         f.close()
 
+class DoubleValue(Process):
+    value = Int()
+    fail_value = Int(-1)
+    doubled = Int(output=True)
+
+    def _run_process(self):
+        if self.value == self.fail_value:
+            raise ValueError('Failure requested for value %d' % self.value)
+        self.doubled = 2 * self.value
+
+
 class MyPipeline(Pipeline):
     """ Simple Pipeline to test the iterative Node
     """
@@ -130,6 +142,37 @@ class TestPipeline(unittest.TestCase):
         self.assertEqual(numbers, tuple(range(self.parallel_processes)))
 
 
+    def test_concurrent_iterations(self):
+        """ Method to test iterations run concurrently on process copies.
+        """
+        self.pipeline.nodes['process_slices'].process.workers = 4
+        self.pipeline()
+        result = open(self.pipeline.output_image,'rb').read()
+        numbers = struct.unpack_from('H' * self.parallel_processes, result)
+        self.assertEqual(numbers, tuple(range(self.parallel_processes)))
+
+    def test_concurrent_outputs(self):
+        """ Method to test that concurrent iterations outputs are gathered
+        in order, failed iterations being reported.
+        """
+        iteration = ProcessIteration(DoubleValue, ['value', 'doubled'],
+                                     workers=3)
+        iteration.value = [1, 2, 3, 4, 5]
+        iteration()
+        self.assertEqual(iteration.doubled, [2, 4, 6, 8, 10])
+        iteration.fail_value = 3
+        iteration.doubled = []
+        try:
+            iteration()
+        except IterationError as e:
+            self.assertEqual(list(e.errors.keys()), [2])
+            self.assertEqual(e.completed, [0, 1, 3, 4])
+            self.assertEqual([iteration.doubled[i] for i in e.completed],
+                             [2, 4, 8, 10])
+        else:
+            self.fail('IterationError not raised')
+
+
 def test():
     """ Function to execute unitest
     """
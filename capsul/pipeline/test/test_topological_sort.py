@@ -0,0 +1,90 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import unittest
+
+# Capsul import
+from capsul.pipeline.topological_sort import Graph, GraphNode
+
+
+class TestTopologicalSort(unittest.TestCase):
+    """ Sort a small graph: a short chain a1->a2 and a long chain
+    b1->b2->b3->b4, b2 also depending on a1.
+    """
+    def setUp(self):
+        self.graph = Graph()
+        for name in ("a1", "a2", "b1", "b2", "b3", "b4"):
+            self.graph.add_node(GraphNode(name, None))
+        for link in (("a1", "a2"), ("b1", "b2"), ("b2", "b3"), ("b3", "b4"),
+                     ("a1", "b2"), ("a1", "a2")):
+            self.graph.add_link(*link)
+
+    def check_order(self, order):
+        position = dict((name, index) for index, name in enumerate(order))
+        self.assertEqual(len(order), 6)
+        for source, dest in self.graph._links:
+            self.assertTrue(position[source] < position[dest])
+
+    def test_repeated_sort(self):
+        """ The sort does not modify the graph.
+        """
+        self.assertEqual(len(self.graph._links), 5)
+        self.assertEqual(self.graph.find_node("a2").links_from_degree, 1)
+        first = [name for name, meta in self.graph.topological_sort()]
+        second = [name for name, meta in self.graph.topological_sort()]
+        self.check_order(first)
+        self.assertEqual(first, second)
+        self.assertEqual(self.graph.find_node("b2").links_from_degree, 2)
+
+    def test_critical_path(self):
+        """ Long chains are started first when sorting with critical path
+        priorities.
+        """
+        lengths = self.graph.critical_path_lengths()
+        self.assertEqual(lengths,
+                         {"a1": 4, "a2": 1, "b1": 4, "b2": 3, "b3": 2,
+                          "b4": 1})
+        costs = {"a2": 10}
+        lengths = self.graph.critical_path_lengths(
+            lambda node: costs.get(node.name, 1))
+        self.assertEqual(lengths["a1"], 11)
+        order = [name for name, meta in self.graph.topological_sort(
+            lambda node: -lengths[node.name])]
+        self.check_order(order)
+        self.assertEqual(order[:2], ["a1", "a2"])
+
+    def test_default_order(self):
+        """ Without priority, the last node which became ready is taken
+        first.
+        """
+        graph = Graph()
+        for name in ("r1", "s1", "r2", "s2"):
+            graph.add_node(GraphNode(name, None))
+        graph.add_link("r1", "s1")
+        graph.add_link("r2", "s2")
+        order = [name for name, meta in graph.topological_sort()]
+        self.assertEqual(order[1], order[0].replace("r", "s"))
+
+    def test_loop(self):
+        """ A loop in the graph is detected.
+        """
+        self.graph.add_link("b4", "b1")
+        self.assertRaises(Exception, self.graph.topological_sort)
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestTopologicalSort)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    test()
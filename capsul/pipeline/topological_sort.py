@@ -7,6 +7,7 @@
 ##########################################################################
 
 # System import
+import heapq
 import logging
 import six
 
@@ -120,7 +121,7 @@ class Graph(object):
     ----------
     _nodes : dict
         the graph nodes {node.name: node}
-    _links : list
+    _links : set
         graph edges (from_node, to_node)
 
     Methods
@@ -129,13 +130,14 @@ class Graph(object):
     find_node
     add_link
     topological_sort
+    critical_path_lengths
     """
 
     def __init__(self):
         """ Create a Graph
         """
         self._nodes = {}
-        self._links = []
+        self._links = set()
 
     def add_node(self, node):
         """ Method to add a GraphNode in the Graph
@@ -183,21 +185,41 @@ class Graph(object):
             raise Exception("Node {0} is not defined in the Graph."
                    "Use add_node() method".format(to_node))
         if (from_node, to_node) not in self._links:
-            self._nodes[to_node].add_link_from(self._nodes[from_node])
-            self._nodes[from_node].add_link_to(self._nodes[to_node])
-            self._links.append((from_node, to_node))
-
-    def topological_sort(self):
+            # The links set guarantees the edge is new: update the nodes
+            # directly rather than through their linear duplicate checks.
+            source = self._nodes[from_node]
+            dest = self._nodes[to_node]
+            dest.links_from.append(source)
+            dest.links_from_degree += 1
+            source.links_to.append(dest)
+            source.links_to_degree += 1
+            self._links.add((from_node, to_node))
+
+    def topological_sort(self, priority=None):
         """ Perform the topological sort: find an order in which all the
         nodes can be taken.
-        Step 1: Identify nodes that have no incoming link (nnil).
+        Step 1: Count the incoming links of each node, and identify nodes
+        that have no incoming link (nnil).
         Step 2: Loop until there are nnil
-        a) Delete the current nodes c_nnil of in-degree 0.
+        a) Take the nnil node c_nnil with the lowest priority key.
         b) Place it in the output.
-        c) Remove all its outgoing links from the graph.
-        d) If the node has in-degree 0, add the node to nnil.
+        c) Decrement the incoming links count of its successors.
+        d) If a successor count reaches 0, add the successor to nnil.
         Step 3: Assert that there is no loop in the graph.
 
+        The graph is not modified, so the sort may be performed several
+        times.
+
+        Parameters
+        ----------
+        priority: callable (optional)
+            a function taking a GraphNode and returning a sort key: among the
+            nodes which are ready, the one with the lowest key is taken
+            first. For instance, ``lambda node: -lengths[node.name]`` with
+            the result of critical_path_lengths() starts the longest chains
+            first. By default, the last node which became ready is taken
+            first.
+
         Returns
         -------
         output: list of tuple
@@ -205,25 +227,37 @@ class Graph(object):
             name and the node meta element.
         """
         ordered_nodes = []
+        counter = [0]
+
+        def push(heap, node):
+            # the counter breaks ties, and keeps the nodes out of comparisons
+            if priority is None:
+                key = -counter[0]
+            else:
+                key = priority(node)
+            heapq.heappush(heap, (key, counter[0], node))
+            counter[0] += 1
 
         # Step 1
+        in_degrees = {}
         nnil = []
         for name, node in six.iteritems(self._nodes):
-            if node.links_from_degree == 0:
-                nnil.append(node)
+            in_degrees[name] = len(node.links_from)
+            if in_degrees[name] == 0:
+                push(nnil, node)
 
         # Step 2
-        while len(nnil):
+        while nnil:
         #-- a
-            c_nnil = nnil.pop()
+            c_nnil = heapq.heappop(nnil)[2]
         #-- b
             ordered_nodes.append(c_nnil)
-        #-- c
             for node in c_nnil.links_to:
-                node.remove_link_from(c_nnil)
+        #-- c
+                in_degrees[node.name] -= 1
         #-- d
-                if node.links_from_degree == 0:
-                    nnil.append(node)
+                if in_degrees[node.name] == 0:
+                    push(nnil, node)
 
         # Step 3
         if len(ordered_nodes) == len(self._nodes):
@@ -232,6 +266,33 @@ class Graph(object):
             raise Exception("There is loop in the Graph."
                             "Please inverstigate")
 
+    def critical_path_lengths(self, cost=None):
+        """ Compute, for each node, the length of the longest path starting
+        at this node, the node included.
+
+        Parameters
+        ----------
+        cost: callable (optional)
+            a function taking a GraphNode and returning its (positive) cost.
+            By default each node costs 1, so the result is the number of
+            nodes in the longest chain.
+
+        Returns
+        -------
+        lengths: dict
+            {node name: critical path length}
+        """
+        lengths = {}
+        for name, meta in reversed(self.topological_sort()):
+            node = self._nodes[name]
+            if cost is None:
+                node_cost = 1
+            else:
+                node_cost = cost(node)
+            lengths[name] = node_cost + max(
+                [lengths[succ.name] for succ in node.links_to] or [0])
+        return lengths
+
 
 if __name__ == '__main__':
 
@@ -122,6 +122,11 @@ class Process(six.with_metaclass(ProcessMeta, Controller)):
     `log_file`: str (default None)
         if None, the log will be generated in the current directory
         otherwise it will be written in log_file path.
+    `estimated_cost`: float (default None)
+        the expected execution time of the process, in seconds, used to
+        schedule the longest chains of a pipeline first. If None, the cost is
+        learned from recorded runtimes (see
+        capsul.pipeline.pipeline_scheduling.CostModel).
 
     Methods
     -------
@@ -144,6 +149,9 @@ class Process(six.with_metaclass(ProcessMeta, Controller)):
 
     """
 
+    # Expected execution time in seconds, None if unknown
+    estimated_cost = None
+
     def __init__(self, **kwargs):
         """ Initialize the Process class.
         """
@@ -401,8 +409,17 @@ class Process(six.with_metaclass(ProcessMeta, Controller)):
     # Accessors
     ####################################################################
 
-    def get_commandline(self):
+    def get_commandline(self, worker_address=None):
         """ Method to generate a comandline representation of the process.
+
+        Parameters
+        ----------
+        worker_address: str (optional)
+            the socket file of a running worker pool (see
+            :mod:`capsul.study_config.worker_pool`). If given, the command
+            line submits the process to the pool workers, which have the
+            process classes already imported, instead of running it in the
+            new interpreter.
         """
         # Get command line arguments (ie., the process user traits)
         # Build the python call expression, keeping apart file names.
@@ -455,16 +472,24 @@ class Process(six.with_metaclass(ProcessMeta, Controller)):
         class_name = self.name
 
         # Construct the command line
+        if worker_address is None:
+            header = "from {0} import {1}; "
+            call = "{1}()(**kwargs)"
+        else:
+            # the client module only depends on the standard library
+            header = "from capsul.study_config.worker_client import submit; "
+            call = "sys.exit(submit({5}, {0!r}, {1!r}, kwargs))"
         commandline = [
             "python",
             "-c",
-            ("import sys; from {0} import {1}; kwargs={2}; "
+            ("import sys; " + header + "kwargs={2}; "
              "kwargs.update(dict((sys.argv[i * 2 + {3}], "
              "sys.argv[i * 2 + {4}]) "
              "for i in range(int((len(sys.argv) - {3}) / 2)))); "
-             "{1}()(**kwargs)").format(module_name, class_name,
-                                       repr(argsdict), len(pathslist) + 1,
-                                       len(pathslist) + 2).replace("'", '"')
+             + call).format(module_name, class_name,
+                            repr(argsdict), len(pathslist) + 1,
+                            len(pathslist) + 2,
+                            repr(worker_address)).replace("'", '"')
         ] + pathslist + sum([list(x) for x in pathsdict.items()], [])
 
         return commandline
@@ -26,6 +26,7 @@ from soma.qt_gui.qt_backend import QtCore, QtGui
 from soma.sorted_dictionary import SortedDictionary
 from capsul.api import Switch, PipelineNode
 from capsul.pipeline import pipeline_tools
+from capsul.utils.file_probe import FileProbe
 from capsul.api import Pipeline
 from capsul.api import Process
 from capsul.api import get_process_instance
@@ -2180,10 +2181,12 @@ class PipelineDevelopperView(QtGui.QGraphicsView):
         self.scene.pipeline.enable_all_pipeline_steps()
 
     def check_files(self):
+        # both checks share the directories listings
+        probe = FileProbe()
         overwritten_outputs = pipeline_tools.nodes_with_existing_outputs(
-            self.scene.pipeline)
+            self.scene.pipeline, probe=probe)
         missing_inputs = pipeline_tools.nodes_with_missing_inputs(
-            self.scene.pipeline)
+            self.scene.pipeline, probe=probe)
         if len(overwritten_outputs) == 0 and len(missing_inputs) == 0:
             QtGui.QMessageBox.information(
                 self, 'Pipeline ready', 'All input files are available. '
@@ -0,0 +1,287 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Execution of pipelines from an asyncio event loop.
+
+The :class:`AsyncScheduler` runs pipeline nodes like the
+:class:`~capsul.study_config.local_scheduler.LocalScheduler`, without ever
+blocking the thread of the event loop: command lines are run in asyncio
+subprocesses, other jobs in the loop executor. It is used by
+StudyConfig.arun().
+
+The scheduling is driven by futures callbacks rather than coroutines, so that
+the module remains importable by python 2, where asyncio does not exist.
+"""
+
+# System import
+import time
+import logging
+import functools
+import subprocess
+
+# CAPSUL import
+from capsul.study_config.local_scheduler import (LocalScheduler,
+                                                 _run_commandline)
+from capsul.study_config.run_monitor import RunCancelled, output_bytes
+
+# Define the logger
+logger = logging.getLogger(__name__)
+
+
+def _future_error(future):
+    """ Get the exception of a done future, CancelledError if it has been
+    cancelled.
+    """
+    import asyncio
+
+    if future.cancelled():
+        return asyncio.CancelledError()
+    return future.exception()
+
+
+def _start_commandline(loop, commandline, processes):
+    """ Run a command line in an asyncio subprocess.
+
+    Parameters
+    ----------
+    loop: asyncio event loop (mandatory)
+        the loop running the subprocess.
+    commandline: list of str (mandatory)
+        the command line.
+    processes: set (mandatory)
+        the running subprocesses, the subprocess is in this set until it
+        exits.
+
+    Returns
+    -------
+    result: asyncio.Future
+        resolved with None, or a CalledProcessError if the command failed.
+    """
+    import asyncio
+
+    result = loop.create_future()
+
+    def exited(process, wait):
+        processes.discard(process)
+        error = _future_error(wait)
+        if error is not None:
+            result.set_exception(error)
+        elif wait.result() != 0:
+            result.set_exception(subprocess.CalledProcessError(
+                wait.result(), commandline))
+        else:
+            result.set_result(None)
+
+    def started(creation):
+        error = _future_error(creation)
+        if error is not None:
+            result.set_exception(error)
+            return
+        process = creation.result()
+        processes.add(process)
+        loop.create_task(process.wait()).add_done_callback(
+            functools.partial(exited, process))
+
+    loop.create_task(asyncio.create_subprocess_exec(
+        *commandline)).add_done_callback(started)
+    return result
+
+
+class AsyncScheduler(LocalScheduler):
+    """ Run pipeline nodes concurrently from an asyncio event loop.
+
+    Nodes are prepared and scheduled in the loop thread, as in the
+    LocalScheduler (see its documentation for the execution modes). Jobs
+    running process command lines ('process' mode) are asyncio subprocesses,
+    other jobs are run in the loop executor.
+
+    Attributes
+    ----------
+    `loop`: asyncio event loop
+        the loop running the execution, None for the current event loop.
+    `executor`: concurrent.futures.Executor
+        the executor of the jobs which are not command lines, None for the
+        default executor of the loop.
+
+    Methods
+    -------
+    run
+    """
+
+    def __init__(self, study_config, workers=None, mode="thread",
+                 cost_model=None, monitor=None, journal=None,
+                 incremental=None, order_by_cost=True, loop=None,
+                 executor=None):
+        """ Initialize the AsyncScheduler class.
+
+        Parameters
+        ----------
+        study_config, workers, mode, cost_model, monitor, journal,
+        incremental, order_by_cost:
+            see LocalScheduler.
+        loop: asyncio event loop (optional)
+            the loop running the execution. Default: the current event loop.
+        executor: concurrent.futures.Executor (optional)
+            the executor of the jobs which are not command lines. Default:
+            the executor of the loop.
+        """
+        super(AsyncScheduler, self).__init__(
+            study_config, workers=workers, mode=mode, cost_model=cost_model,
+            monitor=monitor, journal=journal, incremental=incremental,
+            order_by_cost=order_by_cost)
+        self.loop = loop
+        self.executor = executor
+
+    def run(self, pipeline, execution_list, output_directory, verbose=0,
+            on_stop=None, **kwargs):
+        """ Start the execution of pipeline nodes respecting their
+        dependencies.
+
+        This method has to be called from the loop thread. Temporary files
+        have to be allocated by the caller.
+
+        Parameters
+        ----------
+        pipeline, execution_list, output_directory, verbose, kwargs:
+            see LocalScheduler.run().
+        on_stop: callable (optional)
+            called without argument when the execution is over and no job is
+            running anymore, to release temporary files for instance.
+
+        Returns
+        -------
+        result: asyncio.Future
+            resolved with the result of the last node of execution_list, or
+            the first failure. Cancelling it stops the execution: no new node
+            is started and running subprocesses are killed.
+        """
+        import asyncio
+
+        loop = self.loop
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        result = loop.create_future()
+        ready, waiting, successors, order = self._schedule(pipeline,
+                                                           execution_list)
+        results = {}
+        signatures = {}
+        state = {"running": 0, "failure": None, "stopped": False}
+        processes = set()
+
+        def stop_requested():
+            if state["failure"] is not None or result.cancelled():
+                return True
+            if self.monitor is not None and self.monitor.cancelled:
+                state["failure"] = RunCancelled("Operation cancelled")
+                return True
+            return False
+
+        def submit():
+            while (ready and state["running"] < self.workers
+                   and not stop_requested()):
+                node = ready.pop(0)
+                try:
+                    if self.journal is not None:
+                        signatures[node] = self.journal.signature(
+                            node.process)
+                    job = self._start_job(loop, node, output_directory,
+                                          verbose, kwargs, processes)
+                except Exception as e:
+                    state["failure"] = e
+                    break
+                logger.debug("Async scheduler: start '{0}'".format(
+                    node.full_name))
+                if self.monitor is not None:
+                    self.monitor.emit("started", "execution",
+                                      node.process.id)
+                state["running"] += 1
+                job.add_done_callback(
+                    functools.partial(finished, node, time.time()))
+            if result.cancelled():
+                for process in list(processes):
+                    try:
+                        process.kill()
+                    except OSError:
+                        # already exited
+                        pass
+            if not state["running"]:
+                stop()
+
+        def finished(node, start_time, job):
+            state["running"] -= 1
+            duration = time.time() - start_time
+            error = _future_error(job)
+            if error is not None:
+                logger.debug("Async scheduler: '{0}' failed".format(
+                    node.full_name))
+                if self.monitor is not None:
+                    self.monitor.emit("failed", "execution", node.process.id,
+                                      error=str(error), duration=duration)
+                if state["failure"] is None:
+                    state["failure"] = error
+            else:
+                results[node] = job.result()
+                if self.journal is not None:
+                    self.journal.record(node, signatures.pop(node))
+                if self.incremental is not None:
+                    self.incremental.record(node)
+                if self.cost_model is not None:
+                    self.cost_model.record(node.process, duration)
+                if self.monitor is not None:
+                    self.monitor.emit("finished", "execution",
+                                      node.process.id, duration=duration,
+                                      bytes=output_bytes(node.process))
+                for succ in successors.get(node, ()):
+                    waiting[succ] -= 1
+                    if waiting[succ] == 0:
+                        ready.append(succ)
+                ready.sort(key=order.get)
+            submit()
+
+        def stop():
+            if state["stopped"]:
+                return
+            state["stopped"] = True
+            try:
+                if on_stop is not None:
+                    on_stop()
+            except Exception as e:
+                if state["failure"] is None:
+                    state["failure"] = e
+            if result.done():
+                return
+            if state["failure"] is not None:
+                result.set_exception(state["failure"])
+            elif execution_list:
+                result.set_result(results.get(execution_list[-1]))
+            else:
+                result.set_result(None)
+
+        def cancelled(future):
+            if future.cancelled():
+                submit()
+
+        result.add_done_callback(cancelled)
+        submit()
+        return result
+
+    def _start_job(self, loop, node, output_directory, verbose, kwargs,
+                   processes):
+        """ Start the job of a node.
+
+        Returns
+        -------
+        job: asyncio.Future
+            resolved with the job result.
+        """
+        function, args, run_kwargs = self._job(node, output_directory,
+                                               verbose, kwargs)
+        if function is _run_commandline:
+            return _start_commandline(loop, args[0], processes)
+        return loop.run_in_executor(
+            self.executor, functools.partial(function, *args, **run_kwargs))
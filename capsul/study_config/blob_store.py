@@ -0,0 +1,675 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Content-addressed storage of the files saved by the smart-caching.
+
+Files are stored once per content, named after their digest, whatever the
+process and the cache entry they come from. Cache entries only keep the
+digests of their files (see MemorizedProcess), and the store takes care of
+the cache budget: least recently used entries are removed when the cache is
+too big or too old, and files that are not used anymore are deleted.
+"""
+
+# System import
+from __future__ import with_statement
+import os
+import sys
+import time
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+import errno
+import six
+try:
+    import fcntl
+except ImportError:
+    # no file locking on this system
+    fcntl = None
+
+# Define the logger
+logger = logging.getLogger(__name__)
+
+# ioctl request used to clone a file on Linux copy-on-write filesystems
+_FICLONE = 0x40049409
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """ Compute the digest of a file content.
+
+    Parameters
+    ----------
+    path: str (mandatory)
+        the file to hash.
+    chunk_size: int (optional)
+        the file is read by chunks of this size.
+
+    Returns
+    -------
+    digest: str
+        the sha1 hexadecimal digest of the file content.
+    """
+    hasher = hashlib.sha1()
+    with open(path, "rb") as open_file:
+        chunk = open_file.read(chunk_size)
+        while chunk:
+            hasher.update(chunk)
+            chunk = open_file.read(chunk_size)
+    return hasher.hexdigest()
+
+
+def reflink(source, destination):
+    """ Clone a file without copying its data, if the filesystem supports
+    copy-on-write (btrfs, xfs...).
+
+    Parameters
+    ----------
+    source: str (mandatory)
+        the file to clone.
+    destination: str (mandatory)
+        the clone path. It is created or truncated.
+
+    Returns
+    -------
+    cloned: bool
+        True if the file has been cloned, False if it has to be copied.
+    """
+    if fcntl is None or not sys.platform.startswith("linux"):
+        return False
+    try:
+        with open(source, "rb") as source_file:
+            with open(destination, "wb") as destination_file:
+                fcntl.ioctl(destination_file.fileno(), _FICLONE,
+                            source_file.fileno())
+    except (IOError, OSError):
+        if os.path.exists(destination):
+            os.unlink(destination)
+        return False
+    shutil.copystat(source, destination)
+    return True
+
+
+class FileLock(object):
+    """ Advisory lock shared by processes through a lock file.
+
+    The lock can be used as a context manager. On systems without fcntl,
+    locking does nothing.
+
+    Attributes
+    ----------
+    `path`: str
+        the lock file, created if needed.
+    `shared`: bool
+        if True, several shared locks can be held at the same time, but not
+        together with an exclusive lock.
+
+    Methods
+    -------
+    acquire
+    release
+    """
+
+    def __init__(self, path, shared=False):
+        """ Initialize the FileLock class.
+
+        Parameters
+        ----------
+        path: str (mandatory)
+            the lock file.
+        shared: bool (optional, default False)
+            take a shared lock instead of an exclusive one.
+        """
+        self.path = path
+        self.shared = shared
+        self._file = None
+
+    def acquire(self, blocking=True):
+        """ Acquire the lock.
+
+        Parameters
+        ----------
+        blocking: bool (optional, default True)
+            if False, do not wait for the lock to be released by its holders.
+
+        Returns
+        -------
+        acquired: bool
+            False if the lock is held elsewhere and blocking is False.
+        """
+        if fcntl is None:
+            return True
+        operation = fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX
+        if not blocking:
+            operation |= fcntl.LOCK_NB
+        while True:
+            self._file = open(self.path, "a")
+            try:
+                fcntl.flock(self._file.fileno(), operation)
+            except (IOError, OSError) as e:
+                self._file.close()
+                self._file = None
+                if e.errno in (errno.EAGAIN, errno.EACCES):
+                    return False
+                raise
+            # the lock file may have been removed by its previous holder
+            # (see remove()): lock the new file
+            try:
+                path_stat = os.stat(self.path)
+            except OSError:
+                path_stat = None
+            file_stat = os.fstat(self._file.fileno())
+            if path_stat is not None and (
+                    (path_stat.st_dev, path_stat.st_ino) ==
+                    (file_stat.st_dev, file_stat.st_ino)):
+                return True
+            self.release()
+
+    def remove(self):
+        """ Delete the lock file and release the lock, which must be held
+        exclusively.
+        """
+        if self._file is not None:
+            os.unlink(self.path)
+        self.release()
+
+    def release(self):
+        """ Release the lock.
+        """
+        if self._file is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class DigestCache(object):
+    """ Persistent cache of file content digests.
+
+    A digest is saved per file (device and inode number) with the file
+    modification time, change time and size: a file is only hashed again when
+    one of them changes, so large files are read once. The change time
+    cannot be restored by the user, so rewriting a file in place while keeping
+    its modification time is detected.
+
+    Attributes
+    ----------
+    `cachedir`: str
+        the directory where digests are saved.
+
+    Methods
+    -------
+    digest
+    """
+
+    def __init__(self, cachedir):
+        """ Initialize the DigestCache class.
+
+        Parameters
+        ----------
+        cachedir: str (mandatory)
+            the smart-caching directory, digests are saved in its '.digests'
+            sub-directory.
+        """
+        self.cachedir = os.path.join(cachedir, ".digests")
+        if not os.path.isdir(self.cachedir):
+            try:
+                os.makedirs(self.cachedir)
+            except OSError:
+                # created by a concurrent process
+                if not os.path.isdir(self.cachedir):
+                    raise
+
+    def digest(self, path):
+        """ Get the digest of a file content.
+
+        Parameters
+        ----------
+        path: str (mandatory)
+            the file to hash.
+
+        Returns
+        -------
+        digest: str
+            the file content digest (see file_digest()).
+        """
+        signature = self._signature(path)
+        entry_fname = os.path.join(
+            self.cachedir, "{0}_{1}".format(*signature[:2]))
+        try:
+            with open(entry_fname) as open_file:
+                saved = json.load(open_file)
+        except (IOError, ValueError):
+            saved = None
+        if saved and saved[:-1] == signature:
+            return saved[-1]
+
+        digest = file_digest(path)
+
+        # Only save the digest if the file has not changed while it was read
+        if self._signature(path) == signature:
+            fd, tmp = tempfile.mkstemp(dir=self.cachedir, prefix=".tmp")
+            with os.fdopen(fd, "w") as open_file:
+                open_file.write(json.dumps(signature + [digest]))
+            os.rename(tmp, entry_fname)
+        return digest
+
+    @staticmethod
+    def _signature(path):
+        """ File identity and state, as a json serializable list.
+        """
+        stat = os.stat(path)
+        return [stat.st_dev, stat.st_ino, repr(stat.st_mtime),
+                repr(stat.st_ctime), stat.st_size]
+
+
+class BlobStore(object):
+    """ Content-addressed store of the smart-caching files.
+
+    Files are saved in the '.blobs' sub-directory of the cache, under their
+    content digest, so that identical outputs are stored only once. The
+    cache entries are the process directories containing a 'result.json'
+    file: the modification time of this file records the last time the entry
+    has been used.
+
+    Several processes can share a store: entries are published complete by
+    renaming a temporary directory, each entry is protected by a lock file
+    next to it (see entry_lock()), and stored files cannot be deleted while
+    an entry using them is being published (see lock()).
+
+    Attributes
+    ----------
+    `cachedir`: str
+        the smart-caching directory.
+    `blobdir`: str
+        the directory where files are stored.
+    `max_size`: int
+        the cache size budget in bytes, None or 0 for no limit.
+    `max_age`: float
+        entries not used for this number of seconds are removed, None or 0
+        for no limit.
+    `hardlinks`: bool
+        if True, files are restored as hard links to the stored files. The
+        restored files then share their data with the cache: they must not
+        be modified in place.
+    `digest_cache`: DigestCache
+        if not None, the cache used to get the digests of stored files.
+
+    Methods
+    -------
+    add
+    restore
+    lock
+    entry_lock
+    touch
+    record
+    stats
+    evict
+    """
+
+    def __init__(self, cachedir, max_size=None, max_age=None,
+                 hardlinks=False, digest_cache=None):
+        """ Initialize the BlobStore class.
+
+        Parameters
+        ----------
+        cachedir: str (mandatory)
+            the smart-caching directory.
+        max_size: int (optional)
+            the cache size budget in bytes.
+        max_age: float (optional)
+            the maximum time in seconds an entry is kept without being used.
+        hardlinks: bool (optional, default False)
+            restore files as hard links when possible.
+        digest_cache: DigestCache (optional)
+            a cache of file digests, so that stored files can be recognized
+            later without being read again.
+        """
+        self.cachedir = cachedir
+        self.blobdir = os.path.join(cachedir, ".blobs")
+        self.max_size = max_size
+        self.max_age = max_age
+        self.hardlinks = hardlinks
+        self.digest_cache = digest_cache
+        if not os.path.isdir(self.blobdir):
+            try:
+                os.makedirs(self.blobdir)
+            except OSError:
+                # created by a concurrent process
+                if not os.path.isdir(self.blobdir):
+                    raise
+
+    def blob_path(self, digest):
+        """ Get the path of a stored file.
+
+        Parameters
+        ----------
+        digest: str (mandatory)
+            the file content digest.
+
+        Returns
+        -------
+        path: str
+            the stored file path.
+        """
+        return os.path.join(self.blobdir, digest[:2], digest)
+
+    def add(self, path):
+        """ Store a file.
+
+        Parameters
+        ----------
+        path: str (mandatory)
+            the file to store.
+
+        Returns
+        -------
+        digest: str
+            the file content digest, used to restore it.
+        """
+        if self.digest_cache is not None:
+            digest = self.digest_cache.digest(path)
+        else:
+            digest = file_digest(path)
+        blob = self.blob_path(digest)
+        if os.path.isfile(blob):
+            self.record(bytes_saved=os.path.getsize(blob))
+            return digest
+
+        # Write a temporary file, then move it in place so that a stored file
+        # is always complete
+        blob_subdir = os.path.dirname(blob)
+        if not os.path.isdir(blob_subdir):
+            try:
+                os.makedirs(blob_subdir)
+            except OSError:
+                if not os.path.isdir(blob_subdir):
+                    raise
+        fd, tmp = tempfile.mkstemp(dir=blob_subdir, prefix=".tmp")
+        os.close(fd)
+        try:
+            if not reflink(path, tmp):
+                shutil.copy2(path, tmp)
+            os.rename(tmp, blob)
+        except:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        return digest
+
+    def restore(self, digest, path):
+        """ Restore a stored file.
+
+        The file is hard linked (if the store uses hard links), cloned (on
+        copy-on-write filesystems) or copied.
+
+        Parameters
+        ----------
+        digest: str (mandatory)
+            the stored file digest.
+        path: str (mandatory)
+            the destination file, replaced if it exists.
+        """
+        blob = self.blob_path(digest)
+        if not os.path.isfile(blob):
+            raise KeyError(
+                "Non-existing cache value (may have been cleared).\n"
+                "File {0} does not exist.".format(blob))
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".",
+                                   prefix=".tmp")
+        os.close(fd)
+        try:
+            linked = False
+            if self.hardlinks:
+                os.unlink(tmp)
+                try:
+                    os.link(blob, tmp)
+                    linked = True
+                except OSError:
+                    pass
+            if linked or reflink(blob, tmp):
+                self.record(bytes_saved=os.path.getsize(blob))
+            else:
+                shutil.copy2(blob, tmp)
+            os.rename(tmp, path)
+        except:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def lock(self, shared=True):
+        """ Get the store lock.
+
+        A shared lock must be held while files are added for an entry which
+        is not published yet: the eviction holds the lock exclusively while
+        it deletes unused files.
+
+        Parameters
+        ----------
+        shared: bool (optional, default True)
+            get a shared or an exclusive lock.
+
+        Returns
+        -------
+        lock: FileLock
+            the store lock, not acquired yet.
+        """
+        return FileLock(os.path.join(self.blobdir, "lock"), shared=shared)
+
+    @staticmethod
+    def entry_lock(process_dir):
+        """ Get the lock of a cache entry.
+
+        The lock is held while the entry is computed, restored or removed.
+        Its file is deleted with the entry by the eviction.
+
+        Parameters
+        ----------
+        process_dir: str (mandatory)
+            the cache entry directory.
+
+        Returns
+        -------
+        lock: FileLock
+            the entry lock, not acquired yet.
+        """
+        return FileLock(process_dir + ".lock")
+
+    def touch(self, process_dir):
+        """ Mark a cache entry as used now.
+
+        Parameters
+        ----------
+        process_dir: str (mandatory)
+            the cache entry directory.
+        """
+        result_fname = os.path.join(process_dir, "result.json")
+        if os.path.isfile(result_fname):
+            os.utime(result_fname, None)
+
+    def record(self, **increments):
+        """ Update the store statistics.
+
+        Parameters
+        ----------
+        increments: dict
+            values added to the statistics (hits, misses, bytes_saved,
+            evictions).
+        """
+        with FileLock(os.path.join(self.blobdir, "stats.lock")):
+            stats = self.stats()
+            for name, value in six.iteritems(increments):
+                stats[name] = stats.get(name, 0) + value
+            stats_fname = os.path.join(self.blobdir, "stats.json")
+            fd, tmp = tempfile.mkstemp(dir=self.blobdir, prefix=".tmp")
+            with os.fdopen(fd, "w") as open_file:
+                open_file.write(json.dumps(stats))
+            os.rename(tmp, stats_fname)
+
+    def stats(self):
+        """ Get the store statistics.
+
+        Returns
+        -------
+        stats: dict
+            'hits' and 'misses' count the cache lookups, 'bytes_saved' the
+            data that has not been written thanks to deduplication and
+            links, and 'evictions' the number of removed entries.
+        """
+        stats = {"hits": 0, "misses": 0, "bytes_saved": 0, "evictions": 0}
+        stats_fname = os.path.join(self.blobdir, "stats.json")
+        if os.path.isfile(stats_fname):
+            try:
+                with open(stats_fname) as open_file:
+                    stats.update(json.load(open_file))
+            except ValueError:
+                logger.debug("Invalid smart-caching statistics file "
+                             "'{0}'".format(stats_fname))
+        return stats
+
+    def evict(self, max_size=None, max_age=None, skips=None):
+        """ Remove least recently used cache entries until the cache fits
+        its budget, and delete stored files that are not used anymore.
+
+        Parameters
+        ----------
+        max_size: int (optional)
+            the cache size budget in bytes, default to the store one.
+        max_age: float (optional)
+            the maximum entry age in seconds, default to the store one.
+        skips: list of str (optional)
+            entry directories that must be kept.
+
+        Returns
+        -------
+        removed: list of str
+            the removed entry directories.
+        """
+        if max_size is None:
+            max_size = self.max_size
+        if max_age is None:
+            max_age = self.max_age
+        skips = set(skips or [])
+        with self.lock(shared=False):
+            removed = self._evict(max_size, max_age, skips)
+        if removed:
+            logger.debug("Smart-caching: {0} entries removed".format(
+                len(removed)))
+            self.record(evictions=len(removed))
+        return removed
+
+    def _evict(self, max_size, max_age, skips):
+        """ Remove cache entries and unused files, the store lock being held.
+        """
+        # Find cache entries with their size and used files
+        entries = []
+        total_size = 0
+        references = {}
+        orphan_locks = []
+        for root, dirs, files in os.walk(self.cachedir):
+            # skip the store directories and entries being computed
+            dirs[:] = [name for name in dirs if not name.startswith(".")]
+            # locks of entries which do not exist (failed computations)
+            orphan_locks.extend(
+                os.path.join(root, fname) for fname in files
+                if fname.endswith(".lock") and fname[:-5] not in dirs)
+            if "result.json" not in files:
+                continue
+            size = 0
+            for fname in files:
+                size += os.path.getsize(os.path.join(root, fname))
+            digests = self._entry_digests(root)
+            for digest in digests:
+                references[digest] = references.get(digest, 0) + 1
+            last_use = os.path.getmtime(os.path.join(root, "result.json"))
+            entries.append((last_use, root, size, digests))
+            total_size += size
+
+        # Find stored files
+        blobs = {}
+        for root, dirs, files in os.walk(self.blobdir):
+            if root == self.blobdir:
+                # statistics and locks
+                continue
+            for fname in files:
+                if fname.startswith(".tmp"):
+                    continue
+                blobs[fname] = os.path.getsize(os.path.join(root, fname))
+                # unused files are deleted anyway
+                if references.get(fname):
+                    total_size += blobs[fname]
+
+        # Remove the least recently used entries first
+        removed = []
+        now = time.time()
+        entries.sort()
+        for last_use, process_dir, size, digests in entries:
+            if process_dir in skips:
+                continue
+            too_old = bool(max_age) and now - last_use > max_age
+            too_big = bool(max_size) and total_size > max_size
+            if not (too_old or too_big):
+                # more recent entries are not too old either
+                break
+            # do not remove entries which are in use
+            entry_lock = self.entry_lock(process_dir)
+            if not entry_lock.acquire(blocking=False):
+                continue
+            try:
+                shutil.rmtree(process_dir)
+                entry_lock.remove()
+            finally:
+                entry_lock.release()
+            removed.append(process_dir)
+            total_size -= size
+            for digest in digests:
+                references[digest] -= 1
+                if references[digest] == 0:
+                    # the file is deleted below
+                    total_size -= blobs.get(digest, 0)
+
+        # Delete unused files
+        for digest in blobs:
+            if not references.get(digest):
+                os.unlink(self.blob_path(digest))
+
+        # Delete the locks which are not held by a running computation
+        for lock_fname in orphan_locks:
+            entry_lock = FileLock(lock_fname)
+            if entry_lock.acquire(blocking=False):
+                if os.path.isdir(lock_fname[:-5]):
+                    entry_lock.release()
+                else:
+                    entry_lock.remove()
+        return removed
+
+    def _entry_digests(self, process_dir):
+        """ Get the digests of the stored files used by a cache entry.
+        """
+        map_fname = os.path.join(process_dir, "file_mapping.json")
+        if not os.path.isfile(map_fname):
+            return []
+        try:
+            with open(map_fname) as json_data:
+                file_mapping = json.load(json_data)
+        except ValueError:
+            return []
+        return [memory_file for workspace_file, memory_file in file_mapping
+                if not os.path.isabs(memory_file)]
+
+    def __repr__(self):
+        """ BlobStore class representation.
+        """
+        return "{0}(cachedir={1})".format(self.__class__.__name__,
+                                          self.cachedir)
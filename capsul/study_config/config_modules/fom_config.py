@@ -83,6 +83,11 @@ class FomConfig(StudyConfigModule):
 
         self.study_config.modules_data.fom_atp = {}
         self.study_config.modules_data.fom_pta = {}
+        # memoized queries of the previous FOMs are obsolete
+        fom_cache = getattr(self.study_config.modules_data, 'fom_path_cache',
+                            None)
+        if fom_cache is not None:
+            fom_cache.clear()
 
         for fom_type, fom \
                 in six.iteritems(self.study_config.modules_data.foms):
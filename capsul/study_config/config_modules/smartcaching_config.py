@@ -6,7 +6,7 @@
 # for details.
 ##########################################################################
 
-from traits.api import Bool, Undefined
+from traits.api import Bool, Float, Undefined
 from capsul.study_config.study_config import StudyConfigModule
 
 
@@ -17,5 +17,26 @@ class SmartCachingConfig(StudyConfigModule):
             False,
             output=False,
             desc='Use smart-caching during the execution'))
+        study_config.add_trait('smart_caching_max_size', Float(
+            0,
+            output=False,
+            desc='Smart-caching size budget in MB, least recently used '
+                 'results are removed when it is exceeded (0: no limit)'))
+        study_config.add_trait('smart_caching_max_age', Float(
+            0,
+            output=False,
+            desc='Smart-caching results that have not been used for this '
+                 'number of days are removed (0: no limit)'))
+        study_config.add_trait('smart_caching_hardlinks', Bool(
+            False,
+            output=False,
+            desc='Restore cached files as hard links to the cache files '
+                 'instead of copies. Restored files must not be modified in '
+                 'place.'))
+        study_config.add_trait('smart_caching_content_fingerprints', Bool(
+            False,
+            output=False,
+            desc='Identify input files by their content digest instead of '
+                 'their modification time and size'))
         self.study_config = study_config
         # self.study_config.on_trait_change(self._use_smart_caching_changed, 'use_smart_caching')
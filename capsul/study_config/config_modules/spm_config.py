@@ -16,6 +16,7 @@ from traits.api import Directory, File, Bool, Enum, Undefined
 
 # CAPSUL import
 from capsul.study_config.study_config import StudyConfigModule
+from capsul.utils.discovery_cache import get_discovery_cache, find_executable
 
 # Define the logger
 logger = logging.getLogger(__name__)
@@ -23,6 +24,11 @@ logger = logging.getLogger(__name__)
 def find_spm(matlab=None, matlab_path=None):
     """ Function to return the root directory of SPM.
 
+    The result is stored in the discovery cache
+    (capsul.utils.discovery_cache) until the MATLAB executable, PATH or
+    MATLABPATH change. Failures are not stored, so that SPM is searched
+    again once installed.
+
     Parameters
     ----------
     matlab: str (default=None)
@@ -35,6 +41,25 @@ def find_spm(matlab=None, matlab_path=None):
     last_line: str
         the SPM root directory
     """
+    spm_dir = get_discovery_cache().cached(
+        ("spm_dir", matlab, matlab_path),
+        lambda: _find_spm(matlab, matlab_path),
+        environ=["PATH", "MATLABPATH"],
+        files=[find_executable(matlab or "matlab")], keep=bool)
+    # SPM not found with this MATLAB
+    if not spm_dir:
+        raise Exception("Could not find SPM.")
+    return spm_dir
+
+
+def _find_spm(matlab, matlab_path):
+    """ Run MATLAB to get the SPM root directory, see find_spm().
+
+    Returns
+    -------
+    last_line: str
+        the SPM root directory, an empty string if SPM is not found.
+    """
     # Script to execute with matlab in order to find SPM root dir
     script = ("spm8;"
               "fprintf(1, '%s', spm('dir'));"
@@ -62,10 +87,6 @@ def find_spm(matlab=None, matlab_path=None):
     if '\x1b' in last_line:
         last_line = last_line[:last_line.index('\x1b')]
 
-    # If the last line is empty, SPM not found
-    if last_line == "":
-        raise Exception("Could not find SPM.")
-
     # Debug message
     logger.debug("SPM found at location '{0}'.".format(last_line))
 
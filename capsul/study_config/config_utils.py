@@ -12,6 +12,9 @@ import re
 import subprocess
 import logging
 
+# Capsul import
+from capsul.utils.discovery_cache import get_discovery_cache
+
 # Define the logger
 logger = logging.getLogger(__name__)
 
@@ -23,6 +26,9 @@ def environment(sh_file=None, env={}):
     In the configuration file, the variable are expected to be defined
     as 'VARIABLE_NAME=value'.
 
+    The result is stored in the discovery cache
+    (capsul.utils.discovery_cache) until the sh file is modified.
+
     Parameters
     ----------
     sh_file: str (mandatory)
@@ -35,6 +41,14 @@ def environment(sh_file=None, env={}):
     environment: dict
         a dict containing the program configuration.
     """
+    return get_discovery_cache().cached(
+        ("environment", sh_file, env), lambda: _environment(sh_file, env),
+        files=[sh_file])
+
+
+def _environment(sh_file, env):
+    """ Parse the environment set by a sh file, see environment().
+    """
     # Use sh commands and a string instead of a list since
     # we're using shell=True
     # Pass empty environment to get only the prgram variables
@@ -0,0 +1,360 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Local parallel execution of pipelines, without soma-workflow.
+
+The :class:`LocalScheduler` takes the dependency graph of a pipeline
+(:meth:`Pipeline.workflow_graph`) and runs the process nodes which are ready
+(all their predecessors done) concurrently on a pool of workers.
+"""
+
+# System import
+import os
+import sys
+import time
+import tempfile
+import logging
+import subprocess
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import six
+from six.moves import queue
+from six.moves import cPickle as pickle
+
+# CAPSUL import
+from capsul.pipeline.pipeline_scheduling import (
+    workflow_dependencies, critical_path_lengths)
+from capsul.study_config.run import run_process
+from capsul.study_config.worker_pool import runs_in_workers, job_commandline
+from capsul.study_config.run_monitor import RunCancelled, output_bytes
+
+# Define the logger
+logger = logging.getLogger(__name__)
+
+
+def _run_in_worker(function, node, args, kwargs):
+    """ Call function(*args, **kwargs) and return its outcome and duration
+    instead of raising, so that failures can be reported to the scheduler
+    thread.
+    """
+    start_time = time.time()
+    try:
+        result = function(*args, **kwargs)
+    except Exception:
+        return node, False, sys.exc_info(), time.time() - start_time
+    return node, True, result, time.time() - start_time
+
+
+def _run_commandline(commandline):
+    """ Run a process command line in a separate interpreter.
+    """
+    subprocess.check_call(commandline)
+
+
+def _run_job_commandline(process, run_options):
+    """ Run a process job in a separate interpreter, and set its output
+    values.
+    """
+    fd, result_file = tempfile.mkstemp(prefix="capsul_job_", suffix=".pkl")
+    os.close(fd)
+    try:
+        subprocess.check_call(job_commandline(process, run_options,
+                                              result_file))
+        with open(result_file, "rb") as f:
+            outputs = pickle.load(f)
+    finally:
+        os.unlink(result_file)
+    for name, value in six.iteritems(outputs):
+        setattr(process, name, value)
+
+
+def _run_returncode(output_directory, process, **kwargs):
+    """ run_process() variant only returning the process result.
+    """
+    return run_process(output_directory, process, **kwargs)[0]
+
+
+class LocalScheduler(object):
+    """ Run pipeline nodes concurrently on the local machine.
+
+    Nodes are submitted to a pool of workers as soon as all the nodes they
+    depend on are done. The first failure stops the submission of new nodes:
+    running ones are waited for, then the original exception is raised.
+
+    Attributes
+    ----------
+    `study_config`: StudyConfig
+        the study configuration used to prepare and run processes.
+    `workers`: int
+        the number of nodes run at the same time.
+    `mode`: str
+        'thread': processes are run in threads of the current interpreter.
+        'process': each process is run through its command line
+        (Process.get_commandline()) in a separate interpreter, like
+        soma-workflow jobs. Only values written to files survive in this mode.
+        'worker': processes are run in the persistent pool of worker
+        interpreters of the study config (StudyConfig._get_worker_pool()),
+        and their output values are set back. Processes with a specific
+        command line are run like in the 'process' mode.
+    `cost_model`: CostModel
+        if not None, node runtimes are recorded in the model, and, if
+        order_by_cost is set, ready nodes are started in decreasing critical
+        path order (the costliest chains first) rather than in the sequential
+        execution order.
+    `order_by_cost`: bool
+        if set, the cost model (if any) is used to order ready nodes.
+    `monitor`: RunMonitor
+        if not None, receives the 'execution' events of the nodes. Once it
+        is cancelled, no new node is started and RunCancelled is raised
+        when the running ones are done.
+    `journal`: ExecutionJournal
+        if not None, completed nodes are recorded in this journal.
+    `incremental`: IncrementalState
+        if not None, completed nodes are recorded in this state of
+        incremental runs.
+
+    Methods
+    -------
+    run
+    """
+
+    def __init__(self, study_config, workers=None, mode="thread",
+                 cost_model=None, monitor=None, journal=None,
+                 incremental=None, order_by_cost=True):
+        """ Initialize the LocalScheduler class.
+
+        Parameters
+        ----------
+        study_config: StudyConfig (mandatory)
+            the study configuration.
+        workers: int (optional)
+            the pool size. None or a value lower than 1 means one worker per
+            CPU.
+        mode: str (optional, default 'thread')
+            'thread', 'process' or 'worker', see the class documentation.
+        cost_model: CostModel (optional)
+            the model used to estimate node costs, see the class
+            documentation.
+        monitor: RunMonitor (optional)
+            the monitor of the execution, see the class documentation.
+        journal: ExecutionJournal (optional)
+            the journal of the execution, see the class documentation.
+        incremental: IncrementalState (optional)
+            the state of incremental runs, see the class documentation.
+        order_by_cost: bool (optional, default True)
+            if not set, the cost model only records runtimes, see the class
+            documentation.
+        """
+        if mode not in ("thread", "process", "worker"):
+            raise ValueError(
+                "Unknown local execution mode '{0}': expect 'thread', "
+                "'process' or 'worker'".format(mode))
+        if workers is None or workers < 1:
+            workers = multiprocessing.cpu_count()
+        self.study_config = study_config
+        self.workers = workers
+        self.mode = mode
+        self.cost_model = cost_model
+        self.monitor = monitor
+        self.journal = journal
+        self.incremental = incremental
+        self.order_by_cost = order_by_cost
+
+    def run(self, pipeline, execution_list, output_directory, verbose=0,
+            **kwargs):
+        """ Execute pipeline nodes respecting their dependencies.
+
+        Temporary files have to be allocated by the caller, this method only
+        runs the nodes.
+
+        Parameters
+        ----------
+        pipeline: Pipeline (mandatory)
+            the pipeline whose nodes are executed.
+        execution_list: list of Node (mandatory)
+            the nodes to execute, in a valid sequential order (as returned
+            by Pipeline.workflow_ordered_nodes()). Nodes of the workflow graph
+            which are not in this list are considered as done.
+        output_directory: str (mandatory)
+            the output directory used for process execution.
+        verbose: int
+            if different from zero, print console messages.
+        kwargs: dict
+            parameters set on each process before it is run.
+
+        Returns
+        -------
+        result: object
+            the result of the last node of execution_list.
+        """
+        ready, waiting, successors, order = self._schedule(pipeline,
+                                                           execution_list)
+        results = {}
+        signatures = {}
+        failure = None
+        running = 0
+        done = queue.Queue()
+        pool = ThreadPool(self.workers)
+        try:
+            while ready or running:
+                # Submit ready nodes, in the scheduling order
+                while ready and failure is None and running < self.workers:
+                    if self.monitor is not None and self.monitor.cancelled:
+                        try:
+                            self.monitor.check()
+                        except RunCancelled:
+                            failure = sys.exc_info()
+                        break
+                    node = ready.pop(0)
+                    if self.journal is not None:
+                        signatures[node] = self.journal.signature(
+                            node.process)
+                    function, args, run_kwargs = self._job(
+                        node, output_directory, verbose, kwargs)
+                    logger.debug("Local scheduler: start '{0}'".format(
+                        node.full_name))
+                    if self.monitor is not None:
+                        self.monitor.emit("started", "execution",
+                                          node.process.id)
+                    pool.apply_async(
+                        _run_in_worker, (function, node, args, run_kwargs),
+                        callback=done.put)
+                    running += 1
+                if failure is not None:
+                    ready = []
+                if not running:
+                    break
+
+                # Wait for a node to finish
+                node, success, result, duration = done.get()
+                running -= 1
+                if not success:
+                    logger.debug("Local scheduler: '{0}' failed".format(
+                        node.full_name))
+                    if self.monitor is not None:
+                        self.monitor.emit("failed", "execution",
+                                          node.process.id,
+                                          error=str(result[1]),
+                                          duration=duration)
+                    if failure is None:
+                        failure = result
+                    continue
+                results[node] = result
+                if self.journal is not None:
+                    self.journal.record(node, signatures.pop(node))
+                if self.incremental is not None:
+                    self.incremental.record(node)
+                if self.monitor is not None:
+                    self.monitor.emit("finished", "execution",
+                                      node.process.id, duration=duration,
+                                      bytes=output_bytes(node.process))
+                if self.cost_model is not None:
+                    self.cost_model.record(node.process, duration)
+                for succ in successors.get(node, ()):
+                    waiting[succ] -= 1
+                    if waiting[succ] == 0:
+                        ready.append(succ)
+                ready.sort(key=order.get)
+        finally:
+            pool.close()
+            pool.join()
+
+        if failure is not None:
+            six.reraise(*failure)
+        if execution_list:
+            return results.get(execution_list[-1])
+        return None
+
+    def _schedule(self, pipeline, execution_list):
+        """ Compute the nodes dependencies and their start order.
+
+        Returns
+        -------
+        ready: list of Node
+            the nodes without predecessors, in the start order.
+        waiting: dict
+            {node: number of predecessors not done yet}
+        successors: dict
+            {node: list of nodes depending on it}
+        order: dict
+            {node: sort key}, ready nodes are started in increasing key
+            order.
+        """
+        dependencies = workflow_dependencies(pipeline.workflow_graph())
+        to_run = set(execution_list)
+        predecessors = {}
+        waiting = {}
+        successors = {}
+        for node in execution_list:
+            preds = set(pred for pred in dependencies.get(node, ())
+                        if pred in to_run)
+            predecessors[node] = preds
+            waiting[node] = len(preds)
+            for pred in preds:
+                successors.setdefault(pred, []).append(node)
+        if self.cost_model is not None and self.order_by_cost:
+            lengths = critical_path_lengths(predecessors, self.cost_model)
+            order = dict((node, (-lengths[node], index))
+                         for index, node in enumerate(execution_list))
+        else:
+            order = dict((node, index)
+                         for index, node in enumerate(execution_list))
+        ready = [node for node in execution_list if waiting[node] == 0]
+        ready.sort(key=order.get)
+        return ready, waiting, successors, order
+
+    def _job(self, node, output_directory, verbose, kwargs):
+        """ Prepare the execution of a node in the scheduler thread.
+
+        Returns
+        -------
+        job: tuple
+            (function, args, kwargs) to be called in a worker.
+        """
+        process = node.process
+        study_config = self.study_config
+        logger.info("Study Config: executing process '{0}'...".format(
+            process.id))
+        process_output_directory, cachedir = study_config._prepare_run(
+            process, output_directory)
+        study_config.process_counter += 1
+
+        if self.mode in ("process", "worker"):
+            for name, value in six.iteritems(kwargs):
+                setattr(process, name, value)
+            run_options = None
+            if cachedir or study_config.generate_logging:
+                run_options = dict(
+                    output_directory=process_output_directory,
+                    cachedir=cachedir,
+                    generate_logging=study_config.generate_logging,
+                    verbose=verbose,
+                    cache_options=study_config._get_cache_options())
+            if self.mode == "worker" and runs_in_workers(process):
+                pool = study_config._get_worker_pool(self.workers)
+                return pool.run, (process, ), {"run_options": run_options}
+            if run_options is not None:
+                if runs_in_workers(process):
+                    return _run_job_commandline, (process, run_options), {}
+                logger.warning(
+                    "Study Config: process '{0}' has a specific command line: "
+                    "smart-caching and logging are not applied in the '{1}' "
+                    "mode.".format(process.id, self.mode))
+            commandline = process.get_commandline()
+            if commandline and commandline[0] == "python":
+                commandline[0] = sys.executable
+            return _run_commandline, (commandline, ), {}
+
+        run_kwargs = dict(kwargs)
+        run_kwargs.update(dict(
+            cachedir=cachedir,
+            generate_logging=study_config.generate_logging,
+            verbose=verbose,
+            cache_options=study_config._get_cache_options()))
+        return (_run_returncode, (process_output_directory, process),
+                run_kwargs)
@@ -15,22 +15,15 @@ import hashlib
 import time
 import shutil
 import json
-import numpy
 import logging
+import uuid
 import six
 import sys
 
 # CAPSUL import
 from capsul.process.process import Process, ProcessResult
-
-# NIPYPE import
-try:
-    from nipype.interfaces.base import InterfaceResult
-except ImportError:
-    # if nipype is not here, we will not really need this but it is used in
-    # object type checking in CapsulResultEncoder
-    class InterfaceResult(object):
-        pass
+from capsul.study_config.blob_store import BlobStore, DigestCache
+from capsul.utils.lazy_import import loaded_class
 
 # TRAITS import
 from traits.api import Undefined
@@ -188,9 +181,12 @@ class MemorizedProcess(object):
 
     All values are cached on the filesystem, in a deep directory
     structure. Methods are provided to inspect the cache or clean it.
+    Output files are saved in a content-addressed store shared by all the
+    processes (see BlobStore).
     """
 
-    def __init__(self, process, cachedir, timestamp=None, verbose=1):
+    def __init__(self, process, cachedir, timestamp=None, verbose=1,
+                 store=None, digest_cache=None):
         """ Initialize the MemorizedProcess class.
 
         Parameters
@@ -207,6 +203,12 @@ class MemorizedProcess(object):
             is called.
         verbose: int
             if different from zero, print console messages.
+        store: BlobStore (optional)
+            the store where output files are saved. By default a store
+            without budget is used in the cache directory.
+        digest_cache: DigestCache (optional)
+            if given, input files are identified by their content digest
+            instead of their modification time and size.
         """
         # Check the a process is passed
         self.process_class = process.__class__
@@ -223,6 +225,10 @@ class MemorizedProcess(object):
         if not os.path.exists(cachedir) and os.path.isdir(cachedir):
             raise ValueError("'base_dir' should be an existing directory.")
         self.cachedir = cachedir
+        if store is None:
+            store = BlobStore(cachedir)
+        self.store = store
+        self.digest_cache = digest_cache
 
         # Define the cache time
         if timestamp is None:
@@ -258,55 +264,128 @@ class MemorizedProcess(object):
         # process
         process_dir, process_hash, input_parameters = self._get_process_id()
 
-        # Execute the process
-        if not os.path.isdir(process_dir):
+        # Concurrent calls with the same parameters wait for the one which
+        # computes the result, and the entry can not be removed while it is
+        # restored
+        with self.store.entry_lock(process_dir):
+            computed = not os.path.isdir(process_dir)
+            if computed:
+                result = self._compute_entry(process_dir, process_hash,
+                                             input_parameters)
+            else:
+                result = self._restore_entry(process_dir, input_parameters)
+
+        # Keep the cache in its budget
+        if computed and (self.store.max_size or self.store.max_age):
+            self.store.evict(skips=[process_dir])
+
+        return result
 
-            # Create the destination memory folder
-            os.makedirs(process_dir)
+    def _compute_entry(self, process_dir, process_hash, input_parameters):
+        """ Execute the process and save its results in the cache.
 
-            # Try to execute the process and if an error occured remove the
-            # cache folder
-            try:
-                # Run
-                result = self._call_process(process_dir, input_parameters)
-
-                # Save the result files in the memory with the corresponding
-                # mapping
-                output_parameters = {}
-                for name, trait in self.process.traits(output=True).items():
-                    # Get the trait value
-                    value = self.process.get_parameter(name)
-                    output_parameters[name] = value
+        The results are written in a temporary directory which is renamed
+        when complete, so that a cache entry is never seen partially written.
+
+        Parameters
+        ----------
+        process_dir: string
+            the cache entry directory.
+        process_hash: string
+            the process md5 hash.
+        input_parameters: dict
+            the process input_parameters.
+
+        Returns
+        -------
+        result: dict
+            the process results.
+        """
+        # Create a temporary memory folder (ignored by cache cleaning since
+        # its name starts with a dot)
+        tmp_dir = os.path.join(
+            os.path.dirname(process_dir),
+            ".tmp{0}_{1}".format(process_hash, uuid.uuid4().hex))
+        os.mkdir(tmp_dir)
+
+        # Try to execute the process and if an error occured remove the
+        # cache folder
+        try:
+            # Run
+            result = self._call_process(tmp_dir, input_parameters)
+
+            # Save the result files in the memory with the corresponding
+            # mapping
+            output_parameters = {}
+            for name, trait in self.process.traits(output=True).items():
+                # Get the trait value
+                value = self.process.get_parameter(name)
+                output_parameters[name] = value
+
+            # Stored files must not be removed before the entry is published
+            with self.store.lock():
                 file_mapping = []
-                self._copy_files_to_memory(output_parameters, process_dir,
+                self._copy_files_to_memory(output_parameters, tmp_dir,
                                            file_mapping)
-                map_fname = os.path.join(process_dir, "file_mapping.json")
+                map_fname = os.path.join(tmp_dir, "file_mapping.json")
                 with open(map_fname, "w") as open_file:
                     open_file.write(json.dumps(file_mapping))
+                try:
+                    os.rename(tmp_dir, process_dir)
+                except OSError:
+                    # the entry may have been published by a process that
+                    # can not be locked out (no file locking support)
+                    if not os.path.isdir(process_dir):
+                        raise
+                    shutil.rmtree(tmp_dir)
+
+        except:
+            if os.path.isdir(tmp_dir):
+                shutil.rmtree(tmp_dir)
+            raise
+
+        self.store.record(misses=1)
+        return result
 
-            except:
-                shutil.rmtree(process_dir)
-                raise
-
-        # Restore the process results from the cache folder
-        else:
-            # Restore the memorized files
-            map_fname = os.path.join(process_dir, "file_mapping.json")
-            with open(map_fname, "r") as json_data:
-                file_mapping = json.load(json_data)
+    def _restore_entry(self, process_dir, input_parameters):
+        """ Restore the process results from the cache folder.
 
-            # Go through all mapping files
-            for workspace_file, memory_file in file_mapping:
+        Parameters
+        ----------
+        process_dir: string
+            the cache entry directory.
+        input_parameters: dict
+            the process input_parameters.
 
-                # Determine if the workspace directory is writeable
-                if os.access(os.path.dirname(workspace_file), os.W_OK):
+        Returns
+        -------
+        result: dict
+            the process cached results.
+        """
+        # Restore the memorized files
+        map_fname = os.path.join(process_dir, "file_mapping.json")
+        with open(map_fname, "r") as json_data:
+            file_mapping = json.load(json_data)
+
+        # Go through all mapping files
+        for workspace_file, memory_file in file_mapping:
+
+            # Determine if the workspace directory is writeable
+            if os.access(os.path.dirname(workspace_file), os.W_OK):
+                # Files are stored by digest, full paths come from
+                # caches written by former versions
+                if os.path.isabs(memory_file):
                     shutil.copy2(memory_file, workspace_file)
                 else:
-                    logger.debug("Can't restore file '{0}', access rights are "
-                                 "not sufficients.".format(workspace_file))
+                    self.store.restore(memory_file, workspace_file)
+            else:
+                logger.debug("Can't restore file '{0}', access rights are "
+                             "not sufficients.".format(workspace_file))
 
-            # Update the process output traits
-            result = self._load_process_result(process_dir, input_parameters)
+        # Update the process output traits
+        result = self._load_process_result(process_dir, input_parameters)
+        self.store.touch(process_dir)
+        self.store.record(hits=1)
 
         return result
 
@@ -321,7 +400,8 @@ class MemorizedProcess(object):
             the process memory path.
         file_mapping: list of 2-uplet
             store in this structure the mapping between the workspace and the
-            memory (workspace_file, memory_file).
+            memory (workspace_file, memory_file), memory_file being the file
+            digest in the store.
         """
         # Deal with dictionary
         if isinstance(python_object, dict):
@@ -340,10 +420,8 @@ class MemorizedProcess(object):
             if (python_object is not Undefined and
                     isinstance(python_object, basestring) and
                     os.path.isfile(python_object)):
-                fname = os.path.basename(python_object)
-                out = os.path.join(process_dir, fname)
-                shutil.copy2(python_object, out)
-                file_mapping.append((python_object, out))
+                digest = self.store.add(python_object)
+                file_mapping.append((python_object, digest))
 
     def _call_process(self, process_dir, input_parameters):
         """ Call a process.
@@ -539,7 +617,7 @@ class MemorizedProcess(object):
             if (python_object is not Undefined and
                     isinstance(python_object, basestring) and
                     os.path.isfile(python_object)):
-                out = file_fingerprint(python_object)
+                out = file_fingerprint(python_object, self.digest_cache)
 
         return out
 
@@ -559,7 +637,12 @@ class MemorizedProcess(object):
 
         # Guarantee the path exists on the disk
         if not os.path.exists(process_dir):
-            os.makedirs(process_dir)
+            try:
+                os.makedirs(process_dir)
+            except OSError:
+                # created by a concurrent process
+                if not os.path.isdir(process_dir):
+                    raise
 
         return process_dir
 
@@ -673,22 +756,33 @@ def has_attribute(trait, attribute_name, attribute_value=None,
     return count > 0
 
 
-def file_fingerprint(afile):
+def file_fingerprint(afile, digest_cache=None):
     """ Computes the file fingerprint.
 
     Do not consider the file content, just the fingerprint (ie. the mtime,
-    the size and the file location).
+    the size and the file location), unless a digest cache is given.
 
     Parameters
     ----------
     afile: string
         the file to process.
+    digest_cache: DigestCache (optional)
+        if given, the fingerprint is the file location and content digest.
 
     Returns
     -------
     fingerprint: tuple
-        the file location, mtime and size.
+        the file location, mtime and size, or the file location and digest.
     """
+    if digest_cache is not None:
+        fingerprint = {
+            "name": afile,
+            "digest": None
+        }
+        if os.path.isfile(afile):
+            fingerprint["digest"] = digest_cache.digest(afile)
+        return fingerprint
+
     fingerprint = {
         "name": afile,
         "mtime": None,
@@ -718,11 +812,12 @@ class CapsulResultEncoder(json.JSONEncoder):
             return "<undefined_trait_value>"
 
         # InterfaceResult special case
-        if isinstance(obj, InterfaceResult):
+        if isinstance(obj, loaded_class("nipype.interfaces.base",
+                                        "InterfaceResult")):
             return "<skip_nipype_interface_result>"
 
         # Array special case
-        if isinstance(obj, numpy.ndarray):
+        if isinstance(obj, loaded_class("numpy", "ndarray")):
             return obj.tolist()
 
         # Call the base class default method
@@ -792,20 +887,37 @@ class Memory(object):
     ----------
     `cachedir`: string
         the location for the caching. If None is given, no caching is done.
+    `store`: BlobStore
+        the store of the cached files, None if no caching is done.
 
     Methods
     -------
     cache
     clear
+    stats
     """
 
-    def __init__(self, cachedir):
+    def __init__(self, cachedir, max_size=None, max_age=None,
+                 hardlinks=False, content_fingerprints=False):
         """ Initialize the Memory class.
 
         Parameters
         ----------
         base_dir: string
             the directory name of the location for the caching.
+        max_size: int (optional)
+            the cache size budget in bytes: least recently used results are
+            removed when it is exceeded.
+        max_age: float (optional)
+            results that have not been used for this number of seconds are
+            removed.
+        hardlinks: bool (optional, default False)
+            restore cached files as hard links to the cache files. Restored
+            files must then not be modified in place.
+        content_fingerprints: bool (optional, default False)
+            identify input files by their content rather than by their
+            modification time and size. Digests are cached on disk, so files
+            are only read again when they change.
         """
         # Build the capsul memory folder
         if cachedir is not None:
@@ -819,6 +931,14 @@ class Memory(object):
         # Define class parameters
         self.cachedir = cachedir
         self.timestamp = time.time()
+        self.store = None
+        self.digest_cache = None
+        if cachedir is not None:
+            if content_fingerprints:
+                self.digest_cache = DigestCache(cachedir)
+            self.store = BlobStore(cachedir, max_size=max_size,
+                                   max_age=max_age, hardlinks=hardlinks,
+                                   digest_cache=self.digest_cache)
 
     def cache(self, process, verbose=1):
         """ Create a proxy of the given process in order to only execute
@@ -874,7 +994,8 @@ class Memory(object):
         # Otherwise a proxy process is created
         else:
             return MemorizedProcess(process, self.cachedir, self.timestamp,
-                                    verbose)
+                                    verbose, store=self.store,
+                                    digest_cache=self.digest_cache)
 
     def clear(self, skips=None):
         """ Remove all the cache appart from those given to the method
@@ -889,12 +1010,35 @@ class Memory(object):
         to_remove_folders = []
         skips = skips or []
         for root, dirs, files in os.walk(self.cachedir):
+            # skip the store directories and entries being computed
+            dirs[:] = [name for name in dirs if not name.startswith(".")]
             if "result.json" and files and dirs == [] and root not in skips:
                 to_remove_folders.append(root)
 
-        # Delete memory directories
+        # Delete memory directories, except those in use
         for folder in to_remove_folders:
-            shutil.rmtree(folder)
+            entry_lock = self.store.entry_lock(folder)
+            if entry_lock.acquire(blocking=False):
+                try:
+                    shutil.rmtree(folder)
+                finally:
+                    entry_lock.release()
+
+        # Delete the files which are not used anymore
+        self.store.evict(max_size=0, max_age=0)
+
+    def stats(self):
+        """ Get the cache statistics.
+
+        Returns
+        -------
+        stats: dict
+            number of cache 'hits' and 'misses', 'bytes_saved' thanks to
+            files deduplication and links, and number of 'evictions'.
+        """
+        if self.store is None:
+            return {}
+        return self.store.stats()
 
     def __repr__(self):
         """ Memory class representation.
@@ -19,13 +19,7 @@ from capsul.process.process import Process
 from capsul.process.nipype_process import nipype_factory
 from capsul.process.xml import create_xml_process
 from capsul.pipeline.xml import create_xml_pipeline
-
-# Nipype import
-try:
-    from nipype.interfaces.base import Interface
-# If nipype is not found create a dummy Interface class
-except ImportError:
-    Interface = type("Interface", (object, ), {})
+from capsul.utils.lazy_import import loaded_class
 
 if sys.version_info[0] >= 3:
     basestring = str
@@ -113,12 +107,14 @@ def _get_process_instance(process_or_id, study_config=None, **kwargs):
 
     # If the function 'process_or_id' parameter is already a Nipye
     # interface instance, wrap this structure in a Process class
-    elif isinstance(process_or_id, Interface):
+    elif isinstance(process_or_id,
+                    loaded_class("nipype.interfaces.base", "Interface")):
         result = nipype_factory(process_or_id)
 
     # If the function 'process_or_id' parameter is an Interface class.
     elif (isinstance(process_or_id, type) and
-          issubclass(process_or_id, Interface)):
+          issubclass(process_or_id,
+                     loaded_class("nipype.interfaces.base", "Interface"))):
         result = nipype_factory(process_or_id())
 
     # If the function 'process_or_id' parameter is a function.
@@ -188,6 +184,9 @@ def _get_process_instance(process_or_id, study_config=None, **kwargs):
             module = sys.modules[module_name]
             module_object = getattr(module, object_name, None)
             if module_object is not None:
+                # nipype is loaded if the module defines an interface
+                Interface = loaded_class("nipype.interfaces.base",
+                                         "Interface")
                 if (isinstance(module_object, type) and
                     issubclass(module_object, Process)):
                     result = module_object()
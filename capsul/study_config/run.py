@@ -22,7 +22,8 @@ logger = logging.getLogger(__name__)
 
 
 def run_process(output_dir, process_instance, cachedir=None,
-                generate_logging=False, verbose=0, **kwargs):
+                generate_logging=False, verbose=0, cache_options=None,
+                **kwargs):
     """ Execute a capsul process in a specific directory.
 
     Parameters
@@ -38,6 +39,9 @@ def run_process(output_dir, process_instance, cachedir=None,
         if True save the log stored in the process after its execution.
     verbose: int
         if different from zero, print console messages.
+    cache_options: dict (optional)
+        options of the cache (Memory) parameters: 'max_size', 'max_age',
+        'hardlinks' and 'content_fingerprints'.
 
     Returns
     -------
@@ -86,7 +90,7 @@ def run_process(output_dir, process_instance, cachedir=None,
             call_with_inputs))
     if cachedir:
         # Create a memory object
-        mem = Memory(cachedir)
+        mem = Memory(cachedir, **(cache_options or {}))
         proxy_instance = mem.cache(process_instance, verbose=verbose)
 
         # Execute the proxy process
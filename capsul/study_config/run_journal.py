@@ -0,0 +1,224 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Journal of the nodes completed by a local execution, to resume it.
+
+When StudyConfig.execution_journal_file is set, each node completed by a
+local execution (StudyConfig.run or arun without soma-workflow) is appended
+to this file, with the signature of its parameters and its output values.
+If the execution is interrupted, the next one skips the nodes which are
+recorded with the same parameters, whose output files still exist and whose
+predecessors are skipped too, and starts at the first incomplete node. The
+journal is removed once an execution succeeds.
+
+Skipping a node costs a dictionary lookup, the signature of its parameters
+values and the existence check of its output files: neither input files
+contents nor outputs are read or copied.
+"""
+
+# System import
+import os
+import json
+import hashlib
+import logging
+import six
+
+# Trait import
+from traits.api import Undefined
+
+# CAPSUL import
+from capsul.pipeline.pipeline import Pipeline
+from capsul.pipeline.pipeline_nodes import Node
+from capsul.pipeline.pipeline_scheduling import workflow_dependencies
+
+# Define the logger
+logger = logging.getLogger(__name__)
+
+# Parameters which are not part of the signature of a node
+_ignored_params = ("nodes_activation", "selection_changed")
+
+
+def _json_value(value):
+    """ Check that a value is restored identical from json.
+    """
+    try:
+        return json.loads(json.dumps(value)) == value
+    except (TypeError, ValueError):
+        return False
+
+
+def _paths(value):
+    """ Iterate over the strings contained in a value.
+    """
+    if isinstance(value, six.string_types):
+        yield value
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            for path in _paths(item):
+                yield path
+
+
+class ExecutionJournal(object):
+    """ Append-only record of the nodes completed by an execution.
+
+    Each line of the journal file is a json object with the 'node' key
+    (pipeline node full name, or process id for a single process), its
+    parameters 'signature' and its 'outputs' values.
+
+    Attributes
+    ----------
+    `journal_file`: str
+        the journal file.
+
+    Methods
+    -------
+    pending_nodes
+    record
+    remove
+    """
+
+    def __init__(self, journal_file):
+        """ Load the completed nodes of the journal file, if it exists.
+
+        Parameters
+        ----------
+        journal_file: str (mandatory)
+            the journal file.
+        """
+        self.journal_file = journal_file
+        self._entries = {}
+        if os.path.exists(journal_file):
+            with open(journal_file) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # line truncated by an interruption
+                        continue
+                    self._entries[entry["node"]] = entry
+
+    @staticmethod
+    def node_key(node):
+        """ Get the journal key of a node, or of a process.
+        """
+        if isinstance(node, Node):
+            return node.full_name
+        return node.id
+
+    @staticmethod
+    def signature(process):
+        """ Get the signature of the parameters values of a process.
+        """
+        values = {}
+        for name in process.user_traits():
+            if name in _ignored_params:
+                continue
+            value = getattr(process, name)
+            if value is Undefined:
+                value = "<undefined>"
+            values[name] = value
+        return hashlib.sha1(json.dumps(
+            [process.id, values], sort_keys=True,
+            default=repr).encode("utf-8")).hexdigest()
+
+    def _completed(self, node, process):
+        """ Check if a node is recorded with the current parameters and
+        existing output files.
+        """
+        entry = self._entries.get(self.node_key(node))
+        if entry is None or entry["signature"] != self.signature(process):
+            return False
+        for value in six.itervalues(entry["outputs"]):
+            for path in _paths(value):
+                if os.path.isabs(path) and not os.path.exists(path):
+                    return False
+        return True
+
+    def pending_nodes(self, process_or_pipeline, execution_list):
+        """ Filter out the completed nodes of an execution list.
+
+        A node is completed if it is recorded with the same parameters
+        signature, its recorded output files exist and all the nodes it
+        depends on are completed. The recorded output values of completed
+        nodes are set back on their process.
+
+        Parameters
+        ----------
+        process_or_pipeline: Process (mandatory)
+            the executed process or pipeline.
+        execution_list: list (mandatory)
+            the nodes (or the process) to execute, in a valid sequential
+            order.
+
+        Returns
+        -------
+        pending: list
+            the nodes of execution_list which have to be executed, in the
+            same order.
+        """
+        if not self._entries:
+            return list(execution_list)
+        if isinstance(process_or_pipeline, Pipeline):
+            dependencies = workflow_dependencies(
+                process_or_pipeline.workflow_graph())
+        else:
+            dependencies = {}
+        pending = []
+        pending_set = set()
+        for node in execution_list:
+            process = getattr(node, "process", node)
+            if (any(pred in pending_set
+                    for pred in dependencies.get(node, ()))
+                    or not self._completed(node, process)):
+                pending.append(node)
+                pending_set.add(node)
+                continue
+            for name, value in six.iteritems(
+                    self._entries[self.node_key(node)]["outputs"]):
+                setattr(process, name, value)
+        if len(pending) < len(execution_list):
+            logger.info("Execution journal: resume after {0} completed "
+                        "nodes".format(len(execution_list) - len(pending)))
+        return pending
+
+    def record(self, node, signature):
+        """ Append a completed node to the journal.
+
+        Parameters
+        ----------
+        node: Node or Process (mandatory)
+            the completed node (or process).
+        signature: str (mandatory)
+            the signature of the process parameters, taken before the node
+            was prepared and run, in the state pending_nodes() sees them.
+        """
+        process = getattr(node, "process", node)
+        outputs = {}
+        for name, trait in six.iteritems(process.user_traits()):
+            if trait.output and name not in _ignored_params:
+                value = getattr(process, name)
+                if value is not Undefined and _json_value(value):
+                    outputs[name] = value
+        entry = {"node": self.node_key(node),
+                 "signature": signature,
+                 "outputs": outputs}
+        self._entries[entry["node"]] = entry
+        directory = os.path.dirname(self.journal_file)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self.journal_file, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def remove(self):
+        """ Remove the journal file, once the execution is complete.
+        """
+        self._entries = {}
+        if os.path.exists(self.journal_file):
+            os.unlink(self.journal_file)
@@ -0,0 +1,327 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Progress events and cooperative cancellation of long operations.
+
+A :class:`RunMonitor` is given to parameters completion
+(ProcessCompletionEngine.complete_parameters), workflow generation
+(workflow_from_pipeline) or execution (StudyConfig.run). These operations
+emit :class:`RunEvent` objects when their steps (nodes, jobs) start, finish
+or fail, and stop at the next step once the monitor is cancelled::
+
+    from capsul.study_config.run_monitor import RunMonitor, iter_run
+
+    for event in iter_run(study_config, pipeline):
+        print(event)
+        if event.kind == "failed":
+            break  # leaving the loop cancels the run
+
+Events can also be consumed from another thread (:meth:`RunMonitor.events`),
+by callbacks (:meth:`RunMonitor.add_callback`) or from an asyncio event loop
+(:meth:`RunMonitor.asyncio_queue`).
+
+Cancellation is cooperative: running steps are not interrupted, new steps
+are not started and the operation raises :class:`RunCancelled`. Steps run by
+soma-workflow cannot be cancelled this way.
+"""
+
+# System import
+import os
+import sys
+import time
+import threading
+import contextlib
+import six
+from six.moves import queue
+
+
+class RunCancelled(Exception):
+    """ Raised by operations stopped by RunMonitor.cancel().
+    """
+
+
+class RunEvent(object):
+    """ A step of a monitored operation.
+
+    Attributes
+    ----------
+    `kind`: str
+        'started', 'finished', 'failed', 'cancelled' or 'progress'.
+    `stage`: str
+        'completion', 'workflow' or 'execution'.
+    `name`: str
+        the step name (process or job name).
+    `time`: float
+        the event time (time.time()).
+    `info`: dict
+        event specific values: 'duration' (seconds) of finished, failed or
+        cancelled steps, 'bytes' written by finished execution steps,
+        'error' message of failed steps, 'jobs' number of generated
+        workflows.
+    """
+
+    def __init__(self, kind, stage, name=None, **info):
+        self.kind = kind
+        self.stage = stage
+        self.name = name
+        self.time = time.time()
+        self.info = info
+
+    def __repr__(self):
+        return "<RunEvent {0} {1} {2!r} {3}>".format(
+            self.stage, self.kind, self.name, self.info)
+
+
+class RunMonitor(object):
+    """ Dispatch the events of a monitored operation and hold its
+    cancellation request.
+
+    A monitor is meant for a single operation: once closed, it does not
+    dispatch events anymore.
+
+    Methods
+    -------
+    emit
+    step
+    cancel
+    check
+    close
+    events
+    add_callback
+    asyncio_queue
+    """
+
+    def __init__(self):
+        """ Initialize the RunMonitor class.
+        """
+        self.closed = False
+        self._sinks = []
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+
+    def _add_sink(self, sink):
+        """ Register a callable receiving events, then None on close.
+        """
+        with self._lock:
+            closed = self.closed
+            if not closed:
+                self._sinks.append(sink)
+        if closed:
+            sink(None)
+
+    def _remove_sink(self, sink):
+        with self._lock:
+            if sink in self._sinks:
+                self._sinks.remove(sink)
+
+    def emit(self, kind, stage, name=None, **info):
+        """ Send an event to the consumers.
+
+        Returns
+        -------
+        event: RunEvent
+            the sent event.
+        """
+        event = RunEvent(kind, stage, name, **info)
+        with self._lock:
+            sinks = list(self._sinks)
+        for sink in sinks:
+            sink(event)
+        return event
+
+    @contextlib.contextmanager
+    def step(self, stage, name, **info):
+        """ Context of a monitored step.
+
+        A 'started' event is sent when entering the context, then a
+        'finished', 'failed' or 'cancelled' event when leaving it. The
+        context value is a dict whose items are added to the 'finished'
+        event information.
+
+        Raises
+        ------
+        RunCancelled: when entering the context of a cancelled monitor.
+        """
+        self.check()
+        self.emit("started", stage, name, **info)
+        start_time = time.time()
+        result = {}
+        try:
+            yield result
+        except RunCancelled:
+            self.emit("cancelled", stage, name,
+                      duration=time.time() - start_time)
+            raise
+        except Exception as e:
+            self.emit("failed", stage, name, error=str(e),
+                      duration=time.time() - start_time)
+            raise
+        result["duration"] = time.time() - start_time
+        self.emit("finished", stage, name, **result)
+
+    @property
+    def cancelled(self):
+        """ True once cancel() has been called.
+        """
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """ Request the monitored operation to stop. This method may be
+        called from any thread.
+        """
+        self._cancelled.set()
+
+    def check(self):
+        """ Raise RunCancelled if the operation has been cancelled.
+        """
+        if self._cancelled.is_set():
+            raise RunCancelled("Operation cancelled")
+
+    def close(self):
+        """ Signal the end of the operation to the consumers.
+        """
+        with self._lock:
+            sinks = self._sinks
+            self._sinks = []
+            self.closed = True
+        for sink in sinks:
+            sink(None)
+
+    def add_callback(self, callback):
+        """ Call callback(event) for each event, in the thread emitting it.
+        """
+        def sink(event):
+            if event is not None:
+                callback(event)
+        self._add_sink(sink)
+
+    def events(self, timeout=None):
+        """ Iterate over the events, until the monitor is closed.
+
+        The events emitted before this call are not received.
+
+        Parameters
+        ----------
+        timeout: float (optional)
+            stop iterating if no event is received during this time (in
+            seconds). Default: wait until the monitor is closed.
+        """
+        events = queue.Queue()
+        self._add_sink(events.put)
+        return self._iter_events(events, timeout)
+
+    def _iter_events(self, events, timeout):
+        try:
+            while True:
+                try:
+                    event = events.get(timeout=timeout)
+                except queue.Empty:
+                    return
+                if event is None:
+                    return
+                yield event
+        finally:
+            self._remove_sink(events.put)
+
+    def asyncio_queue(self, loop=None):
+        """ Get an asyncio queue receiving the events, then None when the
+        monitor is closed::
+
+            events = monitor.asyncio_queue()
+            event = await events.get()
+
+        Parameters
+        ----------
+        loop: asyncio event loop (optional)
+            the loop of the consumer. Default: the current event loop. The
+            queue has to be created from this loop thread.
+        """
+        import asyncio
+
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        events = asyncio.Queue()
+        self._add_sink(
+            lambda event: loop.call_soon_threadsafe(events.put_nowait, event))
+        return events
+
+
+@contextlib.contextmanager
+def monitored_step(monitor, stage, name, **info):
+    """ RunMonitor.step() context, doing nothing if monitor is None.
+    """
+    if monitor is None:
+        yield {}
+    else:
+        with monitor.step(stage, name, **info) as result:
+            yield result
+
+
+def output_bytes(process):
+    """ Get the size of the existing output files of a process.
+    """
+    size = 0
+    for name, trait in six.iteritems(process.user_traits()):
+        if not trait.output:
+            continue
+        values = getattr(process, name)
+        if not isinstance(values, (list, tuple)):
+            values = [values]
+        for value in values:
+            if isinstance(value, six.string_types) and value \
+                    and os.path.isfile(value):
+                size += os.path.getsize(value)
+    return size
+
+
+def iter_run(study_config, process_or_pipeline, monitor=None, **kwargs):
+    """ Run a process in a background thread and iterate over its events.
+
+    Leaving the iteration before the end cancels the run, which is waited
+    for. Exceptions of the run are raised at the end of the iteration.
+
+    Parameters
+    ----------
+    study_config: StudyConfig (mandatory)
+        the study configuration running the process.
+    process_or_pipeline: Process (mandatory)
+        the process to run.
+    monitor: RunMonitor (optional)
+        the monitor of the run, which is closed at the end of the run.
+        Default: a new monitor.
+    kwargs: dict
+        StudyConfig.run() parameters.
+    """
+    if monitor is None:
+        monitor = RunMonitor()
+    outcome = []
+
+    def run():
+        try:
+            outcome.append((True, study_config.run(
+                process_or_pipeline, monitor=monitor, **kwargs)))
+        except Exception:
+            outcome.append((False, sys.exc_info()))
+        finally:
+            monitor.close()
+
+    events = monitor.events()
+    thread = threading.Thread(target=run)
+    thread.start()
+    finished = False
+    try:
+        for event in events:
+            yield event
+        finished = True
+    finally:
+        if not finished:
+            monitor.cancel()
+        thread.join()
+    success, result = outcome[0]
+    if not success:
+        six.reraise(*result)
@@ -12,7 +12,9 @@ from __future__ import print_function
 import os
 import logging
 import json
+import functools
 import sys
+import time
 import six
 if sys.version_info[:2] >= (2, 7):
     from collections import OrderedDict
@@ -23,17 +25,23 @@ else:
 logger = logging.getLogger(__name__)
 
 # Trait import
-from traits.api import File, Directory, Bool, String, Undefined
+from traits.api import File, Directory, Bool, String, Undefined, Int, Enum
 
 # Soma import
 from soma.controller import Controller
 
 # Capsul import
 from capsul.pipeline.pipeline import Pipeline
+from capsul.pipeline.process_iteration import ProcessIteration
 from capsul.process.process import Process
 from capsul.study_config.run import run_process
-from capsul.pipeline.pipeline_workflow import (
-    workflow_from_pipeline, local_workflow_run)
+from capsul.study_config.local_scheduler import LocalScheduler
+from capsul.study_config.async_scheduler import AsyncScheduler
+from capsul.study_config.worker_pool import WorkerPool
+from capsul.study_config.run_monitor import monitored_step, output_bytes
+from capsul.study_config.run_journal import ExecutionJournal
+from capsul.pipeline.pipeline_scheduling import CostModel
+from capsul.pipeline.pipeline_incremental import IncrementalState
 from capsul.pipeline.pipeline_nodes import Node
 from capsul.study_config.process_instance import get_process_instance
 
@@ -46,6 +54,17 @@ else:
         return d.keys()
 
 
+def _makedirs(directory):
+    """ Create a directory and its parents, not failing if it is created
+    concurrently.
+    """
+    try:
+        os.makedirs(directory)
+    except OSError:
+        if not os.path.isdir(directory):
+            raise
+
+
 class WorkflowExecutionError(Exception):
     def __init__(self, controller, workflow_id):
         super(WorkflowExecutionError, self).__init__('Error during '
@@ -97,10 +116,51 @@ class StudyConfig(Controller):
         subdirectory to output_directory. This subdirectory is named 
         '<count>-<name>' where <count> if self.process_counter and <name> 
         is the name of the process.
+    `local_workers` : int (default 1)
+        Number of pipeline nodes executed concurrently when running without
+        soma-workflow. Independent nodes of the pipeline workflow graph are
+        run at the same time. 0 means one worker per CPU.
+    `local_workers_mode` : str (default 'thread')
+        'thread', 'process' or 'worker': run concurrent nodes in threads,
+        through their command line in separate interpreters, or in a
+        persistent pool of worker interpreters (see
+        capsul.study_config.worker_pool). Processes with a specific command
+        line are run without smart-caching and logging in the 'process' and
+        'worker' modes.
+    `worker_pool_address` : str
+        Socket file of a served worker pool (see
+        capsul.study_config.worker_pool). If set, soma-workflow jobs submit
+        their process to this pool instead of running it in their own
+        interpreter.
+    `critical_path_scheduling` : bool (default False)
+        Start the costliest chains of pipeline nodes first: soma-workflow
+        jobs priorities and the order of concurrent local nodes follow the
+        critical path of the pipeline workflow graph.
+    `runtime_history_file` : str
+        Json file where process runtimes are recorded. Recorded runtimes are
+        used as process costs if critical_path_scheduling is set (see
+        capsul.pipeline.pipeline_scheduling.CostModel).
+    `execution_journal_file` : str
+        File where the nodes completed by local executions are recorded. An
+        interrupted execution is resumed at its first incomplete node by the
+        next one (see capsul.study_config.run_journal).
+    `incremental_run` : bool (default False)
+        Only run the pipeline nodes which are not up to date: nodes whose
+        outputs are older than their inputs, whose parameters changed, and
+        the nodes depending on them (see
+        capsul.pipeline.pipeline_incremental).
+    `incremental_state_file` : str
+        File where the parameters of the nodes run incrementally are
+        recorded. Without it, only files timestamps are compared.
+    `incremental_checks` : str (default 'timestamps')
+        'timestamps' or 'digests': compare the modification times of input
+        and output files, or the contents of input files with the ones
+        recorded in incremental_state_file.
 
     Methods
     -------
     run
+    arun
     reset_process_counter
     set_trait_value
     get_trait
@@ -144,6 +204,59 @@ class StudyConfig(Controller):
              "'<count>-<name>' where <count> if self.process_counter and <name> "
              "is the name of the process.")
 
+    local_workers = Int(
+        1,
+        desc="Number of pipeline nodes executed concurrently when running "
+             "without soma-workflow. 1 means sequential execution, 0 means "
+             "one worker per CPU.")
+
+    local_workers_mode = Enum(
+        "thread", "process", "worker",
+        desc="How nodes are run when local_workers is not 1: 'thread' runs "
+             "processes in threads of the current interpreter, 'process' "
+             "runs each process command line in a separate interpreter, "
+             "'worker' runs processes in a persistent pool of worker "
+             "interpreters. In the 'process' and 'worker' modes, "
+             "smart-caching and logging are not applied to processes "
+             "having a specific command line.")
+
+    worker_pool_address = String(
+        Undefined,
+        desc="Socket file of a served worker pool, used by soma-workflow "
+             "jobs to run their process.")
+
+    critical_path_scheduling = Bool(
+        False,
+        desc="Start the costliest chains of pipeline nodes first, using "
+             "soma-workflow jobs priorities or the local execution order.")
+
+    runtime_history_file = File(
+        Undefined,
+        desc="Json file where process runtimes are recorded, and used as "
+             "process costs for critical path scheduling.")
+
+    execution_journal_file = File(
+        Undefined,
+        desc="File where the nodes completed by local executions are "
+             "recorded, to resume an interrupted execution.")
+
+    incremental_run = Bool(
+        False,
+        desc="Only run the pipeline nodes which are not up to date, and the "
+             "nodes depending on them.")
+
+    incremental_state_file = File(
+        Undefined,
+        desc="File where the parameters of the nodes run incrementally are "
+             "recorded, to detect parameters changes.")
+
+    incremental_checks = Enum(
+        "timestamps", "digests",
+        desc="How incremental runs detect changed files: 'timestamps' "
+             "compares the modification times of inputs and outputs, "
+             "'digests' compares the contents of inputs with the recorded "
+             "ones.")
+
     def __init__(self, study_name=None, init_config=None, modules=None,
                  **override_config):
         """ Initilize the StudyConfig class
@@ -268,7 +381,7 @@ class StudyConfig(Controller):
             return module
 
     def run(self, process_or_pipeline, output_directory= None,
-            executer_qc_nodes=True, verbose=0, **kwargs):
+            executer_qc_nodes=True, verbose=0, monitor=None, **kwargs):
         """Method to execute a process or a pipline in a study configuration
          environment.
 
@@ -278,6 +391,19 @@ class StudyConfig(Controller):
          A valid output directory is exepcted to execute the process or the
          pepeline without soma-workflow.
 
+         Without soma-workflow, pipeline nodes are executed one after the
+         other unless local_workers is not 1: independent nodes are then run
+         concurrently (see LocalScheduler).
+
+         With soma-workflow, the iterations of a ProcessIteration are
+         submitted by batches of workflows, each batch being generated once
+         the previous one is submitted (see
+         capsul.pipeline.pipeline_workflow.workflows_from_iteration).
+
+         If incremental_run is set, up to date nodes are not run again, with
+         or without soma-workflow (see
+         capsul.pipeline.pipeline_incremental).
+
         Parameters
         ----------
         process_or_pipeline: Process or Pipeline instance (mandatory)
@@ -290,104 +416,165 @@ class StudyConfig(Controller):
             process nodes.
         verbose: int
             if different from zero, print console messages.
+        monitor: RunMonitor (optional)
+            receives the workflow generation and execution events of the
+            processes, and stops the execution before the next process when
+            cancelled (see capsul.study_config.run_monitor).
         """
         
-        if self.create_output_directories:
-            for name, trait in process_or_pipeline.user_traits().items():
-                if trait.output and isinstance(trait.handler, (File, Directory)):
-                    value = getattr(process_or_pipeline, name)
-                    if value is not Undefined and value:
-                        base = os.path.dirname(value)
-                        if not os.path.exists(base):
-                            os.makedirs(base)
-                            
+        self._make_output_directories(process_or_pipeline)
+
         # Use soma worflow to execute the pipeline or porcess in parallel
         # on the local machine
         if self.get_trait_value("use_soma_workflow"):
 
+            # soma-workflow is only imported when it is used
+            from capsul.pipeline.pipeline_workflow import (
+                workflow_from_pipeline, workflows_from_iteration,
+                local_workflows_run)
+
+            # Leave out up to date nodes
+            incremental = self._get_incremental_state()
+            disabled_nodes = None
+            if incremental is not None:
+                if isinstance(process_or_pipeline, Pipeline):
+                    nodes = process_or_pipeline.workflow_ordered_nodes()
+                    outdated = incremental.outdated_nodes(
+                        process_or_pipeline, nodes)
+                    disabled_nodes = set(
+                        process_or_pipeline.disabled_pipeline_steps_nodes())
+                    disabled_nodes.update(set(nodes).difference(outdated))
+                else:
+                    outdated = incremental.outdated_nodes(
+                        process_or_pipeline, [process_or_pipeline])
+                    if not outdated:
+                        return None
+
             # Create soma workflow pipeline
-            workflow = workflow_from_pipeline(process_or_pipeline)
-            controller, wf_id = local_workflow_run(process_or_pipeline.id,
-                                                   workflow)
-            workflow_status = controller.workflow_status(wf_id)
-            elements_status = controller.workflow_elements_status(wf_id)
-            # FIXME: it would be better if study_config does not require
-            # soma_workflow modules.
+            cost_model = None
+            if self.critical_path_scheduling:
+                cost_model = self._get_cost_model()
+            if isinstance(process_or_pipeline, ProcessIteration):
+                # Iterations are submitted by batches, each batch being
+                # generated once the previous one is submitted
+                workflows = (
+                    ("{0}_{1}".format(process_or_pipeline.id, batch[0]),
+                     workflow)
+                    for batch, workflow in workflows_from_iteration(
+                        process_or_pipeline, cost_model=cost_model,
+                        monitor=monitor))
+            else:
+                workflows = [(process_or_pipeline.id, workflow_from_pipeline(
+                    process_or_pipeline, disabled_nodes=disabled_nodes,
+                    cost_model=cost_model, monitor=monitor))]
+            # soma-workflow jobs are not monitored individually
+            with monitored_step(monitor, "execution",
+                                process_or_pipeline.id):
+                controller, wf_ids = local_workflows_run(workflows)
             from soma_workflow import constants as swconstants
             from soma_workflow.utils import Helper
-            self.failed_jobs = Helper.list_failed_jobs(wf_id, controller)
-            #self.failed_jobs = [
-                #element for element in elements_status[0]
-                #if element[1] != swconstants.DONE
-                #or element[3][0] != swconstants.FINISHED_REGULARLY]
-            # if execution was OK, delete the workflow
-            if workflow_status == swconstants.WORKFLOW_DONE \
-                    and len(self.failed_jobs) == 0:
-                controller.delete_workflow(wf_id)
-            else:
+            self.failed_jobs = []
+            failed_workflows = []
+            for wf_id in wf_ids:
+                workflow_status = controller.workflow_status(wf_id)
+                failed_jobs = Helper.list_failed_jobs(wf_id, controller)
+                self.failed_jobs.extend(failed_jobs)
+                # if execution was OK, delete the workflow
+                if workflow_status == swconstants.WORKFLOW_DONE \
+                        and len(failed_jobs) == 0:
+                    controller.delete_workflow(wf_id)
+                else:
+                    failed_workflows.append(wf_id)
+            if failed_workflows:
                 # something went wrong: raise an exception containing
                 # controller object and workflow id.
-                raise WorkflowExecutionError(controller, wf_id)
+                if len(failed_workflows) > 1:
+                    logger.error("Workflows {0} failed and were not "
+                                 "removed".format(failed_workflows))
+                raise WorkflowExecutionError(controller, failed_workflows[0])
+            if incremental is not None:
+                for node in outdated:
+                    incremental.record(node)
 
         # Use the local machine to execute the pipeline or process
         else:
-            if output_directory is None or output_directory is Undefined:
-                output_directory = self.output_directory
-            # Not all processes need an output_directory defined on
-            # StudyConfig
-            if output_directory is not None and output_directory is not Undefined:
-                # Check the output directory is valid
-                if not isinstance(output_directory, basestring):
-                    raise ValueError(
-                        "'{0}' is not a valid directory. A valid output "
-                        "directory is expected to run the process or "
-                        "pipeline.".format(output_directory))
-                try:
-                    if not os.path.isdir(output_directory):
-                        os.makedirs(output_directory)
-                except:
-                    raise ValueError(
-                        "Can't create folder '{0}', please investigate.".format(
-                            output_directory))
+            output_directory = self._local_output_directory(output_directory)
 
             # Temporary files can be generated for pipelines
             temporary_files = []
             result = None
+            cost_model = self._get_cost_model()
+            incremental = self._get_incremental_state()
             try:
                 # Generate ordered execution list
                 execution_list = []
                 if isinstance(process_or_pipeline, Pipeline):
-                    execution_list = \
-                        process_or_pipeline.workflow_ordered_nodes()
-                    # Filter process nodes if necessary
-                    if not executer_qc_nodes:
-                        execution_list = [node for node in execution_list
-                                        if node.node_type != "view_node"]
-                    for node in execution_list:
-                        # check temporary outputs and allocate files
-                        process_or_pipeline._check_temporary_files_for_node(
-                            node, temporary_files)
+                    execution_list = self._pipeline_execution_list(
+                        process_or_pipeline, executer_qc_nodes,
+                        temporary_files, incremental)
                 elif isinstance(process_or_pipeline, Process):
                     execution_list.append(process_or_pipeline)
+                    if incremental is not None:
+                        execution_list = incremental.outdated_nodes(
+                            process_or_pipeline, execution_list)
                 else:
                     raise Exception(
                         "Unknown instance type. Got {0}and expect Process or "
                         "Pipeline instances".format(
                             process_or_pipeline.__module__.name__))
 
+                # Skip the nodes completed by an interrupted execution
+                journal = self._get_execution_journal()
+                if journal is not None:
+                    execution_list = journal.pending_nodes(
+                        process_or_pipeline, execution_list)
+
+                # Execute independent nodes concurrently
+                if (isinstance(process_or_pipeline, Pipeline)
+                        and self.local_workers != 1):
+                    scheduler = LocalScheduler(
+                        self, workers=self.local_workers,
+                        mode=self.local_workers_mode,
+                        cost_model=cost_model, monitor=monitor,
+                        journal=journal, incremental=incremental,
+                        order_by_cost=self.critical_path_scheduling)
+                    result = scheduler.run(process_or_pipeline,
+                                           execution_list, output_directory,
+                                           verbose, **kwargs)
+                    execution_list = []
+
                 # Execute each process node element
                 for process_node in execution_list:
                     # Execute the process instance contained in the node
                     if isinstance(process_node, Node):
-                        result = self._run(process_node.process, 
-                                           output_directory, 
-                                           verbose, **kwargs)
-
+                        process_instance = process_node.process
                     # Execute the process instance
                     else:
-                        result = self._run(process_node, output_directory,
-                                           verbose, **kwargs)
+                        process_instance = process_node
+                    if journal is not None:
+                        signature = journal.signature(process_instance)
+                    start_time = time.time()
+                    with monitored_step(monitor, "execution",
+                                        process_instance.id) as step:
+                        result = self._run(process_instance,
+                                           output_directory, verbose,
+                                           **kwargs)
+                        step["bytes"] = output_bytes(process_instance)
+                    if cost_model is not None:
+                        cost_model.record(process_instance,
+                                          time.time() - start_time)
+                    if journal is not None:
+                        journal.record(process_node, signature)
+                    if incremental is not None:
+                        incremental.record(process_node)
+
+                # The execution is complete, it will not be resumed
+                if journal is not None:
+                    journal.remove()
             finally:
+                # Keep the runtimes of the executed processes
+                if cost_model is not None:
+                    cost_model.save()
                 # Destroy temporary files
                 if temporary_files:
                     # If temporary files have been created, we are sure that
@@ -396,6 +583,159 @@ class StudyConfig(Controller):
                     process_or_pipeline._free_temporary_files(temporary_files)
             return result
 
+    def arun(self, process_or_pipeline, output_directory=None,
+             executer_qc_nodes=True, verbose=0, monitor=None, loop=None,
+             **kwargs):
+        """ Execute a process or a pipeline from an asyncio event loop,
+        without blocking it.
+
+        Pipeline nodes are run by an AsyncScheduler: at most local_workers
+        independent nodes at the same time (one per CPU if local_workers is
+        lower than 1), command lines in asyncio subprocesses in the 'process'
+        local_workers_mode, other processes in the loop executor. Single
+        processes and soma-workflow executions are entirely run by run() in
+        the loop executor::
+
+            returncode = await study_config.arun(pipeline)
+
+        Parameters
+        ----------
+        process_or_pipeline, output_directory, executer_qc_nodes, verbose,
+        monitor, kwargs:
+            see run().
+        loop: asyncio event loop (optional)
+            the loop running the execution. Default: the current event loop.
+
+        Returns
+        -------
+        result: asyncio.Future
+            the result of run(). Cancelling it stops the execution: no new
+            node is started and running command lines are killed.
+        """
+        import asyncio
+
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        if self.get_trait_value("use_soma_workflow") \
+                or not isinstance(process_or_pipeline, Pipeline):
+            return loop.run_in_executor(None, functools.partial(
+                self.run, process_or_pipeline, output_directory,
+                executer_qc_nodes, verbose, monitor, **kwargs))
+
+        self._make_output_directories(process_or_pipeline)
+        output_directory = self._local_output_directory(output_directory)
+        temporary_files = []
+        cost_model = self._get_cost_model()
+        incremental = self._get_incremental_state()
+
+        def finalize():
+            # Keep the runtimes and destroy temporary files once no node is
+            # running anymore
+            if cost_model is not None:
+                cost_model.save()
+            if temporary_files:
+                process_or_pipeline._free_temporary_files(temporary_files)
+
+        try:
+            execution_list = self._pipeline_execution_list(
+                process_or_pipeline, executer_qc_nodes, temporary_files,
+                incremental)
+            journal = self._get_execution_journal()
+            if journal is not None:
+                execution_list = journal.pending_nodes(process_or_pipeline,
+                                                       execution_list)
+            scheduler = AsyncScheduler(
+                self, workers=self.local_workers,
+                mode=self.local_workers_mode, cost_model=cost_model,
+                monitor=monitor, journal=journal, incremental=incremental,
+                order_by_cost=self.critical_path_scheduling, loop=loop)
+        except Exception:
+            finalize()
+            raise
+        result = scheduler.run(process_or_pipeline, execution_list,
+                               output_directory, verbose, on_stop=finalize,
+                               **kwargs)
+        if journal is not None:
+            # The execution is complete, it will not be resumed
+            result.add_done_callback(
+                lambda future: future.cancelled() or future.exception()
+                or journal.remove())
+        return result
+
+    def _make_output_directories(self, process_or_pipeline):
+        """ Create the directories of the process output files, if
+        create_output_directories is set.
+        """
+        if self.create_output_directories:
+            for name, trait in process_or_pipeline.user_traits().items():
+                if trait.output and isinstance(trait.handler, (File, Directory)):
+                    value = getattr(process_or_pipeline, name)
+                    if value is not Undefined and value:
+                        base = os.path.dirname(value)
+                        if not os.path.exists(base):
+                            _makedirs(base)
+
+    def _local_output_directory(self, output_directory):
+        """ Check and create the output directory of a local execution.
+
+        Returns
+        -------
+        output_directory: str
+            the given output directory, or self.output_directory if it is
+            not defined.
+        """
+        if output_directory is None or output_directory is Undefined:
+            output_directory = self.output_directory
+        # Not all processes need an output_directory defined on
+        # StudyConfig
+        if output_directory is not None and output_directory is not Undefined:
+            # Check the output directory is valid
+            if not isinstance(output_directory, basestring):
+                raise ValueError(
+                    "'{0}' is not a valid directory. A valid output "
+                    "directory is expected to run the process or "
+                    "pipeline.".format(output_directory))
+            try:
+                if not os.path.isdir(output_directory):
+                    _makedirs(output_directory)
+            except:
+                raise ValueError(
+                    "Can't create folder '{0}', please investigate.".format(
+                        output_directory))
+        return output_directory
+
+    def _pipeline_execution_list(self, pipeline, executer_qc_nodes,
+                                 temporary_files, incremental=None):
+        """ Get the ordered list of the nodes to execute, and allocate their
+        temporary files.
+
+        Parameters
+        ----------
+        pipeline: Pipeline (mandatory)
+            the executed pipeline.
+        executer_qc_nodes: bool (mandatory)
+            if False, quality control nodes are filtered out.
+        temporary_files: list (mandatory)
+            the allocated temporary files are appended to this list, they
+            have to be released with pipeline._free_temporary_files().
+        incremental: IncrementalState (optional)
+            if set, up to date nodes are filtered out. They are filtered
+            before temporary files are allocated, which would make them
+            exist.
+        """
+        execution_list = pipeline.workflow_ordered_nodes()
+        # Filter process nodes if necessary
+        if not executer_qc_nodes:
+            execution_list = [node for node in execution_list
+                              if node.node_type != "view_node"]
+        if incremental is not None:
+            execution_list = incremental.outdated_nodes(pipeline,
+                                                        execution_list)
+        for node in execution_list:
+            # check temporary outputs and allocate files
+            pipeline._check_temporary_files_for_node(node, temporary_files)
+        return execution_list
+
     def _run(self, process_instance, output_directory, verbose, **kwargs):
         """ Method to execute a process in a study configuration environment.
 
@@ -414,6 +754,40 @@ class StudyConfig(Controller):
             process_instance.id))
 
         # Run
+        output_directory, cachedir = self._prepare_run(process_instance,
+                                                       output_directory)
+        returncode, log_file = run_process(
+            output_directory,
+            process_instance,
+            cachedir=cachedir,
+            generate_logging=self.generate_logging,
+            verbose=verbose,
+            cache_options=self._get_cache_options(),
+            **kwargs)
+
+        # Increment the number of executed process count
+        self.process_counter += 1
+        return returncode
+    
+
+    def _prepare_run(self, process_instance, output_directory):
+        """ Set up the output and cache directories of a process execution.
+
+        Parameters
+        ----------
+        process_instance: Process instance (mandatory)
+            the process we want to execute
+        output_directory: Directory name (optional)
+            the output directory to use for process execution.
+
+        Returns
+        -------
+        output_directory: str
+            the process output directory, specific to the process if
+            self.process_output_directory is set.
+        cachedir: str
+            the smart-caching directory, None if caching is disabled.
+        """
         if self.get_trait_value("use_smart_caching") in [None, False]:
             cachedir = None
         else:
@@ -425,25 +799,103 @@ class StudyConfig(Controller):
                 output_directory = os.path.join(output_directory, '%s-%s' % (self.process_counter, process_instance.name))
             # Guarantee that the output directory exists
             if not os.path.isdir(output_directory):
-                os.makedirs(output_directory)
+                _makedirs(output_directory)
             if self.process_output_directory:
                 if 'output_directory' in process_instance.user_traits():
                     if (process_instance.output_directory is Undefined or
                             not(process_instance.output_directory)):
                         process_instance.output_directory = output_directory
-        
-        returncode, log_file = run_process(
-            output_directory,
-            process_instance,
-            cachedir=cachedir,
-            generate_logging=self.generate_logging,
-            verbose=verbose,
-            **kwargs)
+        return output_directory, cachedir
 
-        # Increment the number of executed process count
-        self.process_counter += 1
-        return returncode
-    
+    def _get_cache_options(self):
+        """ Get the smart-caching budget and restoration options.
+
+        Returns
+        -------
+        cache_options: dict
+            Memory parameters defined by the SmartCachingConfig module.
+        """
+        cache_options = {}
+        max_size = self.get_trait_value("smart_caching_max_size")
+        if max_size:
+            cache_options["max_size"] = int(max_size * 1024 * 1024)
+        max_age = self.get_trait_value("smart_caching_max_age")
+        if max_age:
+            cache_options["max_age"] = max_age * 24 * 3600
+        if self.get_trait_value("smart_caching_hardlinks"):
+            cache_options["hardlinks"] = True
+        if self.get_trait_value("smart_caching_content_fingerprints"):
+            cache_options["content_fingerprints"] = True
+        return cache_options
+
+    def _get_worker_pool(self, workers):
+        """ Get the persistent worker pool used by the 'worker' local mode.
+
+        The pool is created on first use and kept for the next runs.
+
+        Parameters
+        ----------
+        workers: int (mandatory)
+            the number of workers of the pool.
+
+        Returns
+        -------
+        pool: WorkerPool
+            the pool of worker interpreters.
+        """
+        pool = getattr(self, "_worker_pool", None)
+        if pool is None or pool.workers != workers:
+            if pool is not None:
+                pool.close()
+            pool = WorkerPool(workers)
+            self._worker_pool = pool
+        return pool
+
+    def _get_cost_model(self):
+        """ Get the model estimating process costs.
+
+        Returns
+        -------
+        cost_model: CostModel
+            a model learning runtimes in self.runtime_history_file, or None
+            if neither this file nor critical_path_scheduling are set.
+        """
+        history_file = self.get_trait_value("runtime_history_file")
+        if history_file is Undefined:
+            history_file = None
+        if not history_file and not self.critical_path_scheduling:
+            return None
+        return CostModel(history_file)
+
+    def _get_execution_journal(self):
+        """ Get the journal of local executions.
+
+        Returns
+        -------
+        journal: ExecutionJournal
+            the journal in self.execution_journal_file, None if this file is
+            not set.
+        """
+        journal_file = self.get_trait_value("execution_journal_file")
+        if journal_file is Undefined or not journal_file:
+            return None
+        return ExecutionJournal(journal_file)
+
+    def _get_incremental_state(self):
+        """ Get the up to date checks of incremental runs.
+
+        Returns
+        -------
+        incremental: IncrementalState
+            the state in self.incremental_state_file, None if
+            incremental_run is not set.
+        """
+        if not self.incremental_run:
+            return None
+        state_file = self.get_trait_value("incremental_state_file")
+        if state_file is Undefined or not state_file:
+            state_file = None
+        return IncrementalState(state_file, self.incremental_checks)
 
     def reset_process_counter(self):
         """ Method to reset the process counter to one.
@@ -0,0 +1,95 @@
+##########################################################################
+# Capsul - Copyright (C) CEA, 2014
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+
+# Capsul import
+from capsul.study_config.study_config import StudyConfig
+from capsul.study_config.test.test_local_scheduler import (
+    TwoBranchesPipeline, executed, rendez_vous)
+
+# Trait import
+from traits.api import Undefined
+
+
+@unittest.skipIf(sys.version_info[0] < 3, "asyncio is not available")
+class TestAsyncRun(unittest.TestCase):
+    """ Execute a pipeline from an asyncio event loop.
+    """
+    def setUp(self):
+        import asyncio
+
+        rendez_vous.clear()
+        del executed[:]
+        self.loop = asyncio.new_event_loop()
+        self.output_directory = tempfile.mkdtemp()
+        self.study_config = StudyConfig(
+            modules=[], local_workers=2,
+            output_directory=self.output_directory)
+        self.pipeline = self.study_config.get_process_instance(
+            TwoBranchesPipeline)
+        for name in ("a", "b"):
+            path = os.path.join(self.output_directory, name + ".txt")
+            open(path, "w").write("branch %s\n" % name)
+            setattr(self.pipeline, "input_" + name, path)
+            setattr(self.pipeline, "output_" + name,
+                    os.path.join(self.output_directory, "out_%s.txt" % name))
+        self.pipeline.middle_a = os.path.join(self.output_directory,
+                                              "middle_a.txt")
+
+    def tearDown(self):
+        self.loop.close()
+        shutil.rmtree(self.output_directory)
+
+    def arun(self):
+        return self.loop.run_until_complete(
+            self.study_config.arun(self.pipeline, loop=self.loop))
+
+    def test_concurrent_run(self):
+        """ Independent branches run at the same time, temporary files are
+        released.
+        """
+        self.pipeline.nodes["a1"].process.wait_for = self.pipeline.input_b
+        self.arun()
+        self.assertEqual(open(self.pipeline.output_a).read(), "branch a\n")
+        self.assertEqual(open(self.pipeline.output_b).read(), "branch b\n")
+        self.assertTrue(
+            self.pipeline.nodes["b1"].process.output_file is Undefined)
+
+    def test_commandline_run(self):
+        """ Command lines are run in asyncio subprocesses.
+        """
+        self.study_config.local_workers_mode = "process"
+        self.arun()
+        self.assertEqual(open(self.pipeline.output_a).read(), "branch a\n")
+        self.assertEqual(open(self.pipeline.output_b).read(), "branch b\n")
+        self.assertEqual(executed, [])
+
+    def test_failure(self):
+        """ Failures are raised by the awaited result.
+        """
+        self.pipeline.fail_b = True
+        self.assertRaises(RuntimeError, self.arun)
+        self.assertFalse(os.path.exists(self.pipeline.output_b))
+
+
+def test():
+    """ Function to execute unitest.
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestAsyncRun)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
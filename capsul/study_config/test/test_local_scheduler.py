@@ -0,0 +1,263 @@
+##########################################################################
+# Capsul - Copyright (C) CEA, 2014
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import unittest
+import tempfile
+import shutil
+import threading
+import json
+import os
+import sys
+import subprocess
+
+# Capsul import
+from capsul.api import Process, Pipeline
+from capsul.study_config.study_config import StudyConfig
+from capsul.pipeline.pipeline_scheduling import (workflow_dependencies,
+                                                 CostModel)
+from capsul.study_config.local_scheduler import LocalScheduler
+from capsul.study_config.worker_pool import WorkerPool
+from capsul.study_config.memory import Memory
+
+# Trait import
+from traits.api import File, Bool, Undefined
+
+
+# Events shared by the processes to check that branches run concurrently
+rendez_vous = {}
+# Input files of the executed processes, in execution order
+executed = []
+
+
+class CopyProcess(Process):
+    """ Copy a file, optionally waiting for another process to be running.
+    """
+    input_file = File(optional=False)
+    output_file = File(optional=False, output=True)
+    wait_for = File(optional=True)
+    fail = Bool(False, optional=True)
+
+    def _run_process(self):
+        executed.append(self.input_file)
+        rendez_vous.setdefault(self.input_file, threading.Event()).set()
+        if self.wait_for:
+            event = rendez_vous.setdefault(self.wait_for, threading.Event())
+            if not event.wait(10):
+                raise RuntimeError("branches are not run concurrently")
+        if self.fail:
+            raise RuntimeError("failure requested")
+        with open(self.output_file, "w") as f:
+            f.write(open(self.input_file).read())
+
+
+class TwoBranchesPipeline(Pipeline):
+    """ Two independent branches of two nodes, the second branch using a
+    temporary file.
+    """
+    def pipeline_definition(self):
+        self.add_process("a1", CopyProcess)
+        self.add_process("a2", CopyProcess)
+        self.add_process("b1", CopyProcess)
+        self.add_process("b2", CopyProcess)
+        self.add_link("a1.output_file->a2.input_file")
+        self.add_link("b1.output_file->b2.input_file")
+        self.export_parameter("a1", "input_file", "input_a")
+        self.export_parameter("b1", "input_file", "input_b")
+        self.export_parameter("a1", "output_file", "middle_a")
+        self.export_parameter("a2", "output_file", "output_a")
+        self.export_parameter("b2", "output_file", "output_b")
+        self.export_parameter("b1", "fail", "fail_b")
+
+
+class TestLocalScheduler(unittest.TestCase):
+    """ Execute a pipeline with concurrent local workers.
+    """
+    def setUp(self):
+        rendez_vous.clear()
+        del executed[:]
+        self.output_directory = tempfile.mkdtemp()
+        self.study_config = StudyConfig(
+            modules=[], local_workers=2,
+            output_directory=self.output_directory)
+        self.pipeline = self.study_config.get_process_instance(
+            TwoBranchesPipeline)
+        self.input_a = os.path.join(self.output_directory, "a.txt")
+        self.input_b = os.path.join(self.output_directory, "b.txt")
+        open(self.input_a, "w").write("branch a\n")
+        open(self.input_b, "w").write("branch b\n")
+        self.pipeline.input_a = self.input_a
+        self.pipeline.input_b = self.input_b
+        self.pipeline.middle_a = os.path.join(self.output_directory,
+                                              "middle_a.txt")
+        self.pipeline.output_a = os.path.join(self.output_directory,
+                                              "out_a.txt")
+        self.pipeline.output_b = os.path.join(self.output_directory,
+                                              "out_b.txt")
+
+    def tearDown(self):
+        shutil.rmtree(self.output_directory)
+
+    def test_dependencies(self):
+        """ Dependencies are flattened from the workflow graph.
+        """
+        nodes = self.pipeline.nodes
+        dependencies = workflow_dependencies(self.pipeline.workflow_graph())
+        self.assertEqual(dependencies[nodes["a1"]], set())
+        self.assertEqual(dependencies[nodes["a2"]], set([nodes["a1"]]))
+        self.assertEqual(dependencies[nodes["b2"]], set([nodes["b1"]]))
+
+    def test_concurrent_run(self):
+        """ Independent branches run at the same time, temporary files are
+        allocated and released.
+        """
+        # a1 waits until b1 is running, and b2 until a2 is running
+        self.pipeline.nodes["a1"].process.wait_for = self.input_b
+        self.pipeline.nodes["b2"].process.wait_for = self.pipeline.middle_a
+        self.study_config.run(self.pipeline)
+        self.assertEqual(open(self.pipeline.output_a).read(), "branch a\n")
+        self.assertEqual(open(self.pipeline.output_b).read(), "branch b\n")
+        self.assertTrue(
+            self.pipeline.nodes["b1"].process.output_file is Undefined)
+
+    def test_first_failure(self):
+        """ A failure stops the execution and is raised.
+        """
+        self.pipeline.fail_b = True
+        self.assertRaises(RuntimeError, self.study_config.run,
+                          self.pipeline)
+        self.assertFalse(os.path.exists(self.pipeline.output_b))
+
+
+    def test_critical_path_order(self):
+        """ The costliest branch is started first, and runtimes are
+        recorded in the cost model.
+        """
+        middle_b = os.path.join(self.output_directory, "middle_b.txt")
+        self.pipeline.nodes["b1"].process.output_file = middle_b
+        self.pipeline.nodes["b2"].process.estimated_cost = 10
+        cost_model = CostModel()
+        scheduler = LocalScheduler(self.study_config, workers=1,
+                                   cost_model=cost_model)
+        scheduler.run(self.pipeline, self.pipeline.workflow_ordered_nodes(),
+                      self.output_directory)
+        self.assertEqual(executed[:2], [self.input_b, middle_b])
+        process_id = self.pipeline.nodes["a1"].process.id
+        self.assertEqual(cost_model.runtimes[process_id][0], 4)
+
+    def test_runtimes_without_critical_path(self):
+        """ Without cost ordering, the execution order is kept and runtimes
+        are still recorded.
+        """
+        self.pipeline.nodes["b1"].process.output_file = os.path.join(
+            self.output_directory, "middle_b.txt")
+        execution_list = self.pipeline.workflow_ordered_nodes()
+        # the costliest branch is not the first one of the list
+        execution_list[-1].process.estimated_cost = 10
+        cost_model = CostModel()
+        scheduler = LocalScheduler(self.study_config, workers=1,
+                                   cost_model=cost_model, order_by_cost=False)
+        scheduler.run(self.pipeline, execution_list, self.output_directory)
+        self.assertEqual(executed[0], execution_list[0].process.input_file)
+        process_id = self.pipeline.nodes["a1"].process.id
+        self.assertEqual(cost_model.runtimes[process_id][0], 4)
+
+    def test_runtime_history(self):
+        """ Sequential runs record process runtimes in the history file.
+        """
+        history_file = os.path.join(self.output_directory, "runtimes.json")
+        self.study_config.local_workers = 1
+        self.study_config.runtime_history_file = history_file
+        self.study_config.run(self.pipeline)
+        self.study_config.run(self.pipeline)
+        process = self.pipeline.nodes["a1"].process
+        with open(history_file) as f:
+            self.assertEqual(json.load(f)[process.id][0], 8)
+        self.assertTrue(CostModel(history_file).cost(process) >= 0)
+        process.estimated_cost = 3
+        self.assertEqual(CostModel(history_file).cost(process), 3.)
+
+    def test_worker_mode(self):
+        """ Nodes are run in persistent worker interpreters, which are kept
+        between runs, and their output values are set back.
+        """
+        self.study_config.local_workers_mode = "worker"
+        self.study_config.run(self.pipeline)
+        self.assertEqual(open(self.pipeline.output_a).read(), "branch a\n")
+        self.assertEqual(open(self.pipeline.output_b).read(), "branch b\n")
+        pool = self.study_config._get_worker_pool(2)
+        self.study_config.run(self.pipeline)
+        self.assertTrue(self.study_config._get_worker_pool(2) is pool)
+        self.pipeline.fail_b = True
+        self.assertRaises(RuntimeError, self.study_config.run,
+                          self.pipeline)
+        pool.close()
+
+    def test_worker_mode_smart_caching(self):
+        """ Workers run processes through the smart-caching memory.
+        """
+        study_config = StudyConfig(
+            modules=["SmartCachingConfig"], use_smart_caching=True,
+            local_workers=2, local_workers_mode="worker",
+            output_directory=self.output_directory)
+        study_config.run(self.pipeline)
+        memory = Memory(self.output_directory)
+        self.assertEqual(memory.stats()["misses"], 4)
+        study_config.run(self.pipeline)
+        self.assertEqual(open(self.pipeline.output_a).read(), "branch a\n")
+        self.assertEqual(memory.stats()["hits"], 4)
+        study_config._get_worker_pool(2).close()
+
+    def test_process_mode_smart_caching(self):
+        """ Process command lines run through the smart-caching memory.
+        """
+        study_config = StudyConfig(
+            modules=["SmartCachingConfig"], use_smart_caching=True,
+            local_workers=2, local_workers_mode="process",
+            output_directory=self.output_directory)
+        study_config.run(self.pipeline)
+        memory = Memory(self.output_directory)
+        self.assertEqual(memory.stats()["misses"], 4)
+        study_config.run(self.pipeline)
+        self.assertEqual(open(self.pipeline.output_b).read(), "branch b\n")
+        self.assertEqual(memory.stats()["hits"], 4)
+
+    def test_served_pool(self):
+        """ Command lines submit their process to a served pool.
+        """
+        address = os.path.join(self.output_directory, "workers")
+        pool = WorkerPool(1, [CopyProcess.__module__])
+        pool.serve(address)
+        try:
+            process = self.pipeline.nodes["a1"].process
+            commandline = process.get_commandline(worker_address=address)
+            commandline[0] = sys.executable
+            subprocess.check_call(commandline)
+            self.assertEqual(open(self.pipeline.middle_a).read(),
+                             "branch a\n")
+            process.fail = True
+            commandline = process.get_commandline(worker_address=address)
+            commandline[0] = sys.executable
+            with open(os.devnull, "w") as devnull:
+                self.assertEqual(subprocess.call(commandline,
+                                                 stderr=devnull), 1)
+        finally:
+            pool.close()
+        self.assertFalse(os.path.exists(address))
+
+
+def test():
+    """ Function to execute unitest.
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestLocalScheduler)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
@@ -13,6 +13,9 @@ import unittest
 import os
 import tempfile
 import shutil
+import json
+import time
+import threading
 
 # Capsul import
 from capsul.api import Process
@@ -50,6 +53,40 @@ class DummyCopyProcess(FileCopyProcess):
         self.s = repr(self.copied_inputs)
 
 
+class DummyWriteProcess(Process):
+    """ Dummy file writer.
+    """
+    f = Float(output=False, optional=False, desc="a float")
+    content = String(output=False, optional=False, desc="the file content")
+    o = File(output=True, optional=False, desc="the written file")
+
+    def _run_process(self):
+        with open(self.o, "w") as open_file:
+            open_file.write(self.content * 500)
+
+
+class DummySlowProcess(Process):
+    """ Dummy process counting its executions.
+    """
+    executions = []
+    f = Float(output=False, optional=False, desc="a float")
+    res = Float(output=True, desc="a float")
+
+    def _run_process(self):
+        self.executions.append(self.f)
+        time.sleep(0.2)
+        self.res = 2 * self.f
+
+
+class DummyFailProcess(Process):
+    """ Dummy failing process.
+    """
+    f = Float(output=False, optional=False, desc="a float")
+
+    def _run_process(self):
+        raise RuntimeError("failure requested")
+
+
 class TestMemory(unittest.TestCase):
     """ Execute a process using smart-caching functionalities.
     """
@@ -92,6 +129,174 @@ class TestMemory(unittest.TestCase):
         # Call the test
         self.proxy_process_copy()
 
+    def test_blob_store(self):
+        """ Test output files deduplication, restoration and eviction.
+        """
+        # Create the memory object
+        self.cachedir = os.path.join(self.workspace_dir, "cache")
+        self.mem = Memory(self.cachedir)
+        store = self.mem.store
+        output = os.path.join(self.workspace_dir, "out.txt")
+        proxy_process = self.mem.cache(DummyWriteProcess(), verbose=0)
+
+        # Identical outputs of different calls are stored once
+        proxy_process(f=1., content="a", o=output)
+        proxy_process(f=2., content="a", o=output)
+        blobs = [fname for root, dirs, files in os.walk(store.blobdir)
+                 for fname in files if root != store.blobdir]
+        self.assertEqual(len(blobs), 1)
+        self.assertEqual(self.mem.stats()["misses"], 2)
+        self.assertEqual(self.mem.stats()["bytes_saved"], 500)
+
+        # Cached files are restored
+        os.unlink(output)
+        proxy_process(f=1., content="a", o=output)
+        self.assertEqual(open(output).read(), "a" * 500)
+        self.assertEqual(self.mem.stats()["hits"], 1)
+
+        # Least recently used entries are removed to fit the budget
+        store.max_size = sum(
+            os.path.getsize(os.path.join(root, fname))
+            for root, dirs, files in os.walk(self.mem.cachedir)
+            for fname in files if fname != "stats.json")
+        proxy_process(f=3., content="b", o=output)
+        self.assertEqual(self.mem.stats()["evictions"], 2)
+        self.assertFalse(os.path.isfile(store.blob_path(blobs[0])))
+        os.unlink(output)
+        proxy_process(f=3., content="b", o=output)
+        self.assertEqual(self.mem.stats()["hits"], 2)
+        self.assertEqual(open(output).read(), "b" * 500)
+
+    def test_partial_eviction(self):
+        """ Test that only the entries exceeding the budget are removed.
+        """
+        # Create the memory object
+        self.cachedir = os.path.join(self.workspace_dir, "cache")
+        self.mem = Memory(self.cachedir)
+        store = self.mem.store
+        output = os.path.join(self.workspace_dir, "out.txt")
+        proxy_process = self.mem.cache(DummyWriteProcess(), verbose=0)
+
+        def cache_state():
+            entries = [root for root, dirs, files in os.walk(self.cachedir)
+                       if "result.json" in files]
+            blobs = [fname for root, dirs, files in os.walk(store.blobdir)
+                     for fname in files if root != store.blobdir]
+            size = sum(os.path.getsize(os.path.join(root, fname))
+                       for root, dirs, files in os.walk(self.cachedir)
+                       for fname in files if fname != "stats.json")
+            return entries, blobs, size
+
+        # Fill the cache with entries using distinct files
+        for i in range(10):
+            proxy_process(f=float(i), content=chr(ord("a") + i), o=output)
+        entries, blobs, size = cache_state()
+        self.assertEqual((len(entries), len(blobs)), (10, 10))
+
+        # One more entry only removes the least recently used one
+        store.max_size = size + size // 20
+        proxy_process(f=10., content="k", o=output)
+        self.assertEqual(self.mem.stats()["evictions"], 1)
+        entries, blobs, size = cache_state()
+        self.assertEqual((len(entries), len(blobs)), (10, 10))
+        self.assertTrue(size <= store.max_size)
+
+    def test_lock_files(self):
+        """ Test that the locks of removed or failed entries are deleted.
+        """
+        # Create the memory object
+        self.cachedir = os.path.join(self.workspace_dir, "cache")
+        self.mem = Memory(self.cachedir)
+        store = self.mem.store
+        output = os.path.join(self.workspace_dir, "out.txt")
+        proxy_process = self.mem.cache(DummyWriteProcess(), verbose=0)
+
+        def lock_files():
+            return sorted(os.path.join(root, fname)
+                          for root, dirs, files in os.walk(self.cachedir)
+                          for fname in files if fname.endswith(".lock")
+                          and not root.startswith(store.blobdir))
+
+        # A failed computation leaves the lock of a missing entry
+        self.assertRaises(RuntimeError,
+                          self.mem.cache(DummyFailProcess(), verbose=0), f=1.)
+        for i in range(3):
+            proxy_process(f=float(i), content="a", o=output)
+        self.assertEqual(len(lock_files()), 4)
+
+        # Only the locks of the remaining entries are kept
+        store.evict(max_size=1)
+        self.assertEqual(self.mem.stats()["evictions"], 3)
+        self.assertEqual(lock_files(), [])
+        proxy_process(f=1., content="a", o=output)
+        self.assertEqual(len(lock_files()), 1)
+
+    def test_content_fingerprints(self):
+        """ Test input files identification by content.
+        """
+        # Create the memory object
+        self.cachedir = os.path.join(self.workspace_dir, "cache")
+        self.mem = Memory(self.cachedir, content_fingerprints=True)
+        os.mkdir(os.path.join(self.workspace_dir, "inputs"))
+        input_file = os.path.join(self.workspace_dir, "inputs", "in.txt")
+        with open(input_file, "w") as open_file:
+            open_file.write("a")
+        proxy_process = self.mem.cache(DummyCopyProcess(), verbose=0)
+        proxy_process.destination = self.workspace_dir
+
+        # A copy with the same content and another mtime is a hit
+        proxy_process(f=1., i=input_file, l=[])
+        stat = os.stat(input_file)
+        shutil.copy(input_file, input_file + ".bak")
+        os.rename(input_file + ".bak", input_file)
+        os.utime(input_file, (stat.st_atime, stat.st_mtime + 10))
+        proxy_process(f=1., i=input_file, l=[])
+        self.assertEqual(self.mem.stats()["hits"], 1)
+
+        # A rewrite keeping the mtime is a miss
+        stat = os.stat(input_file)
+        with open(input_file, "w") as open_file:
+            open_file.write("b")
+        os.utime(input_file, (stat.st_atime, stat.st_mtime))
+        proxy_process(f=1., i=input_file, l=[])
+        self.assertEqual(self.mem.stats()["misses"], 2)
+
+        # Digests of unchanged files are not computed again
+        digest_file = os.path.join(
+            self.mem.digest_cache.cachedir,
+            "{0}_{1}".format(os.stat(input_file).st_dev,
+                             os.stat(input_file).st_ino))
+        with open(digest_file) as open_file:
+            signature = json.load(open_file)
+        signature[-1] = "known"
+        with open(digest_file, "w") as open_file:
+            json.dump(signature, open_file)
+        self.assertEqual(self.mem.digest_cache.digest(input_file), "known")
+
+    def test_concurrent_calls(self):
+        """ Test that concurrent calls with the same parameters execute the
+        process once.
+        """
+        # Create the memory object
+        self.cachedir = os.path.join(self.workspace_dir, "cache")
+        self.mem = Memory(self.cachedir)
+        DummySlowProcess.executions = []
+        results = []
+
+        def call():
+            proxy_process = self.mem.cache(DummySlowProcess(), verbose=0)
+            proxy_process(f=3.)
+            results.append(proxy_process.res)
+
+        threads = [threading.Thread(target=call) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(DummySlowProcess.executions, [3.])
+        self.assertEqual(results, [6., 6., 6.])
+        self.assertEqual(self.mem.stats()["hits"], 2)
+
     def proxy_process(self):
         """ Test the proxy process behaviours.
         """
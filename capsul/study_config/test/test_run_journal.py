@@ -0,0 +1,123 @@
+##########################################################################
+# Capsul - Copyright (C) CEA, 2014
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import unittest
+import tempfile
+import shutil
+import os
+
+# Capsul import
+from capsul.study_config.study_config import StudyConfig
+from capsul.study_config.run_journal import ExecutionJournal
+from capsul.study_config.test.test_local_scheduler import (
+    TwoBranchesPipeline, executed, rendez_vous)
+
+
+class TestRunJournal(unittest.TestCase):
+    """ Resume interrupted executions.
+    """
+    def setUp(self):
+        rendez_vous.clear()
+        del executed[:]
+        self.output_directory = tempfile.mkdtemp()
+        self.journal_file = os.path.join(self.output_directory,
+                                         "journal.jsonl")
+        self.study_config = StudyConfig(
+            modules=[], local_workers=1,
+            output_directory=self.output_directory,
+            execution_journal_file=self.journal_file)
+        self.pipeline = self.study_config.get_process_instance(
+            TwoBranchesPipeline)
+        for name in ("a", "b"):
+            path = os.path.join(self.output_directory, name + ".txt")
+            open(path, "w").write("branch %s\n" % name)
+            setattr(self.pipeline, "input_" + name, path)
+            setattr(self.pipeline, "output_" + name,
+                    os.path.join(self.output_directory, "out_%s.txt" % name))
+        self.pipeline.middle_a = os.path.join(self.output_directory,
+                                              "middle_a.txt")
+
+    def tearDown(self):
+        shutil.rmtree(self.output_directory)
+
+    def check_resume(self):
+        """ Interrupt an execution on the end of a branch, then resume it.
+        """
+        nodes = self.pipeline.nodes
+        nodes["a2"].process.fail = True
+        self.assertRaises(RuntimeError, self.study_config.run,
+                          self.pipeline)
+        journal = ExecutionJournal(self.journal_file)
+        pending = journal.pending_nodes(
+            self.pipeline, self.pipeline.workflow_ordered_nodes())
+        self.assertFalse(nodes["a1"] in pending)
+        self.assertTrue(nodes["a2"] in pending)
+        del executed[:]
+        nodes["a2"].process.fail = False
+        self.study_config.run(self.pipeline)
+        self.assertEqual(len(executed), len(pending))
+        self.assertFalse(self.pipeline.input_a in executed)
+        self.assertEqual(open(self.pipeline.output_b).read(), "branch b\n")
+        # the complete execution removes the journal
+        self.assertFalse(os.path.exists(self.journal_file))
+        del executed[:]
+        self.study_config.run(self.pipeline)
+        self.assertEqual(len(executed), 4)
+
+    def test_sequential_resume(self):
+        """ Sequential executions are resumed.
+        """
+        self.check_resume()
+
+    def test_scheduler_resume(self):
+        """ Concurrent executions are resumed.
+        """
+        self.study_config.local_workers = 2
+        self.check_resume()
+
+    def test_changed_nodes(self):
+        """ Nodes whose parameters changed, or whose outputs are missing, are
+        executed again, with the nodes depending on them.
+        """
+        nodes = self.pipeline.nodes
+        nodes["a2"].process.fail = True
+        self.assertRaises(RuntimeError, self.study_config.run,
+                          self.pipeline)
+        execution_list = [nodes["a1"], nodes["b1"]]
+        journal = ExecutionJournal(self.journal_file)
+        self.assertEqual(journal.pending_nodes(self.pipeline, execution_list),
+                         [nodes["b1"]])
+        os.unlink(self.pipeline.middle_a)
+        self.assertEqual(journal.pending_nodes(self.pipeline, execution_list),
+                         execution_list)
+        open(self.pipeline.middle_a, "w").write("branch a\n")
+        self.pipeline.input_a = self.pipeline.input_b
+        self.assertEqual(journal.pending_nodes(self.pipeline, execution_list),
+                         execution_list)
+        execution_list = [nodes["b1"], nodes["b2"]]
+        open(self.pipeline.output_b, "w").write("branch b\n")
+        for node in execution_list:
+            journal.record(node, journal.signature(node.process))
+        self.assertEqual(journal.pending_nodes(self.pipeline, execution_list),
+                         [])
+        self.pipeline.input_b = self.pipeline.middle_a
+        self.assertEqual(journal.pending_nodes(self.pipeline, execution_list),
+                         execution_list)
+
+
+def test():
+    """ Function to execute unitest.
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestRunJournal)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
@@ -0,0 +1,128 @@
+##########################################################################
+# Capsul - Copyright (C) CEA, 2014
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import unittest
+import tempfile
+import shutil
+import os
+
+# Capsul import
+from capsul.study_config.study_config import StudyConfig
+from capsul.study_config.run_monitor import (RunMonitor, RunCancelled,
+                                             iter_run)
+from capsul.study_config.test.test_local_scheduler import (
+    TwoBranchesPipeline, executed, rendez_vous)
+
+
+class TestRunMonitor(unittest.TestCase):
+    """ Observe and cancel pipeline executions.
+    """
+    def setUp(self):
+        rendez_vous.clear()
+        del executed[:]
+        self.output_directory = tempfile.mkdtemp()
+        self.study_config = StudyConfig(
+            modules=[], local_workers=1,
+            output_directory=self.output_directory)
+        self.pipeline = self.study_config.get_process_instance(
+            TwoBranchesPipeline)
+        for name in ("a", "b"):
+            path = os.path.join(self.output_directory, name + ".txt")
+            open(path, "w").write("branch %s\n" % name)
+            setattr(self.pipeline, "input_" + name, path)
+            setattr(self.pipeline, "output_" + name,
+                    os.path.join(self.output_directory, "out_%s.txt" % name))
+        self.pipeline.middle_a = os.path.join(self.output_directory,
+                                              "middle_a.txt")
+
+    def tearDown(self):
+        shutil.rmtree(self.output_directory)
+
+    def check_events(self, events):
+        """ Each node is started then finished, with its output size.
+        """
+        kinds = [(event.kind, event.stage) for event in events]
+        self.assertEqual(kinds.count(("started", "execution")), 4)
+        self.assertEqual(kinds.count(("finished", "execution")), 4)
+        output_a = self.pipeline.nodes["a2"].process.id
+        finished = [event for event in events
+                    if event.kind == "finished" and event.name == output_a]
+        self.assertEqual(finished[0].info["bytes"], len("branch a\n"))
+        self.assertTrue(finished[0].info["duration"] >= 0)
+
+    def test_sequential_events(self):
+        """ Sequential runs send the events of each node.
+        """
+        monitor = RunMonitor()
+        events = []
+        monitor.add_callback(events.append)
+        self.study_config.run(self.pipeline, monitor=monitor)
+        self.check_events(events)
+
+    def test_scheduler_events(self):
+        """ Concurrent runs send the events of each node.
+        """
+        self.study_config.local_workers = 2
+        monitor = RunMonitor()
+        events = []
+        monitor.add_callback(events.append)
+        self.study_config.run(self.pipeline, monitor=monitor)
+        self.check_events(events)
+
+    def test_failure_event(self):
+        """ Failures are sent before being raised.
+        """
+        self.pipeline.fail_b = True
+        monitor = RunMonitor()
+        events = []
+        monitor.add_callback(events.append)
+        self.assertRaises(RuntimeError, self.study_config.run,
+                          self.pipeline, monitor=monitor)
+        failed = [event for event in events if event.kind == "failed"]
+        self.assertEqual(len(failed), 1)
+        self.assertEqual(failed[0].info["error"], "failure requested")
+
+    def test_cancel(self):
+        """ Cancelled runs stop before the next node, sequentially or
+        concurrently.
+        """
+        for workers in (1, 2):
+            del executed[:]
+            self.study_config.local_workers = workers
+            monitor = RunMonitor()
+            monitor.add_callback(
+                lambda event: event.kind == "finished" and monitor.cancel())
+            self.assertRaises(RunCancelled, self.study_config.run,
+                              self.pipeline, monitor=monitor)
+            self.assertTrue(0 < len(executed) < 4)
+
+    def test_iter_run(self):
+        """ Runs can be iterated over, leaving the iteration cancels them.
+        """
+        events = list(iter_run(self.study_config, self.pipeline))
+        self.check_events(events)
+        del executed[:]
+        for event in iter_run(self.study_config, self.pipeline):
+            break
+        self.assertTrue(len(executed) < 4)
+        monitor = RunMonitor()
+        monitor.close()
+        self.assertEqual(list(monitor.events()), [])
+
+
+def test():
+    """ Function to execute unitest.
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestRunMonitor)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
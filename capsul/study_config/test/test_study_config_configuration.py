@@ -31,9 +31,18 @@ tests_no_files = [
         'use_spm': False,
         'spm_standalone': False,
         'use_smart_caching': False,
+        'smart_caching_max_size': 0.0,
+        'smart_caching_max_age': 0.0,
+        'smart_caching_hardlinks': False,
+        'smart_caching_content_fingerprints': False,
         'use_soma_workflow': False,
         'create_output_directories': True,
         'process_output_directory': False,
+        'local_workers': 1,
+        'local_workers_mode': 'thread',
+        'critical_path_scheduling': False,
+        'incremental_run': False,
+        'incremental_checks': 'timestamps',
     },
     ['FSLConfig', 'MatlabConfig', 'SPMConfig', 'SmartCachingConfig',
         'SomaWorkflowConfig'],
@@ -50,9 +59,18 @@ tests_no_files = [
         'use_spm': False,
         'spm_standalone': False,
         'use_smart_caching': False,
+        'smart_caching_max_size': 0.0,
+        'smart_caching_max_age': 0.0,
+        'smart_caching_hardlinks': False,
+        'smart_caching_content_fingerprints': False,
         'use_soma_workflow': False,
         'create_output_directories': True,
         'process_output_directory': False,
+        'local_workers': 1,
+        'local_workers_mode': 'thread',
+        'critical_path_scheduling': False,
+        'incremental_run': False,
+        'incremental_checks': 'timestamps',
     },
     ['FSLConfig', 'MatlabConfig', 'SPMConfig', 'SmartCachingConfig',
         'SomaWorkflowConfig'],
@@ -69,9 +87,18 @@ tests_no_files = [
         'use_spm': False,
         'spm_standalone': False,
         'use_smart_caching': False,
+        'smart_caching_max_size': 0.0,
+        'smart_caching_max_age': 0.0,
+        'smart_caching_hardlinks': False,
+        'smart_caching_content_fingerprints': False,
         'use_soma_workflow': False,
         'create_output_directories': True,
         'process_output_directory': False,
+        'local_workers': 1,
+        'local_workers_mode': 'thread',
+        'critical_path_scheduling': False,
+        'incremental_run': False,
+        'incremental_checks': 'timestamps',
     },
     ['FSLConfig', 'MatlabConfig', 'SPMConfig', 'SmartCachingConfig',
         'SomaWorkflowConfig'],
@@ -93,6 +120,11 @@ tests_no_files = [
         'use_soma_workflow': False,
         'create_output_directories': True,
         'process_output_directory': False,
+        'local_workers': 1,
+        'local_workers_mode': 'thread',
+        'critical_path_scheduling': False,
+        'incremental_run': False,
+        'incremental_checks': 'timestamps',
     },
     ['SomaWorkflowConfig'], None, None]],
 
@@ -109,9 +141,18 @@ tests_no_files = [
         "shared_directory": soma.config.BRAINVISA_SHARE,
         'spm_standalone': False,
         'use_smart_caching': False,
+        'smart_caching_max_size': 0.0,
+        'smart_caching_max_age': 0.0,
+        'smart_caching_hardlinks': False,
+        'smart_caching_content_fingerprints': False,
         'use_soma_workflow': False,
         'create_output_directories': True,
         'process_output_directory': False,
+        'local_workers': 1,
+        'local_workers_mode': 'thread',
+        'critical_path_scheduling': False,
+        'incremental_run': False,
+        'incremental_checks': 'timestamps',
     },
     ['BrainVISAConfig', 'FSLConfig', 'FreeSurferConfig', 'MatlabConfig', 
      'SPMConfig', 'SmartCachingConfig', 'SomaWorkflowConfig'],
@@ -136,9 +177,18 @@ tests_standard_files = [
         'use_spm': False,
         'spm_standalone': False,
         'use_smart_caching': False,
+        'smart_caching_max_size': 0.0,
+        'smart_caching_max_age': 0.0,
+        'smart_caching_hardlinks': False,
+        'smart_caching_content_fingerprints': False,
         'use_soma_workflow': False,
         'create_output_directories': True,
         'process_output_directory': False,
+        'local_workers': 1,
+        'local_workers_mode': 'thread',
+        'critical_path_scheduling': False,
+        'incremental_run': False,
+        'incremental_checks': 'timestamps',
     },
     ['FSLConfig', 'MatlabConfig', 'SPMConfig', 'SmartCachingConfig',
         'SomaWorkflowConfig'],
@@ -164,6 +214,11 @@ tests_standard_files = [
         'attributes_schemas': {},
         'process_completion': 'builtin',
         'process_output_directory': False,
+        'local_workers': 1,
+        'local_workers_mode': 'thread',
+        'critical_path_scheduling': False,
+        'incremental_run': False,
+        'incremental_checks': 'timestamps',
     },
     ['AttributesConfig', 'BrainVISAConfig', 'FomConfig', 'MatlabConfig', 'SPMConfig', 'SomaWorkflowConfig'],
     'config.json',
@@ -179,9 +234,18 @@ tests_standard_files = [
         'use_spm': False,
         'spm_standalone': False,
         'use_smart_caching': False,
+        'smart_caching_max_size': 0.0,
+        'smart_caching_max_age': 0.0,
+        'smart_caching_hardlinks': False,
+        'smart_caching_content_fingerprints': False,
         'use_soma_workflow': False,
         'create_output_directories': True,
         'process_output_directory': False,
+        'local_workers': 1,
+        'local_workers_mode': 'thread',
+        'critical_path_scheduling': False,
+        'incremental_run': False,
+        'incremental_checks': 'timestamps',
     },
     ['FSLConfig', 'MatlabConfig', 'SPMConfig', 'SmartCachingConfig',
         'SomaWorkflowConfig'],
@@ -194,6 +258,11 @@ tests_standard_files = [
         "generate_logging": False,
         'create_output_directories': True,
         'process_output_directory': False,
+        'local_workers': 1,
+        'local_workers_mode': 'thread',
+        'critical_path_scheduling': False,
+        'incremental_run': False,
+        'incremental_checks': 'timestamps',
     },
     [],
     None,
@@ -207,6 +276,11 @@ tests_standard_files = [
         'use_soma_workflow': False,
         'create_output_directories': True,
         'process_output_directory': False,
+        'local_workers': 1,
+        'local_workers_mode': 'thread',
+        'critical_path_scheduling': False,
+        'incremental_run': False,
+        'incremental_checks': 'timestamps',
     },
     ['SomaWorkflowConfig'],
     'config.json',
@@ -227,9 +301,18 @@ tests_custom_files = [
         'use_spm': False,
         'spm_standalone': False,
         'use_smart_caching': False,
+        'smart_caching_max_size': 0.0,
+        'smart_caching_max_age': 0.0,
+        'smart_caching_hardlinks': False,
+        'smart_caching_content_fingerprints': False,
         'use_soma_workflow': False,
         'create_output_directories': True,
         'process_output_directory': False,
+        'local_workers': 1,
+        'local_workers_mode': 'thread',
+        'critical_path_scheduling': False,
+        'incremental_run': False,
+        'incremental_checks': 'timestamps',
     },
     ['FSLConfig', 'MatlabConfig', 'SPMConfig', 'SmartCachingConfig', 'SomaWorkflowConfig'],
     os.path.join('somewhere', 'config.json'),
@@ -254,6 +337,11 @@ tests_custom_files = [
         'attributes_schemas': {},
         'process_completion': 'builtin',
         'process_output_directory': False,
+        'local_workers': 1,
+        'local_workers_mode': 'thread',
+        'critical_path_scheduling': False,
+        'incremental_run': False,
+        'incremental_checks': 'timestamps',
     },
     ['AttributesConfig', 'BrainVISAConfig', 'FomConfig', 'MatlabConfig', 'SPMConfig', 'SomaWorkflowConfig'],
     os.path.join('somewhere', 'config.json'),
@@ -269,9 +357,18 @@ tests_custom_files = [
         'use_spm': False,
         'spm_standalone': False,
         'use_smart_caching': False,
+        'smart_caching_max_size': 0.0,
+        'smart_caching_max_age': 0.0,
+        'smart_caching_hardlinks': False,
+        'smart_caching_content_fingerprints': False,
         'use_soma_workflow': False,
         'create_output_directories': True,
         'process_output_directory': False,
+        'local_workers': 1,
+        'local_workers_mode': 'thread',
+        'critical_path_scheduling': False,
+        'incremental_run': False,
+        'incremental_checks': 'timestamps',
     },
     ['FSLConfig', 'MatlabConfig', 'SPMConfig', 'SmartCachingConfig', 'SomaWorkflowConfig'],
     os.path.join('somewhere', 'config.json'),
@@ -283,6 +380,11 @@ tests_custom_files = [
         "generate_logging": False,
         'create_output_directories': True,
         'process_output_directory': False,
+        'local_workers': 1,
+        'local_workers_mode': 'thread',
+        'critical_path_scheduling': False,
+        'incremental_run': False,
+        'incremental_checks': 'timestamps',
     },
     [],
     None,
@@ -296,6 +398,11 @@ tests_custom_files = [
         'use_soma_workflow': False,
         'create_output_directories': True,
         'process_output_directory': False,
+        'local_workers': 1,
+        'local_workers_mode': 'thread',
+        'critical_path_scheduling': False,
+        'incremental_run': False,
+        'incremental_checks': 'timestamps',
     },
     ['SomaWorkflowConfig'],
     os.path.join('somewhere', 'config.json'),
@@ -0,0 +1,68 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Submission of process jobs to a running worker pool.
+
+This module is used by the command lines of processes run through a worker
+pool (see :mod:`capsul.study_config.worker_pool`). It only depends on the
+standard library so that submitting a job does not pay the import of
+traits and capsul: the process classes are already imported in the pool
+workers.
+"""
+
+# System import
+from __future__ import print_function
+import sys
+import binascii
+from multiprocessing.connection import Client
+
+
+def authkey_file(address):
+    """ Get the file containing the authentication key of a worker pool
+    listening on a socket file.
+    """
+    return address + ".key"
+
+
+def read_authkey(address):
+    """ Read the authentication key of a worker pool.
+    """
+    with open(authkey_file(address)) as f:
+        return binascii.unhexlify(f.read().strip())
+
+
+def submit(address, module_name, class_name, parameters):
+    """ Run a process in a worker pool and wait for its completion.
+
+    Parameters
+    ----------
+    address: str (mandatory)
+        the socket file the worker pool listens on.
+    module_name: str (mandatory)
+        the module of the process class.
+    class_name: str (mandatory)
+        the process class name.
+    parameters: dict (mandatory)
+        the process parameters values.
+
+    Returns
+    -------
+    returncode: int
+        0 if the process has been run successfully, 1 otherwise (the error is
+        printed on the standard error).
+    """
+    connection = Client(address, authkey=read_authkey(address))
+    try:
+        connection.send((module_name, class_name, parameters))
+        status, result = connection.recv()
+    finally:
+        connection.close()
+    if status != "ok":
+        print(result, file=sys.stderr)
+        return 1
+    return 0
@@ -0,0 +1,365 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Persistent pool of worker interpreters running processes.
+
+Running a process through its command line (:meth:`Process.get_commandline`)
+starts a new interpreter which imports traits, capsul and the process module
+before running the process. A :class:`WorkerPool` keeps worker interpreters
+alive with the process classes already imported, and jobs are submitted to
+them by process class and parameters.
+
+The pool is used by the local scheduler in the 'worker' mode
+(StudyConfig.local_workers_mode). It can also be served on a socket file,
+which soma-workflow jobs reach through their command line when
+StudyConfig.worker_pool_address is set::
+
+    python -m capsul.study_config.worker_pool /tmp/capsul_workers -w 8 \\
+        -i my_toolbox.processes
+
+Only processes run by the default command line (processes whose class is
+instantiated and called with the parameters values) can be run in workers.
+"""
+
+# System import
+from __future__ import print_function
+import os
+import sys
+import stat
+import base64
+import logging
+import binascii
+import threading
+import traceback
+import importlib
+import multiprocessing
+from multiprocessing.connection import Listener
+from optparse import OptionParser
+import six
+from six.moves import cPickle as pickle
+
+# Trait import
+from traits.api import Undefined
+
+# Capsul import
+from capsul.process.process import Process
+from capsul.study_config.run import run_process
+from capsul.study_config.worker_client import authkey_file
+
+# Define the logger
+logger = logging.getLogger(__name__)
+
+# Parameters which are not sent to workers (see Process.get_commandline)
+_reserved_params = ("nodes_activation", "selection_changed")
+
+# Process classes imported in the current worker
+_process_classes = {}
+
+
+def _import_modules(modules):
+    """ Worker initializer: import process modules in advance.
+    """
+    for module_name in modules:
+        importlib.import_module(module_name)
+
+
+def _run_job(module_name, class_name, parameters, run_options=None):
+    """ Run a process in a worker.
+
+    Parameters
+    ----------
+    module_name, class_name: str (mandatory)
+        the process class.
+    parameters: dict (mandatory)
+        the process parameters values.
+    run_options: dict (optional)
+        if set, the process is run through run_process() with these
+        arguments ('output_directory', 'cachedir', 'generate_logging',
+        'verbose' and 'cache_options'), as in the current interpreter.
+
+    Returns
+    -------
+    result: tuple
+        ('ok', outputs) where outputs is the dict of the defined output
+        values of the process, or ('error', traceback string). Exceptions
+        are not raised since they may not be picklable.
+    """
+    try:
+        key = (module_name, class_name)
+        process_class = _process_classes.get(key)
+        if process_class is None:
+            module = importlib.import_module(module_name)
+            process_class = getattr(module, class_name)
+            _process_classes[key] = process_class
+        process = process_class()
+        if run_options:
+            run_options = dict(run_options)
+            output_directory = run_options.pop("output_directory", None)
+            run_options.update(parameters)
+            run_process(output_directory, process, **run_options)
+        else:
+            process(**parameters)
+        outputs = {}
+        for name, trait in six.iteritems(process.user_traits()):
+            value = getattr(process, name)
+            if trait.output and value is not Undefined:
+                outputs[name] = value
+        return "ok", outputs
+    except Exception:
+        return "error", traceback.format_exc()
+
+
+def runs_in_workers(process):
+    """ Check if a process can be run in a worker pool.
+
+    Processes overloading Process.get_commandline() are run by a specific
+    command line, which is not reproduced in workers.
+    """
+    return (six.get_unbound_function(process.__class__.get_commandline)
+            is six.get_unbound_function(Process.get_commandline))
+
+
+def job_parameters(process):
+    """ Get the parameters values sent to a worker to run a process.
+    """
+    parameters = {}
+    for name in process.user_traits():
+        value = getattr(process, name)
+        if name not in _reserved_params and value is not Undefined:
+            parameters[name] = value
+    return parameters
+
+
+def job_commandline(process, run_options=None, result_file=None):
+    """ Get a command line running a process job in a new interpreter.
+
+    Unlike Process.get_commandline(), the job runs through _run_job(), so
+    that run_options (smart-caching and logging, see _run_job()) are
+    applied. The job is pickled in the command line arguments. If
+    result_file is set, the output values are pickled in this file (cached
+    results may be restored in other files than the current output values).
+    """
+    job = (process.__class__.__module__, process.__class__.__name__,
+           job_parameters(process), run_options)
+    encoded_job = base64.b64encode(pickle.dumps(job, 2)).decode()
+    commandline = [
+        sys.executable, "-c",
+        "import sys; from capsul.study_config.worker_pool import "
+        "run_encoded_job; sys.exit(run_encoded_job(*sys.argv[1:]))",
+        encoded_job]
+    if result_file is not None:
+        commandline.append(result_file)
+    return commandline
+
+
+def run_encoded_job(encoded_job, result_file=None):
+    """ Run a job from job_commandline() and return an exit code.
+    """
+    job = pickle.loads(base64.b64decode(encoded_job))
+    status, result = _run_job(*job)
+    if status != "ok":
+        sys.stderr.write(result)
+        return 1
+    if result_file is not None:
+        with open(result_file, "wb") as f:
+            pickle.dump(result, f, 2)
+    return 0
+
+
+class WorkerPool(object):
+    """ Pool of persistent worker interpreters running processes.
+
+    Attributes
+    ----------
+    `workers`: int
+        the number of worker interpreters.
+    `address`: str
+        the socket file the pool is served on, None if it is not served.
+
+    Methods
+    -------
+    apply_async
+    run
+    serve
+    close
+    """
+
+    def __init__(self, workers=None, modules=()):
+        """ Start the worker interpreters.
+
+        Parameters
+        ----------
+        workers: int (optional)
+            the number of workers. None or a value lower than 1 means one
+            worker per CPU.
+        modules: list of str (optional)
+            modules (containing the process classes) imported by the workers
+            at startup.
+        """
+        if workers is None or workers < 1:
+            workers = multiprocessing.cpu_count()
+        self.workers = workers
+        self.address = None
+        self._listener = None
+        self._pool = multiprocessing.Pool(
+            workers, initializer=_import_modules, initargs=(list(modules), ))
+
+    def apply_async(self, module_name, class_name, parameters,
+                    callback=None, run_options=None):
+        """ Submit a job to the workers.
+
+        See _run_job() for the run_options.
+
+        Returns
+        -------
+        result: multiprocessing.pool.AsyncResult
+            result of _run_job(): ('ok', outputs) or ('error', traceback)
+        """
+        return self._pool.apply_async(
+            _run_job, (module_name, class_name, parameters, run_options),
+            callback=callback)
+
+    def run(self, process, run_options=None):
+        """ Run a process in a worker, and set its output values.
+
+        The process instance is not run itself: a new instance of its class
+        is created in the worker with the same parameters.
+
+        Parameters
+        ----------
+        process: Process (mandatory)
+            the process to run.
+        run_options: dict (optional)
+            run_process() options (output directory, smart-caching and
+            logging) applied in the worker, see _run_job().
+
+        Raises
+        ------
+        RuntimeError: if the process failed in the worker. The message
+            contains the worker traceback.
+        """
+        status, result = self.apply_async(
+            process.__class__.__module__, process.__class__.__name__,
+            job_parameters(process), run_options=run_options).get()
+        if status != "ok":
+            raise RuntimeError(
+                "Process '{0}' failed in worker:\n{1}".format(process.id,
+                                                              result))
+        for name, value in six.iteritems(result):
+            setattr(process, name, value)
+
+    def serve(self, address):
+        """ Accept jobs submitted through worker_client.submit() on a socket
+        file.
+
+        The authentication key of the connections is written in the
+        address + '.key' file, only readable by the current user. Jobs are
+        accepted in a background thread until close() is called.
+
+        Parameters
+        ----------
+        address: str (mandatory)
+            the socket file to listen on.
+        """
+        if self._listener is not None:
+            raise ValueError("Worker pool already served on '{0}'".format(
+                self.address))
+        authkey = os.urandom(32)
+        key_file = authkey_file(address)
+        fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                     stat.S_IRUSR | stat.S_IWUSR)
+        with os.fdopen(fd, "w") as f:
+            f.write(binascii.hexlify(authkey).decode())
+        self._listener = Listener(address, family="AF_UNIX",
+                                  authkey=authkey)
+        self.address = address
+        thread = threading.Thread(target=self._accept,
+                                  args=(self._listener, ))
+        thread.daemon = True
+        thread.start()
+        logger.info("Worker pool: serving on '{0}'".format(address))
+
+    def _accept(self, listener):
+        """ Accept client connections until the listener is closed.
+        """
+        while True:
+            try:
+                connection = listener.accept()
+            except Exception:
+                if self._listener is not listener:
+                    return
+                logger.warning("Worker pool: rejected connection:\n"
+                               + traceback.format_exc())
+                continue
+            thread = threading.Thread(target=self._serve_job,
+                                      args=(connection, ))
+            thread.daemon = True
+            thread.start()
+
+    def _serve_job(self, connection):
+        """ Run one client job and send back its result.
+        """
+        try:
+            module_name, class_name, parameters = connection.recv()
+            logger.debug("Worker pool: run {0}.{1}".format(module_name,
+                                                           class_name))
+            connection.send(self.apply_async(
+                module_name, class_name, parameters).get())
+        except Exception:
+            logger.warning("Worker pool: job failed:\n"
+                           + traceback.format_exc())
+        finally:
+            connection.close()
+
+    def close(self):
+        """ Stop serving, wait for running jobs and stop the workers.
+        """
+        listener = self._listener
+        if listener is not None:
+            self._listener = None
+            listener.close()
+            for path in (self.address, authkey_file(self.address)):
+                if os.path.exists(path):
+                    os.unlink(path)
+            self.address = None
+        self._pool.close()
+        self._pool.join()
+
+
+def main(argv=None):
+    """ Serve a worker pool until interrupted.
+    """
+    parser = OptionParser(
+        usage="python -m capsul.study_config.worker_pool [options] address",
+        description="Run persistent workers executing the capsul processes "
+                    "submitted on the 'address' socket file.")
+    parser.add_option("-w", "--workers", type="int", default=0,
+                      help="number of workers (default: one per CPU)")
+    parser.add_option("-i", "--import", dest="modules", action="append",
+                      default=[],
+                      help="module imported by the workers at startup "
+                           "(may be repeated)")
+    options, args = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error("expect a socket file address")
+    logging.basicConfig(level=logging.INFO)
+    pool = WorkerPool(options.workers, options.modules)
+    pool.serve(args[0])
+    try:
+        while True:
+            # a timeout keeps the main thread interruptible
+            threading.Event().wait(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,280 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Persistent cache of external tools discovery results.
+
+Discovering external tools (SPM location, FSL or FreeSurfer environments,
+interfaces versions) runs subprocesses, which is long compared to short
+jobs. Discovery results are stored in a json file shared by all the
+interpreters of the user, together with the values of the environment
+variables and the modification times of the files they depend on. A result
+is reused as long as these are unchanged::
+
+    from capsul.utils.discovery_cache import get_discovery_cache
+
+    cache = get_discovery_cache()
+    spm_dir = cache.cached(("spm_dir", matlab), lambda: find(matlab),
+                           environ=["PATH"], files=[matlab])
+
+The cache file is "~/.cache/capsul/discovery.json", or the file given by the
+CAPSUL_DISCOVERY_CACHE environment variable. If this variable is set to an
+empty string, results are only kept in memory. The cache can be cleared
+with :meth:`DiscoveryCache.invalidate`, or by removing the file.
+"""
+
+# System import
+import os
+import json
+import logging
+import tempfile
+import threading
+
+# Define the logger
+logger = logging.getLogger(__name__)
+
+# Default location of the cache file
+default_cache_file = os.path.join("~", ".cache", "capsul", "discovery.json")
+
+
+def find_executable(name):
+    """ Get the path of an executable, searched in the PATH if it is not a
+    path.
+
+    Returns
+    -------
+    path: str
+        the executable path, None if it is not found.
+    """
+    if os.path.dirname(name):
+        return name if os.path.exists(name) else None
+    for directory in os.environ.get("PATH", "").split(os.pathsep):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return None
+
+
+class DiscoveryCache(object):
+    """ Discovery results, validated by environment variables values and
+    files modification times.
+
+    Attributes
+    ----------
+    `cache_file`: str
+        the json file where results are stored, None to keep them in memory
+        only.
+
+    Methods
+    -------
+    cached
+    get
+    set
+    invalidate
+    """
+
+    def __init__(self, cache_file=None):
+        """ Initialize the DiscoveryCache class.
+
+        Parameters
+        ----------
+        cache_file: str (optional)
+            the json file where results are stored. Default: results are
+            only kept in memory.
+        """
+        if cache_file is not None:
+            cache_file = os.path.expanduser(cache_file)
+        self.cache_file = cache_file
+        self._entries = None
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _key(key):
+        """ Get the string form of a key (a json serializable value).
+        """
+        return json.dumps(key, sort_keys=True)
+
+    @staticmethod
+    def _stamps(environ, files):
+        """ Get the current values of environment variables and files
+        modification times.
+        """
+        files_mtime = {}
+        for path in files:
+            if path is None:
+                continue
+            try:
+                files_mtime[path] = os.stat(path).st_mtime
+            except OSError:
+                files_mtime[path] = None
+        return {"environ": dict((name, os.environ.get(name))
+                                for name in environ),
+                "files": files_mtime}
+
+    def _read(self):
+        """ Read the entries of the cache file.
+        """
+        if self.cache_file is None or not os.path.exists(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file) as f:
+                entries = json.load(f)
+        except (IOError, OSError, ValueError):
+            logger.warning("Ignoring invalid discovery cache '{0}'".format(
+                self.cache_file))
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def _write(self, entries):
+        """ Replace the cache file, without partially written files.
+        """
+        if self.cache_file is None:
+            return
+        directory = os.path.dirname(self.cache_file)
+        try:
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            fd, tmp_file = tempfile.mkstemp(dir=directory or ".",
+                                            prefix=".discovery")
+            with os.fdopen(fd, "w") as f:
+                json.dump(entries, f)
+            os.rename(tmp_file, self.cache_file)
+        except (IOError, OSError) as e:
+            logger.debug("Cannot write discovery cache '{0}': {1}".format(
+                self.cache_file, e))
+
+    def _load(self):
+        """ Get the entries, read from the cache file on first access.
+        """
+        if self._entries is None:
+            self._entries = self._read()
+        return self._entries
+
+    def get(self, key):
+        """ Get a valid discovery result.
+
+        Parameters
+        ----------
+        key: json serializable value (mandatory)
+            the identifier of the result.
+
+        Returns
+        -------
+        found: bool
+            True if a result is stored and its environment variables and
+            files are unchanged.
+        value: object
+            the stored result, None if not found.
+        """
+        with self._lock:
+            entry = self._load().get(self._key(key))
+        if entry is None:
+            return False, None
+        stamps = entry["stamps"]
+        if stamps != self._stamps(stamps["environ"], stamps["files"]):
+            return False, None
+        return True, entry["value"]
+
+    def set(self, key, value, environ=(), files=()):
+        """ Store a discovery result.
+
+        Parameters
+        ----------
+        key: json serializable value (mandatory)
+            the identifier of the result.
+        value: json serializable value (mandatory)
+            the result.
+        environ: list of str (optional)
+            the environment variables the result depends on.
+        files: list of str (optional)
+            the files (executables, configuration scripts) the result depends
+            on.
+        """
+        entry = {"value": value, "stamps": self._stamps(environ, files)}
+        with self._lock:
+            # other interpreters may have stored results meanwhile
+            entries = self._read()
+            entries.update(self._load())
+            entries[self._key(key)] = entry
+            self._entries = entries
+            self._write(entries)
+
+    def cached(self, key, compute, environ=(), files=(), keep=None):
+        """ Get a discovery result, computing and storing it if there is no
+        valid stored result.
+
+        Parameters
+        ----------
+        key: json serializable value (mandatory)
+            the identifier of the result.
+        compute: callable (mandatory)
+            function computing the result. Exceptions are not stored.
+        environ, files: list of str (optional)
+            see set().
+        keep: callable (optional)
+            function telling if a computed result is stored. Rejected
+            results (for instance "not found" results, which may change
+            without any change of the environment) are computed again on
+            the next call. Default: all results are stored.
+
+        Returns
+        -------
+        value: object
+            the result.
+        """
+        found, value = self.get(key)
+        if found:
+            logger.debug("Discovery cache: reuse {0}".format(key))
+            return value
+        value = compute()
+        if keep is None or keep(value):
+            self.set(key, value, environ, files)
+        return value
+
+    def invalidate(self, kind=None):
+        """ Remove stored results.
+
+        Parameters
+        ----------
+        kind: str (optional)
+            only remove the results whose key is a list or tuple starting
+            with this value. Default: remove all results.
+        """
+        with self._lock:
+            if kind is None:
+                entries = {}
+            else:
+                entries = self._read()
+                entries.update(self._load())
+                entries = dict(
+                    (key, entry) for key, entry in entries.items()
+                    if not (isinstance(json.loads(key), list) and
+                            json.loads(key)[:1] == [kind]))
+            self._entries = entries
+            self._write(entries)
+
+
+# Caches per file, the location may change with CAPSUL_DISCOVERY_CACHE
+_discovery_caches = {}
+
+
+def get_discovery_cache():
+    """ Get the discovery cache of the user.
+
+    Returns
+    -------
+    cache: DiscoveryCache
+        the cache using the CAPSUL_DISCOVERY_CACHE file if this environment
+        variable is set, ~/.cache/capsul/discovery.json otherwise.
+    """
+    cache_file = os.environ.get("CAPSUL_DISCOVERY_CACHE", default_cache_file)
+    cache_file = cache_file or None
+    cache = _discovery_caches.get(cache_file)
+    if cache is None:
+        cache = DiscoveryCache(cache_file)
+        _discovery_caches[cache_file] = cache
+    return cache
@@ -0,0 +1,181 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Existence checks of many files, batched by directory.
+
+Checking the parameters of a large pipeline calls os.path.exists() on tens of
+thousands of files, which is slow on network filesystems. A
+:class:`FileProbe` groups paths by directory, lists each directory once,
+concurrently, and answers existence queries from these listings::
+
+    probe = FileProbe()
+    probe.prefetch(paths)
+    existing = [path for path in paths if probe.exists(path)]
+
+Results are cached: a probe is meant to be used for one query, the files
+created or removed afterwards are not seen.
+
+Names are looked up as they are listed. On case-insensitive (or
+normalizing) filesystems, a path which differs from a listed name only by
+case or unicode normalization is checked with os.path.exists().
+"""
+
+# System import
+import os
+import errno
+import threading
+import unicodedata
+from multiprocessing.pool import ThreadPool
+import six
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+def _list_directory(directory):
+    """ List a directory.
+
+    Returns
+    -------
+    entries: dict or None
+        {name: is_symlink}, is_symlink being None if it is not known. None
+        if the directory cannot be listed.
+    """
+    try:
+        if scandir is not None:
+            return dict((entry.name, entry.is_symlink())
+                        for entry in scandir(directory))
+        return dict((name, None) for name in os.listdir(directory))
+    except OSError as e:
+        if e.errno in (errno.ENOENT, errno.ENOTDIR):
+            return {}
+        return None
+
+
+def _fold(name):
+    """ Get the case-insensitive, normalized form of a name.
+    """
+    if isinstance(name, six.text_type):
+        name = unicodedata.normalize("NFC", name)
+    return name.lower()
+
+
+class FileProbe(object):
+    """ Cached existence checks of files, listing each directory once.
+
+    Attributes
+    ----------
+    `workers`: int
+        the maximum number of directories listed at the same time.
+
+    Methods
+    -------
+    prefetch
+    exists
+    """
+
+    def __init__(self, workers=8):
+        """ Initialize the FileProbe class.
+
+        Parameters
+        ----------
+        workers: int (optional, default 8)
+            the maximum number of directories listed at the same time.
+        """
+        self.workers = max(workers, 1)
+        self._listings = {}
+        self._folded = {}
+        self._exists = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _split(path):
+        """ Get the directory and name of a path, None if the path does not
+        name a directory entry ('/', trailing separator).
+        """
+        directory, name = os.path.split(os.path.abspath(path))
+        if not name or path.endswith(os.sep):
+            return None
+        return directory, name
+
+    def prefetch(self, paths):
+        """ List the directories of paths which have not been listed yet.
+
+        Parameters
+        ----------
+        paths: iterable of str (mandatory)
+            the paths which will be checked. Values which are not strings are
+            ignored.
+        """
+        directories = set()
+        for path in paths:
+            if isinstance(path, six.string_types) and path:
+                split = self._split(path)
+                if split is not None and split[0] not in self._listings:
+                    directories.add(split[0])
+        directories = list(directories)
+        if len(directories) > 1 and self.workers > 1:
+            pool = ThreadPool(min(self.workers, len(directories)))
+            try:
+                listings = pool.map(_list_directory, directories)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            listings = [_list_directory(directory)
+                        for directory in directories]
+        with self._lock:
+            self._listings.update(zip(directories, listings))
+
+    def exists(self, path):
+        """ Check if a path exists, as os.path.exists().
+
+        Without scandir (python 2 without the scandir module), broken
+        symbolic links are reported as existing.
+        """
+        if not isinstance(path, six.string_types) or not path:
+            return False
+        exists = self._exists.get(path)
+        if exists is not None:
+            return exists
+        split = self._split(path)
+        if split is None:
+            exists = os.path.exists(path)
+        else:
+            directory, name = split
+            if directory not in self._listings:
+                self.prefetch([path])
+            listing = self._listings[directory]
+            if listing is None:
+                # the directory cannot be listed, but may be traversed
+                exists = os.path.exists(path)
+            elif name not in listing:
+                # the name may differ only by case from a listed one
+                exists = (_fold(name) in self._folded_names(directory)
+                          and os.path.exists(path))
+            elif listing[name]:
+                # symbolic link: check its target
+                exists = os.path.exists(path)
+            else:
+                exists = True
+        self._exists[path] = exists
+        return exists
+
+    def _folded_names(self, directory):
+        """ Get the folded names of a listed directory.
+        """
+        folded = self._folded.get(directory)
+        if folded is None:
+            folded = self._folded[directory] = set(
+                _fold(name) for name in self._listings[directory])
+        return folded
@@ -15,12 +15,7 @@ import re
 from glob import glob
 
 from capsul.process.process import Process
-
-try:
-    from nipype.interfaces.base import Interface
-# If nipype is not found create a dummy Interface class
-except ImportError:
-    Interface = type("Interface", (object, ), {})
+from capsul.utils.lazy_import import loaded_class
 
 process_xml_re = re.compile(r'<process.*</process>', re.DOTALL)
 pipeline_xml_re = re.compile(r'<pipeline.*</pipeline>', re.DOTALL)
@@ -40,6 +35,8 @@ def find_processes(module_name, ignore_import_error=True):
                 raise
             continue
         module = sys.modules[module_name]
+        # nipype is loaded if the module defines interfaces
+        Interface = loaded_class("nipype.interfaces.base", "Interface")
         for name in dir(module):
             item = getattr(module, name)
             if (isinstance(item, type) and
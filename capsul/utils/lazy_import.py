@@ -0,0 +1,46 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Access to optional modules without importing them.
+
+Optional integrations (nipype, numpy, soma-workflow) are long to import, and
+capsul only needs most of them to recognize their objects. Such objects can
+only exist once their module has been imported, so type checks can be done
+against the module if it is already loaded, and skipped otherwise.
+"""
+
+# System import
+import sys
+
+
+class NotLoaded(object):
+    """ Class of no object, standing for the classes of modules which are not
+    loaded.
+    """
+
+
+def loaded_class(module_name, class_name):
+    """ Get a class from a module if this module is already imported.
+
+    Parameters
+    ----------
+    module_name: str (mandatory)
+        the module defining the class (ex: 'nipype.interfaces.base').
+    class_name: str (mandatory)
+        the class name.
+
+    Returns
+    -------
+    cls: class
+        the class, or NotLoaded if the module is not imported: isinstance()
+        and issubclass() checks are then always False.
+    """
+    module = sys.modules.get(module_name)
+    if module is None:
+        return NotLoaded
+    return getattr(module, class_name, NotLoaded)
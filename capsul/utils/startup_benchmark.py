@@ -0,0 +1,122 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+""" Measure of the capsul startup time.
+
+Command line entry points and process jobs (see Process.get_commandline)
+start a new interpreter which imports capsul and creates a StudyConfig. This
+module measures these two steps in fresh interpreters and checks them
+against a time budget::
+
+    python -m capsul.utils.startup_benchmark -n 10
+
+The command exits with a non zero status if the budget is exceeded.
+"""
+
+# System import
+from __future__ import print_function
+import sys
+import json
+import subprocess
+from optparse import OptionParser
+
+# Startup time budget, in seconds
+STARTUP_BUDGET = {
+    "import": 0.5,
+    "study_config": 0.2,
+}
+
+# Optional integrations which should not be loaded at startup
+OPTIONAL_MODULES = ("nipype", "soma_workflow", "PyQt4", "PyQt5", "matplotlib")
+
+# Code run in the measured interpreters
+_startup_code = """
+import sys, json, time
+tic = time.time()
+import capsul.api
+toc = time.time()
+capsul.api.StudyConfig()
+end = time.time()
+print(json.dumps({"import": toc - tic, "study_config": end - toc,
+                  "modules": sorted(set(name.split(".")[0]
+                                        for name in sys.modules))}))
+"""
+
+
+def measure_startup(repeat=5, python=None):
+    """ Measure the capsul startup steps in new interpreters.
+
+    Parameters
+    ----------
+    repeat: int (optional, default 5)
+        the number of measured interpreters. The best time of each step is
+        kept.
+    python: str (optional)
+        the python interpreter. Default: the current one.
+
+    Returns
+    -------
+    timings: dict
+        the 'import' (import capsul.api) and 'study_config' (StudyConfig
+        construction) times in seconds, and the optional modules which have
+        been loaded ('optional_modules').
+    """
+    if python is None:
+        python = sys.executable
+    timings = {}
+    modules = set()
+    for i in range(max(repeat, 1)):
+        output = subprocess.check_output([python, "-c", _startup_code])
+        result = json.loads(output.decode().strip().split("\n")[-1])
+        for step in STARTUP_BUDGET:
+            timings[step] = min(timings.get(step, result[step]),
+                                result[step])
+        modules.update(result["modules"])
+    timings["optional_modules"] = sorted(modules.intersection(
+        OPTIONAL_MODULES))
+    return timings
+
+
+def main(argv=None):
+    """ Print the startup times and check them against the budget.
+    """
+    parser = OptionParser(
+        usage="python -m capsul.utils.startup_benchmark [options]",
+        description="Measure 'import capsul.api' and the construction of "
+                    "a default StudyConfig in new interpreters.")
+    parser.add_option("-n", "--repeat", type="int", default=5,
+                      help="number of measured interpreters (default 5)")
+    parser.add_option("--import-budget", type="float",
+                      default=STARTUP_BUDGET["import"],
+                      help="import time budget in seconds (default "
+                           "%default)")
+    parser.add_option("--study-config-budget", type="float",
+                      default=STARTUP_BUDGET["study_config"],
+                      help="StudyConfig construction time budget in seconds "
+                           "(default %default)")
+    options, args = parser.parse_args(argv)
+    budget = {"import": options.import_budget,
+              "study_config": options.study_config_budget}
+    timings = measure_startup(options.repeat)
+    exceeded = False
+    for step in ("import", "study_config"):
+        status = "ok"
+        if timings[step] > budget[step]:
+            status = "over budget"
+            exceeded = True
+        print("{0:<14} {1:.3f} s (budget {2:.3f} s) {3}".format(
+            step, timings[step], budget[step], status))
+    if timings["optional_modules"]:
+        print("optional modules loaded at startup: {0}".format(
+            ", ".join(timings["optional_modules"])))
+        exceeded = True
+    return int(exceeded)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+import unittest
+
+# Capsul import
+from capsul.utils.discovery_cache import DiscoveryCache, get_discovery_cache
+from capsul.study_config.config_utils import environment
+from capsul.utils.version_utils import nipype_interfaces_files
+from capsul.study_config.config_modules.spm_config import find_spm
+
+
+class TestDiscoveryCache(unittest.TestCase):
+    """ Discovery results are reused until their environment changes.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.tmp_dir, "cache", "discovery.json")
+        self.tool = os.path.join(self.tmp_dir, "tool")
+        open(self.tool, "w").write("")
+        self.calls = []
+        self.saved_environ = os.environ.get("CAPSUL_DISCOVERY_CACHE")
+        os.environ["CAPSUL_DISCOVERY_CACHE"] = self.cache_file
+
+    def tearDown(self):
+        if self.saved_environ is None:
+            del os.environ["CAPSUL_DISCOVERY_CACHE"]
+        else:
+            os.environ["CAPSUL_DISCOVERY_CACHE"] = self.saved_environ
+        os.environ.pop("CAPSUL_TEST_TOOL_DIR", None)
+        shutil.rmtree(self.tmp_dir)
+
+    def discover(self):
+        self.calls.append(1)
+        return {"version": len(self.calls)}
+
+    def cached(self, cache):
+        return cache.cached(("tool", self.tool), self.discover,
+                            environ=["CAPSUL_TEST_TOOL_DIR"],
+                            files=[self.tool])
+
+    def test_reuse(self):
+        """ Results are stored in the cache file and shared by caches.
+        """
+        self.assertEqual(self.cached(DiscoveryCache(self.cache_file)),
+                         {"version": 1})
+        self.assertEqual(self.cached(DiscoveryCache(self.cache_file)),
+                         {"version": 1})
+        self.assertEqual(len(self.calls), 1)
+        self.assertTrue(get_discovery_cache().get(("tool", self.tool))[0])
+        self.assertFalse(DiscoveryCache().get(("tool", self.tool))[0])
+
+    def test_invalidation(self):
+        """ Files modifications, environment changes and invalidate() make
+        results be computed again.
+        """
+        cache = DiscoveryCache(self.cache_file)
+        self.cached(cache)
+        mtime = os.stat(self.tool).st_mtime
+        os.utime(self.tool, (mtime + 10, mtime + 10))
+        self.assertEqual(self.cached(cache), {"version": 2})
+        os.environ["CAPSUL_TEST_TOOL_DIR"] = self.tmp_dir
+        self.assertEqual(self.cached(cache), {"version": 3})
+        self.assertEqual(self.cached(cache), {"version": 3})
+        cache.set(("other", ), 12)
+        cache.invalidate("tool")
+        self.assertEqual(cache.get(("other", )), (True, 12))
+        self.assertEqual(self.cached(DiscoveryCache(self.cache_file)),
+                         {"version": 4})
+        cache.invalidate()
+        self.assertEqual(cache.get(("other", )), (False, None))
+
+    def test_not_found(self):
+        """ Results rejected by the keep function, such as a SPM directory
+        which is not found, are not stored.
+        """
+        cache = DiscoveryCache(self.cache_file)
+        keep = lambda value: value["version"] > 1
+        self.assertEqual(cache.cached(("tool", ), self.discover, keep=keep),
+                         {"version": 1})
+        self.assertEqual(cache.cached(("tool", ), self.discover, keep=keep),
+                         {"version": 2})
+        self.assertEqual(cache.cached(("tool", ), self.discover, keep=keep),
+                         {"version": 2})
+        matlab = os.path.join(self.tmp_dir, "matlab")
+        with open(matlab, "w") as f:
+            f.write("#!/bin/sh\necho >> {0}.calls\n".format(matlab))
+        os.chmod(matlab, 0o755)
+        for i in range(2):
+            self.assertRaises(Exception, find_spm, matlab)
+        with open(matlab + ".calls") as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+    def test_environment(self):
+        """ Environments set by sh files are parsed again when the file
+        changes.
+        """
+        sh_file = os.path.join(self.tmp_dir, "setup.sh")
+        with open(sh_file, "w") as f:
+            f.write("export CAPSUL_TEST_VALUE=one\n")
+        # whole seconds are restored exactly
+        mtime = int(os.stat(sh_file).st_mtime)
+        os.utime(sh_file, (mtime, mtime))
+        self.assertEqual(environment(sh_file)["CAPSUL_TEST_VALUE"], "one")
+        with open(sh_file, "w") as f:
+            f.write("export CAPSUL_TEST_VALUE=two\n")
+        os.utime(sh_file, (mtime, mtime))
+        self.assertEqual(environment(sh_file)["CAPSUL_TEST_VALUE"], "one")
+        os.utime(sh_file, (mtime + 10, mtime + 10))
+        self.assertEqual(environment(sh_file)["CAPSUL_TEST_VALUE"], "two")
+
+    def test_nipype_interfaces_files(self):
+        """ Nipype interfaces versions depend on the tools executables and
+        version files.
+        """
+        fsl_version = os.path.join(self.tmp_dir, "etc", "fslversion")
+        os.mkdir(os.path.dirname(fsl_version))
+        open(fsl_version, "w").write("6.0.0\n")
+        matlab = os.path.join(self.tmp_dir, "matlab")
+        open(matlab, "w").write("")
+        os.chmod(matlab, 0o755)
+        saved_environ = dict(os.environ)
+        try:
+            os.environ["FSLDIR"] = self.tmp_dir
+            os.environ["PATH"] = self.tmp_dir
+            os.environ.pop("MATLABCMD", None)
+            os.environ["MATLABPATH"] = os.path.join(self.tmp_dir, "spm12")
+            files = nipype_interfaces_files()
+        finally:
+            os.environ.clear()
+            os.environ.update(saved_environ)
+        self.assertTrue(fsl_version in files)
+        self.assertTrue(matlab in files)
+        self.assertTrue(os.path.join(self.tmp_dir, "spm12", "Contents.m")
+                        in files)
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestDiscoveryCache)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
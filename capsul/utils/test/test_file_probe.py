@@ -0,0 +1,111 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import os
+import shutil
+import tempfile
+import unittest
+
+# Capsul import
+from capsul.utils import file_probe
+from capsul.utils.file_probe import FileProbe
+
+
+class TestFileProbe(unittest.TestCase):
+    """ Check files existence from directories listings.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="capsul_probe_")
+        self.paths = []
+        for subdir in ("a", "b"):
+            os.mkdir(os.path.join(self.directory, subdir))
+            for i in range(3):
+                path = os.path.join(self.directory, subdir, "f%d.txt" % i)
+                open(path, "w").close()
+                self.paths.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_exists(self):
+        """ Results match os.path.exists().
+        """
+        missing = [os.path.join(self.directory, "a", "missing.txt"),
+                   os.path.join(self.directory, "c", "f0.txt"),
+                   os.path.join(self.paths[0], "f0.txt"),
+                   ""]
+        directories = [os.path.join(self.directory, "a"),
+                       os.path.join(self.directory, "a") + os.sep,
+                       os.sep]
+        probe = FileProbe(workers=2)
+        probe.prefetch(self.paths + missing + directories + [None])
+        for path in self.paths + directories:
+            self.assertTrue(probe.exists(path))
+        for path in missing:
+            self.assertFalse(probe.exists(path))
+        self.assertFalse(probe.exists(None))
+        if hasattr(os, "symlink"):
+            link = os.path.join(self.directory, "b", "link.txt")
+            os.symlink(os.path.join(self.directory, "nothing.txt"), link)
+            self.assertEqual(FileProbe().exists(link),
+                             file_probe.scandir is None)
+
+    def test_case_insensitive(self):
+        """ Names differing from listed ones only by case are checked by
+        the filesystem.
+        """
+        path = os.path.join(self.directory, "a", "F0.TXT")
+        self.assertEqual(FileProbe().exists(path), os.path.exists(path))
+        # as on a case-insensitive filesystem
+        exists = os.path.exists
+        checked = []
+        os.path.exists = lambda path: checked.append(path) or True
+        try:
+            probe = FileProbe()
+            self.assertTrue(probe.exists(path))
+            self.assertFalse(probe.exists(
+                os.path.join(self.directory, "a", "missing.txt")))
+        finally:
+            os.path.exists = exists
+        self.assertEqual(checked, [path])
+
+    def test_listed_once(self):
+        """ Each directory is listed once, and results are cached.
+        """
+        listed = []
+        list_directory = file_probe._list_directory
+
+        def counting_list(directory):
+            listed.append(directory)
+            return list_directory(directory)
+
+        file_probe._list_directory = counting_list
+        try:
+            probe = FileProbe(workers=1)
+            for path in self.paths:
+                self.assertTrue(probe.exists(path))
+            os.unlink(self.paths[0])
+            self.assertTrue(probe.exists(self.paths[0]))
+        finally:
+            file_probe._list_directory = list_directory
+        self.assertEqual(sorted(listed),
+                         [os.path.join(self.directory, subdir)
+                          for subdir in ("a", "b")])
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestFileProbe)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
@@ -0,0 +1,51 @@
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+from __future__ import print_function
+import unittest
+
+# Capsul import
+from capsul.utils.lazy_import import loaded_class, NotLoaded
+from capsul.utils.startup_benchmark import measure_startup
+
+
+class TestStartup(unittest.TestCase):
+    """ Optional integrations are not loaded at startup.
+    """
+
+    def test_loaded_class(self):
+        """ Classes are only got from loaded modules.
+        """
+        self.assertTrue(loaded_class("unittest", "TestCase")
+                        is unittest.TestCase)
+        self.assertTrue(loaded_class("unittest", "NoSuchClass") is NotLoaded)
+        self.assertTrue(
+            loaded_class("capsul_no_such_module", "TestCase") is NotLoaded)
+        self.assertFalse(isinstance(self, NotLoaded))
+
+    def test_startup(self):
+        """ Import capsul.api and create a StudyConfig in a new interpreter
+        without optional modules.
+        """
+        timings = measure_startup(repeat=1)
+        self.assertEqual(timings["optional_modules"], [])
+        self.assertTrue(timings["import"] > 0)
+        self.assertTrue(timings["study_config"] > 0)
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestStartup)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
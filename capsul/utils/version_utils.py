@@ -7,11 +7,24 @@
 ##########################################################################
 
 # System import
+import os
 import logging
+import pkgutil
+
+# Capsul import
+from capsul.utils.discovery_cache import get_discovery_cache, find_executable
 
 # Define the logger
 logger = logging.getLogger(__name__)
 
+# Versions of the python modules, which cannot change once imported
+_tool_versions = {}
+
+# Environment variables used by nipype to locate the interfaces tools
+nipype_interfaces_environ = [
+    "PATH", "FSLDIR", "FREESURFER_HOME", "AFNI_HOME", "ANTSPATH",
+    "MATLABCMD", "SPMMCRCMD", "FORCE_SPMMCR", "MATLABPATH"]
+
 
 def get_tool_version(tool):
     """ Get the version of a python tool.
@@ -29,6 +42,9 @@ def get_tool_version(tool):
     version: str
         the tool version, None if no information found in the module.
     """
+    if tool in _tool_versions:
+        return _tool_versions[tool]
+
     # Initialize the version to None ie. not found
     version = None
 
@@ -42,6 +58,7 @@ def get_tool_version(tool):
     # Debug message
     logger.debug("Module '{0}' version is {1}".format(tool, version))
 
+    _tool_versions[tool] = version
     return version
 
 
@@ -51,12 +68,67 @@ def get_nipype_interfaces_versions():
     If nipype is not found, return None.
     If no interfaces are configured, returned an empty dictionary.
 
+    Getting the versions runs the interfaces tools: the result is stored in
+    the discovery cache (capsul.utils.discovery_cache) until nipype, the
+    tools environment variables, or the tools executables and version files
+    change (see nipype_interfaces_files()).
+
     Returns
     -------
     versions: dict
         a dictionary with interface names as keys and corresponding
         versions as values.
     """
+    loader = pkgutil.get_loader("nipype")
+    if loader is None:
+        return None
+    return get_discovery_cache().cached(
+        ("nipype_interfaces_versions", ), _nipype_interfaces_versions,
+        environ=nipype_interfaces_environ,
+        files=[loader.get_filename()] + nipype_interfaces_files())
+
+
+def nipype_interfaces_files():
+    """ Get the files the nipype interfaces versions are read from.
+
+    These are the version files of FSL and FreeSurfer, the AFNI and ANTS
+    executables, the MATLAB (or SPM runtime) executable and the SPM
+    'Contents.m' files of the MATLABPATH directories, so that upgrading a
+    tool in place changes their modification times. Other tools are only
+    tracked through the PATH.
+
+    Returns
+    -------
+    files: list of str
+        the files paths, None for executables which are not found.
+    """
+    files = []
+    for variable, version_file in (
+            ("FSLDIR", os.path.join("etc", "fslversion")),
+            ("FREESURFER_HOME", "build-stamp.txt")):
+        directory = os.environ.get(variable)
+        if directory:
+            files.append(os.path.join(directory, version_file))
+    files.append(find_executable("afni"))
+    ants_path = os.environ.get("ANTSPATH")
+    files.append(find_executable(
+        os.path.join(ants_path, "antsRegistration") if ants_path
+        else "antsRegistration"))
+    for variable, default in (("MATLABCMD", "matlab"),
+                              ("SPMMCRCMD", None)):
+        command = os.environ.get(variable, default)
+        if command and command.split():
+            files.append(find_executable(command.split()[0]))
+    for directory in os.environ.get("MATLABPATH", "").split(os.pathsep):
+        if directory:
+            files.append(os.path.join(directory, "Contents.m"))
+    return files
+
+
+def _nipype_interfaces_versions():
+    """ Get the versions of the nipype interfaces, see
+    get_nipype_interfaces_versions().
+    """
     # Initialize the versions to an empty dict
     versions = {}
 